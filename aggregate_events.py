@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+"""
+Extract scalars from all TensorFlow event files in a directory tree and write
+them to a single compact .npz file, optionally with smoothing and aggregation
+across runs (e.g. across seeds).
+
+Event files are streamed in parallel, one per process, and only the requested
+tags are kept, so memory usage is bounded by the size of the extracted data
+rather than by the size of the event files.
+
+Example:
+  python3 aggregate_events.py runs scalars.npz \\
+      --tags rl/episode_reward_sum misc/steps_per_second \\
+      --smoothing 0.9 --group_regex '_seed\\d+'
+
+The output file is columnar. For each tag there are flat arrays
+  <tag>/run_index, <tag>/step, <tag>/wall_time, <tag>/value, <tag>/smoothed
+with one entry per logged value; 'runs' maps run_index to the run's
+directory. If --group_regex is given, there are also
+  agg/<tag>/groups, agg/<tag>/x, agg/<tag>/mean, agg/<tag>/std,
+  agg/<tag>/min, agg/<tag>/max, agg/<tag>/n_runs
+with one row per group, interpolated onto a common grid of x values.
+"""
+
+import argparse
+import os
+import os.path as osp
+import re
+from collections import defaultdict
+from functools import partial
+from multiprocessing import Pool
+
+import numpy as np
+
+DEFAULT_TAGS = ['rl/episode_reward_sum', 'misc/steps_per_second']
+
+
+def find_event_files(root_dir):
+    event_files = []
+    for dirpath, _, filenames in os.walk(root_dir):
+        for filename in filenames:
+            if 'events.out.tfevents' in filename:
+                event_files.append(osp.join(dirpath, filename))
+    return sorted(event_files)
+
+
+def read_event_file(path, tags):
+    """
+    Stream through one event file, returning
+    {tag: (steps, wall_times, values)} for the tags we're interested in.
+    """
+    # Imported here so that listing/--help doesn't have to wait for
+    # TensorFlow, and so that each worker process imports it only once
+    import tensorflow as tf
+
+    tags = set(tags)
+    data = defaultdict(lambda: ([], [], []))
+    try:
+        for event in tf.train.summary_iterator(path):
+            for value in event.summary.value:
+                if value.tag not in tags:
+                    continue
+                steps, wall_times, values = data[value.tag]
+                steps.append(event.step)
+                wall_times.append(event.wall_time)
+                values.append(value.simple_value)
+    except tf.errors.DataLossError:
+        # The file was probably still being written to
+        print("Warning: truncated event file '{}'".format(path))
+
+    series = {}
+    for tag, (steps, wall_times, values) in data.items():
+        series[tag] = (np.array(steps, dtype=np.int64),
+                       np.array(wall_times, dtype=np.float64),
+                       np.array(values, dtype=np.float32))
+    return path, series
+
+
+def smooth(values, weight):
+    """
+    Exponential moving average, debiased in the same way as TensorBoard's
+    smoothing slider so that early values aren't dragged towards zero.
+    """
+    smoothed = np.zeros(len(values), dtype=np.float32)
+    ema = 0.0
+    for i, v in enumerate(values):
+        ema = weight * ema + (1 - weight) * v
+        debias = 1 - weight ** (i + 1)
+        smoothed[i] = ema / debias
+    return smoothed
+
+
+def merge_series(series_list):
+    """
+    Merge (steps, wall_times, values) triples from several event files of the
+    same run (e.g. after a restart), sorted by wall time.
+    """
+    steps = np.concatenate([s[0] for s in series_list])
+    wall_times = np.concatenate([s[1] for s in series_list])
+    values = np.concatenate([s[2] for s in series_list])
+    order = np.argsort(wall_times, kind='stable')
+    return steps[order], wall_times[order], values[order]
+
+
+def make_increasing(xs, ys):
+    """
+    Sort a curve by x and drop repeated xs (e.g. steps logged again after a
+    run restarts from a checkpoint), keeping the most recent value for each,
+    so that the curve can be interpolated. Points are assumed to be in the
+    order they were logged (see merge_series).
+    """
+    # Stable, so points with the same x stay in the order they were logged
+    order = np.argsort(xs, kind='stable')
+    xs, ys = xs[order], ys[order]
+    keep_last = np.append(xs[1:] != xs[:-1], True)
+    return xs[keep_last], ys[keep_last]
+
+
+def aggregate(xs_list, ys_list, n_points):
+    """
+    Interpolate each run's curve onto a common grid over the range of x
+    covered by all runs, then compute statistics across runs.
+    """
+    x_min = max(xs[0] for xs in xs_list)
+    x_max = min(xs[-1] for xs in xs_list)
+    if x_max < x_min:
+        # Runs don't overlap; fall back to the union of ranges, with
+        # runs only contributing where they have data
+        x_min = min(xs[0] for xs in xs_list)
+        x_max = max(xs[-1] for xs in xs_list)
+    grid = np.linspace(x_min, x_max, n_points)
+    interpolated = np.full((len(xs_list), n_points), np.nan)
+    for i, (xs, ys) in enumerate(zip(xs_list, ys_list)):
+        inside = (grid >= xs[0]) & (grid <= xs[-1])
+        interpolated[i, inside] = np.interp(grid[inside], xs, ys)
+    with np.errstate(invalid='ignore'):
+        stats = {
+            'mean': np.nanmean(interpolated, axis=0),
+            'std': np.nanstd(interpolated, axis=0),
+            'min': np.nanmin(interpolated, axis=0),
+            'max': np.nanmax(interpolated, axis=0),
+            'n_runs': np.sum(~np.isnan(interpolated), axis=0),
+        }
+    return grid, stats
+
+
+def get_group(run, group_regex):
+    return re.sub(group_regex, '', run)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('root_dir')
+    parser.add_argument('out_file')
+    parser.add_argument('--tags', nargs='+', default=DEFAULT_TAGS)
+    parser.add_argument('--n_parallel', type=int, default=8)
+    parser.add_argument('--smoothing', type=float, default=0.0,
+                        help="Exponential moving average weight, as in "
+                             "TensorBoard's smoothing slider")
+    parser.add_argument('--group_regex',
+                        help="Aggregate over runs whose directories are the "
+                             "same once this regex is removed "
+                             "(e.g. '_seed\\d+')")
+    parser.add_argument('--x_axis', choices=['step', 'relative_time'],
+                        default='step')
+    parser.add_argument('--n_points', type=int, default=500,
+                        help="Number of grid points for aggregated curves")
+    args = parser.parse_args()
+
+    event_files = find_event_files(args.root_dir)
+    print("Found {} event files".format(len(event_files)))
+
+    # run -> tag -> list of (steps, wall_times, values), one per event file
+    runs_data = defaultdict(lambda: defaultdict(list))
+    read_fn = partial(read_event_file, tags=args.tags)
+    with Pool(processes=args.n_parallel) as pool:
+        for path, series in pool.imap_unordered(read_fn, event_files):
+            run = osp.relpath(osp.dirname(path), args.root_dir)
+            for tag, s in series.items():
+                runs_data[run][tag].append(s)
+    runs = sorted(runs_data.keys())
+
+    out = {'runs': np.array(runs)}
+    for tag in args.tags:
+        columns = defaultdict(list)
+        curves = defaultdict(list)
+        for run_n, run in enumerate(runs):
+            if tag not in runs_data[run]:
+                continue
+            steps, wall_times, values = merge_series(runs_data[run][tag])
+            smoothed = smooth(values, args.smoothing)
+            columns['run_index'].append(np.full(len(steps), run_n))
+            columns['step'].append(steps)
+            columns['wall_time'].append(wall_times)
+            columns['value'].append(values)
+            columns['smoothed'].append(smoothed)
+
+            if args.x_axis == 'step':
+                xs = steps.astype(np.float64)
+            else:
+                xs = wall_times - wall_times[0]
+            if args.group_regex:
+                group = get_group(run, args.group_regex)
+                curves[group].append(make_increasing(xs, smoothed))
+
+        if not columns:
+            print("Warning: no data found for tag '{}'".format(tag))
+            continue
+        for name, arrays in columns.items():
+            out['{}/{}'.format(tag, name)] = np.concatenate(arrays)
+
+        if args.group_regex:
+            groups = sorted(curves.keys())
+            grids = []
+            stats = defaultdict(list)
+            for group in groups:
+                xs_list, ys_list = zip(*curves[group])
+                grid, group_stats = aggregate(xs_list, ys_list, args.n_points)
+                grids.append(grid)
+                for name, stat in group_stats.items():
+                    stats[name].append(stat)
+            out['agg/{}/groups'.format(tag)] = np.array(groups)
+            out['agg/{}/x'.format(tag)] = np.array(grids)
+            for name, stat in stats.items():
+                out['agg/{}/{}'.format(tag, name)] = np.array(stat)
+
+    np.savez_compressed(args.out_file, **out)
+    print("Wrote {} runs to '{}'".format(len(runs), args.out_file))
+
+
+if __name__ == '__main__':
+    main()
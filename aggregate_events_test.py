@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import unittest
+
+import numpy as np
+
+from aggregate_events import smooth, aggregate, merge_series, get_group, \
+    make_increasing
+
+
+class TestAggregateEvents(unittest.TestCase):
+
+    def test_smooth(self):
+        # With no smoothing, we should get back what we put in
+        values = np.array([1., 5., 2., 8.])
+        np.testing.assert_allclose(smooth(values, 0.0), values)
+
+        # Debiasing means a constant signal stays constant
+        values = np.full(10, 3.0)
+        np.testing.assert_allclose(smooth(values, 0.9), values, rtol=1e-6)
+
+        # Check one step by hand
+        values = np.array([1., 2.])
+        w = 0.5
+        ema = (1 - w) * 1.
+        ema = w * ema + (1 - w) * 2.
+        expected = ema / (1 - w ** 2)
+        self.assertAlmostEqual(smooth(values, w)[1], expected, places=5)
+
+    def test_merge_series(self):
+        s1 = (np.array([0, 1]), np.array([10., 11.]), np.array([1., 2.]))
+        s2 = (np.array([0, 1]), np.array([5., 6.]), np.array([3., 4.]))
+        steps, wall_times, values = merge_series([s1, s2])
+        np.testing.assert_array_equal(wall_times, [5., 6., 10., 11.])
+        np.testing.assert_array_equal(values, [3., 4., 1., 2.])
+
+    def test_make_increasing(self):
+        # A run restarted from a checkpoint at step 20 logs steps 20 and 30
+        # again; the later values should win
+        xs = np.array([10, 20, 30, 20, 30, 40])
+        ys = np.array([1., 2., 3., 4., 5., 6.])
+        xs, ys = make_increasing(xs, ys)
+        np.testing.assert_array_equal(xs, [10, 20, 30, 40])
+        np.testing.assert_array_equal(ys, [1., 4., 5., 6.])
+
+    def test_aggregate(self):
+        xs1 = np.array([0., 10.])
+        ys1 = np.array([0., 10.])
+        xs2 = np.array([0., 5., 20.])
+        ys2 = np.array([2., 7., 22.])
+        grid, stats = aggregate([xs1, xs2], [ys1, ys2], n_points=11)
+        # Grid should only cover the range both runs have data for
+        np.testing.assert_allclose(grid, np.arange(11))
+        np.testing.assert_allclose(stats['mean'], np.arange(11) + 1)
+        np.testing.assert_allclose(stats['std'], np.ones(11))
+        np.testing.assert_array_equal(stats['n_runs'], np.full(11, 2))
+
+    def test_get_group(self):
+        self.assertEqual(get_group('pong_seed0_abc123', '_seed\\d+'),
+                         'pong_abc123')
+        self.assertEqual(get_group('pong_seed12_abc123', '_seed\\d+'),
+                         'pong_abc123')
+
+
+if __name__ == '__main__':
+    unittest.main()
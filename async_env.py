@@ -0,0 +1,181 @@
+"""
+Drive many envs from a single thread using asyncio.
+
+Rather than giving each env its own worker thread (which blocks while its
+env steps), a single event loop waits on all the envs' pipes at once. Each
+env gets a coroutine collecting rollouts; whenever one needs an action it
+queues its observation, and observations are evaluated together in one
+batched session call once enough are waiting.
+
+All envs share one worker network, so rollouts collected since the last
+sync may lag the global parameters by a few updates (as with
+--prefetch_rollouts).
+"""
+
+import asyncio
+
+import numpy as np
+
+from network import to_network_layout
+from params import DISCOUNT_FACTOR
+from utils import rewards_to_discounted_returns
+
+
+class AsyncEnv:
+    """
+    Asyncio client for a SubProcessEnv. reset() and step() return futures
+    which complete when the env process replies, without blocking the
+    event loop.
+    """
+
+    def __init__(self, env, loop):
+        self.env = env
+        self.loop = loop
+        self.action_space = env.action_space
+        self.reply = None
+        loop.add_reader(env.pipe.fileno(), self.on_reply)
+
+    def on_reply(self):
+        # We only ever have one request in flight
+        reply, self.reply = self.reply, None
+        reply.set_result(self.env.pipe.recv())
+
+    def request(self, cmd, data):
+        self.reply = self.loop.create_future()
+        self.env.pipe.send((cmd, data))
+        return self.reply
+
+    def reset(self):
+        return self.request('reset', None)
+
+    def step(self, action):
+        return self.request('step', action)
+
+    def close(self):
+        self.loop.remove_reader(self.env.pipe.fileno())
+
+
+class AsyncEnvDriver:
+    """
+    Collect rollouts from all envs in a single thread, training worker's
+    network on each as it comes in.
+
+    Observations are evaluated once batch_size are waiting, or
+    batch_timeout_seconds after the first one if fewer turn up (e.g. because
+    some envs are resetting).
+    """
+
+    def __init__(self, worker, envs, batch_size=None,
+                 batch_timeout_seconds=0.002):
+        self.worker = worker
+        self.network = worker.network
+        self.sess = worker.sess
+        self.envs = envs
+        if batch_size is None:
+            batch_size = len(envs)
+        self.batch_size = batch_size
+        self.batch_timeout_seconds = batch_timeout_seconds
+        self.loop = None
+        self.pending = []
+        self.flush_handle = None
+        self.stopped = False
+
+    def run(self, n_steps_to_run, steps_per_update, step_counter,
+            update_counter, stop_event=None):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(
+                self.run_envs(n_steps_to_run, steps_per_update, step_counter,
+                              update_counter, stop_event))
+        finally:
+            self.loop.close()
+
+    async def run_envs(self, n_steps_to_run, steps_per_update, step_counter,
+                       update_counter, stop_event):
+        self.stopped = int(step_counter) >= n_steps_to_run
+
+        def train(rollout):
+            self.worker.train_on_rollout(rollout)
+            self.worker.sync()
+            step_counter.increment(len(rollout['states']))
+            update_counter.increment(1)
+            if int(step_counter) >= n_steps_to_run or \
+                    (stop_event is not None and stop_event.is_set()):
+                self.stopped = True
+
+        self.worker.sync()
+        envs = [AsyncEnv(env, self.loop) for env in self.envs]
+        try:
+            await asyncio.gather(*[self.run_env(env, steps_per_update, train)
+                                   for env in envs])
+        finally:
+            for env in envs:
+                env.close()
+
+    async def run_env(self, env, steps_per_update, train):
+        state = await env.reset()
+        episode_values = []
+        while not self.stopped:
+            states = []
+            actions = []
+            rewards = []
+            for _ in range(steps_per_update):
+                s = to_network_layout(state, self.network.data_format)
+                states.append(s)
+                action_probs, value_estimate = await self.evaluate(s)
+                a = np.random.choice(env.action_space.n, p=action_probs)
+                actions.append(a)
+                episode_values.append(value_estimate)
+                state, r, done, _ = await env.step(a)
+                rewards.append(r)
+                if done:
+                    break
+
+            if done:
+                returns = rewards_to_discounted_returns(rewards,
+                                                        DISCOUNT_FACTOR)
+                if self.worker.logger:
+                    self.worker.logger.logkv('rl/episode_value_mean',
+                                             np.mean(episode_values))
+                episode_values = []
+                # Start the reset now so that it overlaps with training
+                reset = env.reset()
+            else:
+                s = to_network_layout(state, self.network.data_format)
+                _, last_value = await self.evaluate(s)
+                returns = rewards_to_discounted_returns(rewards + [last_value],
+                                                        DISCOUNT_FACTOR)
+                returns = returns[:-1]
+
+            train({'states': np.array(states, dtype=np.float32),
+                   'actions': np.array(actions),
+                   'returns': np.array(returns, dtype=np.float32)})
+
+            if done:
+                state = await reset
+
+    def evaluate(self, state):
+        """
+        Queue state for evaluation. Returns a future for the action
+        probabilities and value estimate.
+        """
+        future = self.loop.create_future()
+        self.pending.append((state, future))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = self.loop.call_later(
+                self.batch_timeout_seconds, self.flush)
+        return future
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        pending, self.pending = self.pending, []
+        states = [state for state, _ in pending]
+        probs, values = self.sess.run(
+            [self.network.a_softmax, self.network.graph_v],
+            feed_dict={self.network.s: states})
+        for (_, future), p, v in zip(pending, probs, values):
+            future.set_result((p, v))
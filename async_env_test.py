@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from async_env import AsyncEnv, AsyncEnvDriver
+from network import Network, make_inference_network
+from utils import GraphCounter, SubProcessEnv
+from worker import Worker
+from worker_test import DummyEnv
+
+
+class CountingEnv:
+    """
+    Observations count steps since the last reset.
+    """
+    observation_space = None
+    action_space = None
+
+    def __init__(self):
+        self.n = None
+
+    def reset(self):
+        self.n = 0
+        return self.n
+
+    def step(self, action):
+        self.n += action
+        return self.n, 0, False, {}
+
+
+class TestAsyncEnv(unittest.TestCase):
+
+    def test_step_reset(self):
+        loop = asyncio.new_event_loop()
+        envs = [SubProcessEnv(CountingEnv) for _ in range(3)]
+        async_envs = [AsyncEnv(env, loop) for env in envs]
+
+        async def run(env, action):
+            obs = [await env.reset()]
+            for _ in range(3):
+                o, _, _, _ = await env.step(action)
+                obs.append(o)
+            return obs
+
+        async def run_all():
+            return await asyncio.gather(
+                *[run(env, action)
+                  for action, env in enumerate(async_envs, start=1)])
+
+        results = loop.run_until_complete(run_all())
+        self.assertEqual(results, [[0, 1, 2, 3],
+                                   [0, 2, 4, 6],
+                                   [0, 3, 6, 9]])
+
+        for env in async_envs:
+            env.close()
+        loop.close()
+        for env in envs:
+            env.close()
+
+
+class TestAsyncEnvDriver(unittest.TestCase):
+
+    def test_driver(self):
+        tf.reset_default_graph()
+        sess = tf.Session()
+        optimizer = tf.train.RMSPropOptimizer(learning_rate=1e-3)
+        with tf.variable_scope('global'):
+            make_inference_network(n_actions=6, weight_inits='glorot')
+        network = Network(scope='worker_0',
+                          n_actions=6,
+                          entropy_bonus=0.01,
+                          value_loss_coef=0.5,
+                          weight_inits='glorot',
+                          max_grad_norm=0.5,
+                          optimizer=optimizer,
+                          summaries=False)
+        worker = Worker(sess=sess, env=None, network=network, log_dir='/tmp')
+        step_counter = GraphCounter(sess)
+        update_counter = GraphCounter(sess)
+        sess.run(tf.global_variables_initializer())
+
+        envs = [SubProcessEnv(DummyEnv) for _ in range(4)]
+        driver = AsyncEnvDriver(worker, envs, batch_size=4)
+        batch_sizes = []
+        flush = driver.flush
+
+        def record_flush():
+            batch_sizes.append(len(driver.pending))
+            flush()
+        driver.flush = record_flush
+
+        global_vars = tf.trainable_variables('global')
+        vars_before = sess.run(global_vars)
+        driver.run(n_steps_to_run=50, steps_per_update=5,
+                   step_counter=step_counter, update_counter=update_counter)
+        vars_after = sess.run(global_vars)
+
+        self.assertGreaterEqual(int(step_counter), 50)
+        self.assertGreater(int(update_counter), 0)
+        self.assertGreater(max(batch_sizes), 1)
+        for before, after in zip(vars_before, vars_after):
+            self.assertFalse(np.array_equal(before, after))
+
+        for env in envs:
+            env.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
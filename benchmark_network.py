@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the network's forward pass (as used for acting), training step
+and sync with the global parameters with different conv data formats, and
+optionally with and without XLA or with flat parameters, to see which is
+fastest on this machine.
+
+e.g.:
+  python3 benchmark_network.py --data_format channels_last channels_first
+  python3 benchmark_network.py --data_format channels_last --xla
+  python3 benchmark_network.py --optimizer rmsprop flat_rmsprop
+"""
+
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from network import Network, make_inference_network, choose_data_format, \
+    to_network_layout, flat_params_getter
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_format', nargs='+',
+                        choices=['auto', 'channels_last', 'channels_first'],
+                        default=['channels_last', 'channels_first'])
+    parser.add_argument('--n_actions', type=int, default=6)
+    parser.add_argument('--batch_size', type=int, default=5,
+                        help="Batch size for training steps "
+                             "(i.e. steps per update)")
+    parser.add_argument('--n_iterations', type=int, default=500)
+    parser.add_argument('--xla', action='store_true',
+                        help="Benchmark each data format both with and "
+                             "without XLA")
+    parser.add_argument('--optimizer', nargs='+',
+                        choices=['rmsprop', 'flat_rmsprop'],
+                        default=['rmsprop'])
+    args = parser.parse_args()
+
+    if args.xla:
+        xla_options = [False, True]
+    else:
+        xla_options = [False]
+    for data_format in args.data_format:
+        data_format = choose_data_format(data_format)
+        for xla in xla_options:
+            for optimizer in args.optimizer:
+                name = "{}, {}".format(data_format, optimizer)
+                if xla:
+                    name += " (XLA)"
+                flat_params = (optimizer == 'flat_rmsprop')
+                try:
+                    times = benchmark(data_format, args.n_actions,
+                                      args.batch_size, args.n_iterations,
+                                      xla, flat_params)
+                except tf.errors.OpError as e:
+                    # e.g. channels_first convolutions not supported on
+                    # this CPU
+                    print("{}: failed ({})".format(name, e.message))
+                    continue
+                act_time, train_time, sync_time = times
+                print("{}: act {:.3f} ms, train {:.3f} ms, "
+                      "sync {:.3f} ms".format(name, act_time * 1e3,
+                                              train_time * 1e3,
+                                              sync_time * 1e3))
+
+
+def benchmark(data_format, n_actions, batch_size, n_iterations, xla=False,
+              flat_params=False):
+    tf.reset_default_graph()
+    if flat_params:
+        custom_getter = flat_params_getter('global', n_actions, 'ortho',
+                                           data_format)
+    else:
+        custom_getter = None
+    with tf.variable_scope('global', custom_getter=custom_getter):
+        make_inference_network(n_actions=n_actions, weight_inits='ortho',
+                               data_format=data_format)
+    optimizer = tf.train.RMSPropOptimizer(learning_rate=1e-4)
+    network = Network(scope='worker_0',
+                      n_actions=n_actions,
+                      entropy_bonus=0.01,
+                      value_loss_coef=0.5,
+                      weight_inits='ortho',
+                      max_grad_norm=0.5,
+                      optimizer=optimizer,
+                      summaries=False,
+                      data_format=data_format,
+                      xla=xla,
+                      flat_params=flat_params)
+    sess = tf.Session()
+    sess.run(tf.global_variables_initializer())
+
+    # Frame stacks as they come from FrameStackWrapper. We include the
+    # conversion to the network's layout in the timing.
+    frame_stacks = np.random.rand(batch_size, 4, 84, 84).astype(np.float32)
+    actions = np.random.randint(n_actions, size=batch_size)
+    returns = np.random.rand(batch_size).astype(np.float32)
+
+    def act():
+        s = to_network_layout(frame_stacks[0], data_format)
+        sess.run([network.a_softmax, network.graph_v],
+                 feed_dict={network.s: [s]})
+
+    def train():
+        states = [to_network_layout(s, data_format) for s in frame_stacks]
+        sess.run(network.train_op,
+                 feed_dict={network.s: states,
+                            network.a: actions,
+                            network.r: returns})
+
+    def sync():
+        sess.run(network.sync_with_global_ops)
+
+    return (time_fn(act, n_iterations), time_fn(train, n_iterations),
+            time_fn(sync, n_iterations))
+
+
+def time_fn(fn, n_iterations):
+    # Warm up
+    for _ in range(10):
+        fn()
+    start = time.time()
+    for _ in range(n_iterations):
+        fn()
+    return (time.time() - start) / n_iterations
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import json
+import os.path as osp
+
+"""
+Choose the number of workers for a machine by measuring training throughput
+with increasing numbers of workers.
+
+Throughput usually climbs roughly linearly until we run out of cores (or
+memory bandwidth), then flattens out or even drops as threads start
+contending. We pick the knee: the smallest worker count which gets close to
+the best throughput seen.
+"""
+
+
+def calibration_worker_counts(max_workers):
+    """
+    Powers of two up to max_workers, plus max_workers itself.
+    """
+    counts = []
+    n = 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def choose_n_workers(results, tolerance=0.1):
+    """
+    results: list of (n_workers, steps_per_second) pairs
+    tolerance: how far below the best throughput (as a fraction) we're
+               willing to go in exchange for fewer workers
+    """
+    if not results:
+        raise ValueError("No calibration results")
+    best_rate = max(rate for _, rate in results)
+    for n_workers, rate in sorted(results):
+        if rate >= (1 - tolerance) * best_rate:
+            return n_workers
+
+
+def save_calibration(log_dir, results, chosen_n_workers):
+    path = osp.join(log_dir, 'worker_calibration.json')
+    with open(path, 'w') as f:
+        json.dump({'steps_per_second': {str(n): rate for n, rate in results},
+                   'chosen_n_workers': chosen_n_workers},
+                  f, indent=2)
+    return path
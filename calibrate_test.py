@@ -0,0 +1,41 @@
+import json
+import os.path as osp
+import tempfile
+import unittest
+
+from calibrate import (calibration_worker_counts, choose_n_workers,
+                       save_calibration)
+
+
+class TestCalibrate(unittest.TestCase):
+
+    def test_worker_counts(self):
+        self.assertEqual(calibration_worker_counts(1), [1])
+        self.assertEqual(calibration_worker_counts(8), [1, 2, 4, 8])
+        self.assertEqual(calibration_worker_counts(12), [1, 2, 4, 8, 12])
+
+    def test_knee(self):
+        # Throughput plateaus at 8 workers
+        results = [(1, 100), (2, 195), (4, 380), (8, 700), (16, 720)]
+        self.assertEqual(choose_n_workers(results), 8)
+        # Unless we don't tolerate any drop
+        self.assertEqual(choose_n_workers(results, tolerance=0), 16)
+
+    def test_contention(self):
+        # Throughput drops with too many workers
+        results = [(16, 300), (1, 100), (4, 390), (8, 420)]
+        self.assertEqual(choose_n_workers(results), 4)
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = save_calibration(temp_dir, [(1, 100.0), (2, 150.0)], 2)
+            self.assertEqual(path, osp.join(temp_dir,
+                                            'worker_calibration.json'))
+            with open(path) as f:
+                saved = json.load(f)
+        self.assertEqual(saved['chosen_n_workers'], 2)
+        self.assertEqual(saved['steps_per_second'], {'1': 100.0, '2': 150.0})
+
+
+if __name__ == '__main__':
+    unittest.main()
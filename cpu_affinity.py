@@ -0,0 +1,42 @@
+import os
+
+"""
+Pin environment processes and the main (TensorFlow) process to separate sets
+of cores, so that they don't fight over the same cores.
+
+Only works on Linux, which has os.sched_setaffinity.
+"""
+
+
+def available_cpus():
+    return sorted(os.sched_getaffinity(0))
+
+
+def make_cpu_layout(cpus, n_envs):
+    """
+    Split cpus between n_envs environment processes and the main process.
+
+    Environments are given about half the cores, with environments sharing
+    cores round-robin if there are more environments than that; the main
+    process gets the rest, for TensorFlow's thread pools and the worker
+    threads.
+
+    Returns (list of CPU sets, one per environment; CPU set for the main
+    process).
+    """
+    cpus = list(cpus)
+    if len(cpus) == 1:
+        return [set(cpus) for _ in range(n_envs)], set(cpus)
+    n_env_cpus = max(1, min(n_envs, len(cpus) // 2))
+    env_cpus = cpus[:n_env_cpus]
+    main_cpus = set(cpus[n_env_cpus:])
+    env_cpu_sets = [{env_cpus[env_n % n_env_cpus]} for env_n in range(n_envs)]
+    return env_cpu_sets, main_cpus
+
+
+def pin_to_cpus(cpus):
+    """
+    Pin the calling thread to cpus. Threads and processes it starts
+    afterwards inherit the affinity.
+    """
+    os.sched_setaffinity(0, cpus)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from cpu_affinity import make_cpu_layout
+
+
+class TestCPULayout(unittest.TestCase):
+
+    def test_more_cpus_than_envs(self):
+        env_cpus, main_cpus = make_cpu_layout(range(8), n_envs=2)
+        self.assertEqual(env_cpus, [{0}, {1}])
+        self.assertEqual(main_cpus, {2, 3, 4, 5, 6, 7})
+
+    def test_more_envs_than_cpus(self):
+        env_cpus, main_cpus = make_cpu_layout(range(4), n_envs=5)
+        # Envs should share half the cores round-robin
+        self.assertEqual(env_cpus, [{0}, {1}, {0}, {1}, {0}])
+        self.assertEqual(main_cpus, {2, 3})
+
+    def test_no_overlap(self):
+        for n_cpus in range(2, 65):
+            for n_envs in range(1, 70):
+                env_cpus, main_cpus = make_cpu_layout(range(n_cpus), n_envs)
+                self.assertEqual(len(env_cpus), n_envs)
+                self.assertTrue(main_cpus)
+                for cpus in env_cpus:
+                    self.assertFalse(cpus & main_cpus)
+
+    def test_single_cpu(self):
+        env_cpus, main_cpus = make_cpu_layout([3], n_envs=2)
+        self.assertEqual(env_cpus, [{3}, {3}])
+        self.assertEqual(main_cpus, {3})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import os.path as osp
+import queue
+import re
+from threading import Thread
+
+import numpy as np
+
+"""
+Dump data fed into the network in debug mode (observations, actions, returns)
+to compressed .npz files, one per update, laid out as
+
+  <dump_dir>/worker_<n>/update_<n>.npz
+
+Files are written from a background thread so that debug runs go at
+(nearly) full speed, and are read back lazily with DebugDumps.
+"""
+
+UPDATE_FILENAME_RE = re.compile(r'update_(\d+)\.npz$')
+WORKER_DIRNAME_RE = re.compile(r'worker_(\d+)$')
+
+
+class DebugDumper:
+    STOP_CMD = None
+
+    def __init__(self, dump_dir, max_pending=16):
+        self.dump_dir = dump_dir
+        os.makedirs(dump_dir, exist_ok=True)
+        # Bounded so that a slow disk applies backpressure rather than
+        # letting memory usage grow without limit. We'd rather slow down
+        # than lose debug data.
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.t = Thread(target=self.write_loop, daemon=True)
+        self.t.start()
+
+    def dump(self, update_n, **arrays):
+        self.pending.put((update_n, arrays))
+
+    def write_loop(self):
+        while True:
+            item = self.pending.get()
+            if item is self.STOP_CMD:
+                break
+            update_n, arrays = item
+            path = osp.join(self.dump_dir, 'update_{:08d}.npz'.format(update_n))
+            # Write to a temporary file first so that readers never see a
+            # partially-written dump
+            tmp_path = path + '.tmp.npz'
+            np.savez_compressed(tmp_path, **arrays)
+            os.replace(tmp_path, path)
+
+    def close(self):
+        self.pending.put(self.STOP_CMD)
+        self.t.join()
+
+
+class DebugDumps:
+    """
+    Lazy view of the dumps in a debug directory. Nothing is loaded until a
+    specific array is accessed.
+    """
+
+    def __init__(self, debug_dir):
+        self.debug_dir = debug_dir
+
+    def workers(self):
+        workers = []
+        for dirname in os.listdir(self.debug_dir):
+            match = WORKER_DIRNAME_RE.match(dirname)
+            if match:
+                workers.append(int(match.group(1)))
+        return sorted(workers)
+
+    def updates(self, worker_n):
+        worker_dir = osp.join(self.debug_dir, 'worker_{}'.format(worker_n))
+        updates = []
+        for filename in os.listdir(worker_dir):
+            match = UPDATE_FILENAME_RE.match(filename)
+            if match:
+                updates.append(int(match.group(1)))
+        return sorted(updates)
+
+    def load(self, worker_n, update_n):
+        """
+        Returns an NpzFile, which only decompresses an array when it's
+        accessed.
+        """
+        path = osp.join(self.debug_dir,
+                        'worker_{}'.format(worker_n),
+                        'update_{:08d}.npz'.format(update_n))
+        return np.load(path)
+
+    def __iter__(self):
+        for worker_n in self.workers():
+            for update_n in self.updates(worker_n):
+                yield worker_n, update_n, self.load(worker_n, update_n)
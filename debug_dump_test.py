@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+import os.path as osp
+import tempfile
+import unittest
+
+import numpy as np
+
+from debug_dump import DebugDumper, DebugDumps
+
+
+class TestDebugDump(unittest.TestCase):
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            observations = np.random.rand(5, 84, 84, 4).astype(np.float32)
+            actions = np.array([0, 1, 2, 3, 4])
+            returns = np.random.rand(5).astype(np.float32)
+
+            for worker_n in [0, 1]:
+                dumper = DebugDumper(osp.join(temp_dir,
+                                              'worker_{}'.format(worker_n)))
+                for update_n in [0, 1, 10]:
+                    dumper.dump(update_n,
+                                observations=observations + update_n,
+                                actions=actions,
+                                returns=returns)
+                dumper.close()
+
+            dumps = DebugDumps(temp_dir)
+            self.assertEqual(dumps.workers(), [0, 1])
+            self.assertEqual(dumps.updates(1), [0, 1, 10])
+            data = dumps.load(1, 10)
+            np.testing.assert_array_equal(data['observations'],
+                                          observations + 10)
+            np.testing.assert_array_equal(data['actions'], actions)
+            np.testing.assert_array_equal(data['returns'], returns)
+            self.assertEqual(len(list(dumps)), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
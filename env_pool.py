@@ -0,0 +1,90 @@
+"""
+A pool of envs shared between workers, for running more envs than worker
+threads. Rather than each worker being tied to one env (and sitting idle
+while that env resets), a worker takes whichever env is ready at the start
+of each rollout and hands it back at the end.
+
+Each rollout still runs on a single env, and each env remembers where it
+got to, so every env's sequence of rollouts is continuous.
+"""
+
+from multiprocessing.connection import wait
+from threading import Condition
+
+
+class EnvSlot:
+    """
+    An env plus the per-env state a worker needs to carry on from where the
+    last rollout on that env left off.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        # None if the env needs resetting
+        self.last_state = None
+        self.episode_values = []
+        self.resetting = False
+
+
+class EnvPool:
+
+    def __init__(self, envs, poll_interval_seconds=0.01):
+        self.poll_interval_seconds = poll_interval_seconds
+        self.cond = Condition()
+        self.action_space = envs[0].action_space
+        self.observation_space = envs[0].observation_space
+        # Slots not currently in use by a worker, in the order they were
+        # handed back
+        self.free = []
+        for env in envs:
+            slot = EnvSlot(env)
+            self.start_reset(slot)
+            self.free.append(slot)
+
+    @staticmethod
+    def start_reset(slot):
+        slot.env.reset_async()
+        slot.resetting = True
+
+    def take_ready_slot(self):
+        # Must be called with self.cond held
+        for slot in self.free:
+            if slot.resetting and slot.env.reset_ready():
+                slot.last_state = slot.env.reset_result()
+                slot.resetting = False
+        for slot in self.free:
+            if not slot.resetting:
+                self.free.remove(slot)
+                return slot
+        return None
+
+    def acquire(self):
+        """
+        Take an env which is ready to step, waiting if necessary.
+        """
+        while True:
+            with self.cond:
+                slot = self.take_ready_slot()
+                if slot is not None:
+                    return slot
+                resetting_pipes = [slot.env.pipe for slot in self.free
+                                   if slot.resetting]
+                if not resetting_pipes:
+                    # All envs are in use; wait for one to be handed back
+                    self.cond.wait()
+                    continue
+            # Wait for a reset to finish (without holding the lock, so that
+            # other workers can hand back envs in the meantime). We use a
+            # timeout in case an env which isn't resetting is handed back.
+            wait(resetting_pipes, timeout=self.poll_interval_seconds)
+
+    def release(self, slot):
+        """
+        Hand back an env. If its episode has ended (last_state is None), it
+        starts resetting straight away.
+        """
+        if slot.last_state is None:
+            self.start_reset(slot)
+        with self.cond:
+            self.free.append(slot)
+            self.cond.notify()
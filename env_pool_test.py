@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import time
+import unittest
+from threading import Thread
+
+from env_pool import EnvPool
+from utils import SubProcessEnv
+
+
+class SlowResetEnv:
+    """
+    Episodes last 2 steps; resets take a while.
+    """
+    observation_space = None
+    action_space = None
+    reset_seconds = 0.3
+
+    def reset(self):
+        time.sleep(self.reset_seconds)
+        return 0
+
+    def step(self, action):
+        return 0, 0, action == 1, {}
+
+
+class TestEnvPool(unittest.TestCase):
+
+    def setUp(self):
+        self.envs = [SubProcessEnv(SlowResetEnv) for _ in range(3)]
+        self.pool = EnvPool(self.envs)
+
+    def tearDown(self):
+        for env in self.envs:
+            env.close()
+
+    def test_acquire_release(self):
+        slots = [self.pool.acquire() for _ in range(3)]
+        self.assertEqual(len(set(id(s) for s in slots)), 3)
+        for slot in slots:
+            self.assertEqual(slot.last_state, 0)
+        # An env whose episode is still going is handed straight back out
+        slots[0].env.step(0)
+        self.pool.release(slots[0])
+        self.assertIs(self.pool.acquire(), slots[0])
+
+    def test_skips_resetting_env(self):
+        slot_1, slot_2, _ = [self.pool.acquire() for _ in range(3)]
+        # slot_1's episode ends, so it starts resetting when handed back
+        slot_1.env.step(1)
+        slot_1.last_state = None
+        self.pool.release(slot_1)
+        slot_2.env.step(0)
+        self.pool.release(slot_2)
+        # We should get the env which is ready rather than wait for the reset
+        t = time.time()
+        self.assertIs(self.pool.acquire(), slot_2)
+        self.assertLess(time.time() - t, SlowResetEnv.reset_seconds / 2)
+        # Then wait for the one that's resetting
+        slot = self.pool.acquire()
+        self.assertIs(slot, slot_1)
+        self.assertEqual(slot.last_state, 0)
+        self.assertFalse(slot.resetting)
+
+    def test_wait_for_release(self):
+        slots = [self.pool.acquire() for _ in range(3)]
+
+        def release_later():
+            time.sleep(0.2)
+            self.pool.release(slots[1])
+
+        Thread(target=release_later).start()
+        self.assertIs(self.pool.acquire(), slots[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import tensorflow as tf
+from tensorflow.python.training.saver import BaseSaverBuilder
+
+from param_layout import ParamLayout, strip_var_name
+
+"""
+Store all the trainable variables of a scope in a single flat variable,
+<scope>/flat_params, with the network computing on views of it (laid out by
+ParamLayout).
+
+With every scope stored like this, an optimizer only sees one variable, so
+RMSProp updates the whole network (and its statistics, kept in a single flat
+slot) with one ApplyRMSProp op, and syncing one scope with another is one
+assign. Statistics are still shared between workers using the same optimizer
+instance, since they belong to the one global flat variable.
+
+Checkpoints are saved in the same format as without flat storage (one entry
+per parameter), so they can be loaded either way.
+"""
+
+FLAT_VAR_NAME = 'flat_params'
+SAVEABLES_KEY = 'flat_params_saveables'
+
+
+def discover_variables(make_variables):
+    """
+    Call make_variables in a scratch graph to find out which trainable
+    variables it creates. Returns their layout and a dictionary from
+    variable name to initializer.
+    """
+    initializers = {}
+
+    def record_initializer(getter, name, *args, **kwargs):
+        var = getter(name, *args, **kwargs)
+        if kwargs.get('trainable', True):
+            initializers[strip_var_name(var.name)] = kwargs.get('initializer')
+        return var
+
+    with tf.Graph().as_default():
+        with tf.variable_scope('scratch', custom_getter=record_initializer):
+            make_variables()
+        layout = ParamLayout.from_scope('scratch')
+    # These belong to the scratch graph
+    layout.variables = None
+    return layout, initializers
+
+
+class FlatParamsGetter:
+    """
+    A custom getter for tf.variable_scope(scope) which, rather than creating
+    each trainable variable, returns a view of the flat variable.
+
+    make_variables should create the same trainable variables as the code
+    run in the scope (e.g. by calling the same function); it's used to find
+    out the layout and how to initialise each part of the flat variable.
+    """
+
+    def __init__(self, scope, make_variables):
+        self.scope = scope
+        self.layout, self.initializers = discover_variables(make_variables)
+        self.flat_variable = None
+        self.views = None
+
+    def __call__(self, getter, name, *args, **kwargs):
+        if not kwargs.get('trainable', True):
+            return getter(name, *args, **kwargs)
+
+        if self.flat_variable is None:
+            self.create_flat_variable(getter, *args, **kwargs)
+        var_name = name[len(self.scope) + 1:]
+        if var_name not in self.views:
+            raise ValueError("Variable '{}' isn't in the flat layout".format(
+                name))
+        return self.views[var_name]
+
+    def create_flat_variable(self, getter, *args, **kwargs):
+        # With reuse, this gets the existing flat variable
+        kwargs.update(shape=[self.layout.size],
+                      initializer=self.initialize)
+        self.flat_variable = getter(self.scope + '/' + FLAT_VAR_NAME,
+                                    *args, **kwargs)
+        # tf.split along the first dimension doesn't copy, so the views are
+        # cheap to read, and their gradients are concatenated back into a
+        # single flat gradient
+        with tf.name_scope(self.scope + '/flat_views/'):
+            self.views = self.layout.unflatten_tensor(self.flat_variable)
+        saved_names = [saveable.name
+                       for saveable in tf.get_collection(SAVEABLES_KEY)]
+        if self.flat_variable.op.name not in saved_names:
+            tf.add_to_collection(SAVEABLES_KEY, FlatParamsSaveable(
+                self.flat_variable, self.layout, self.views, self.scope))
+
+    def initialize(self, shape, dtype=tf.float32, partition_info=None):
+        values = {}
+        for name, var_shape in zip(self.layout.names, self.layout.shapes):
+            initializer = self.initializers[name]
+            if initializer is None:
+                # tf.get_variable's default for floats
+                initializer = tf.glorot_uniform_initializer()
+            values[name] = initializer(var_shape, dtype=dtype)
+        return self.layout.flatten_tensors(values)
+
+
+class FlatParamsSaveable(BaseSaverBuilder.SaveableObject):
+    """
+    Save (and restore) each view of a flat variable under the name the
+    variable would have had without flat storage.
+    """
+
+    def __init__(self, flat_variable, layout, views, scope):
+        self.layout = layout
+        specs = [BaseSaverBuilder.SaveSpec(views[name], '',
+                                           scope + '/' + name)
+                 for name in layout.names]
+        super().__init__(flat_variable, specs, flat_variable.op.name)
+
+    def restore(self, restored_tensors, restored_shapes):
+        values = dict(zip(self.layout.names, restored_tensors))
+        return tf.assign(self.op, self.layout.flatten_tensors(values))
+
+
+def checkpoint_variables(scope):
+    """
+    What to give tf.train.Saver to save the trainable variables in scope,
+    whether or not they're stored flat.
+    """
+    saveables = [saveable for saveable in tf.get_collection(SAVEABLES_KEY)
+                 if saveable.op.op.name.startswith(scope + '/')]
+    flat_names = [saveable.op.name for saveable in saveables]
+    variables = [v for v in tf.trainable_variables(scope + '/')
+                 if v.name not in flat_names]
+    return variables + saveables
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import os.path as osp
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from flat_params import checkpoint_variables
+from network import Network, make_inference_network, flat_params_getter
+from param_layout import ParamLayout, strip_var_name
+
+
+def make_network(flat_params):
+    tf.reset_default_graph()
+    if flat_params:
+        getter = flat_params_getter('global', n_actions=6,
+                                    weight_inits='glorot')
+    else:
+        getter = None
+    with tf.variable_scope('global', custom_getter=getter):
+        make_inference_network(n_actions=6, weight_inits='glorot')
+    optimizer = tf.train.RMSPropOptimizer(learning_rate=1e-3,
+                                          decay=0.99, epsilon=1e-5)
+    network = Network(scope='worker_0',
+                      n_actions=6,
+                      entropy_bonus=0.01,
+                      value_loss_coef=0.5,
+                      weight_inits='glorot',
+                      max_grad_norm=0.5,
+                      optimizer=optimizer,
+                      summaries=False,
+                      flat_params=flat_params)
+    sess = tf.Session()
+    sess.run(tf.global_variables_initializer())
+    return sess, network, getter
+
+
+def get_global_params(sess, getter):
+    if getter is None:
+        variables = tf.trainable_variables('global/')
+        return {strip_var_name(v.name): value
+                for v, value in zip(variables, sess.run(variables))}
+    else:
+        return getter.layout.views(sess.run(getter.flat_variable))
+
+
+class TestFlatParams(unittest.TestCase):
+
+    def test_single_variable(self):
+        """
+        Each scope should have one variable, updated by one ApplyRMSProp op
+        and synced with one assign.
+        """
+        sess, network, getter = make_network(flat_params=True)
+        self.assertEqual([v.name for v in tf.trainable_variables('global/')],
+                         ['global/flat_params:0'])
+        self.assertEqual(len(tf.trainable_variables('worker_0/')), 1)
+        self.assertEqual(len(network.sync_with_global_ops), 1)
+        ops = tf.get_default_graph().get_operations()
+        self.assertEqual(len([op for op in ops if op.type == 'ApplyRMSProp']),
+                         1)
+        # The views should have the shapes of the variables they replace
+        self.assertEqual(getter.views['conv1/kernel'].get_shape().as_list(),
+                         [8, 8, 4, 32])
+
+    def test_matches_separate_variables(self):
+        """
+        An update with flat parameters should give the same result as with
+        separate variables.
+        """
+        states = np.random.rand(5, 84, 84, 4)
+        actions = np.random.randint(6, size=5)
+        returns = np.random.rand(5)
+
+        results = []
+        init_params = None
+        for flat_params in [False, True]:
+            sess, network, getter = make_network(flat_params)
+            if init_params is None:
+                init_params = get_global_params(sess, getter)
+            else:
+                getter.flat_variable.load(
+                    getter.layout.flatten(init_params), sess)
+            sess.run(network.sync_with_global_ops)
+            feed_dict = {network.s: states,
+                         network.a: actions,
+                         network.r: returns}
+            for _ in range(2):
+                sess.run(network.train_op, feed_dict)
+            results.append(get_global_params(sess, getter))
+
+        separate, flat = results
+        self.assertEqual(sorted(separate), sorted(flat))
+        for name in separate:
+            self.assertFalse(np.allclose(separate[name], init_params[name]))
+            np.testing.assert_allclose(flat[name], separate[name],
+                                       rtol=1e-4, atol=1e-6)
+
+    def test_checkpoint(self):
+        """
+        Checkpoints should be saved per parameter, so that checkpoints from
+        flat parameters can be loaded into separate variables, and vice
+        versa.
+        """
+        sess, _, getter = make_network(flat_params=True)
+        flat = get_global_params(sess, getter)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = osp.join(temp_dir, 'network.ckpt')
+            tf.train.Saver(checkpoint_variables('global')).save(sess, path)
+            self.assertIn('global/conv1/kernel',
+                          tf.train.load_checkpoint(path).
+                          get_variable_to_shape_map())
+
+            sess, _, getter = make_network(flat_params=False)
+            tf.train.Saver(checkpoint_variables('global')).restore(sess, path)
+            separate = get_global_params(sess, getter)
+            tf.train.Saver(checkpoint_variables('global')).save(sess, path)
+
+            sess, _, getter = make_network(flat_params=True)
+            tf.train.Saver(checkpoint_variables('global')).restore(sess, path)
+            restored = get_global_params(sess, getter)
+
+        for name in flat:
+            np.testing.assert_array_equal(separate[name], flat[name])
+            np.testing.assert_array_equal(restored[name], flat[name])
+
+    def test_layout(self):
+        _, _, getter = make_network(flat_params=True)
+        layout = ParamLayout.from_scope('worker_0')
+        self.assertEqual(layout.names, ['flat_params'])
+        self.assertEqual(layout.shapes, [(getter.layout.size,)])
+
+
+if __name__ == '__main__':
+    unittest.main()
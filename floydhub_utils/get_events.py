@@ -1,59 +1,274 @@
 #!/usr/bin/env python3
 """
 Download all TensorFlow event files from the specified jobs' output files.
+
+Files are fetched through a backend:
+- 'floyd' uses the floyd CLI to fetch files from FloydHub jobs.
+- 'local' copies files from a local directory (e.g. a mounted share or an
+  rsync'd mirror) containing one subdirectory per job. This works offline.
+
+Syncing is incremental: a manifest in the download directory records what has
+already been fetched, and files which haven't changed (by size and
+modification time, or by hash with --verify_hash) are skipped. An interrupted
+sync can therefore just be re-run to resume.
 """
 
 import argparse
+import hashlib
+import json
 import os
 import os.path as osp
 import random
 import shutil
 import subprocess
+import tempfile
 import time
-from multiprocessing import Pool
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+MANIFEST_FILENAME = 'manifest.json'
+
+# size and mtime are None if the backend can't tell us
+RemoteFile = namedtuple('RemoteFile', ['job_id', 'path', 'size', 'mtime'])
+
+
+def is_event_file(path):
+    return 'events.out.tfevents' in path
+
+
+class FloydBackend:
+    """
+    Fetch files from FloydHub using the floyd CLI.
+    """
+
+    def list_files(self, job_id):
+        cmd = "floyd data listfiles {}/output".format(job_id)
+        files = subprocess.check_output(cmd.split()).decode().split('\n')
+        # The floyd CLI doesn't tell us sizes or modification times, so we
+        # rely on files from finished jobs not changing
+        return [RemoteFile(job_id, f, None, None)
+                for f in files if is_event_file(f)]
+
+    def fetch(self, remote_file, dest_path):
+        with tempfile.TemporaryDirectory(dir=osp.dirname(dest_path)) as tmp:
+            # The floyd CLI needs to know which project we're in
+            shutil.copyfile('.floydexpt', osp.join(tmp, '.floydexpt'))
+            cmd = "floyd data getfile {}/output {}".format(remote_file.job_id,
+                                                           remote_file.path)
+            # We download into a temporary directory then move the file into
+            # place so that we never leave a partially-downloaded file
+            # where a complete one is expected.
+            subprocess.run(cmd.split(), cwd=tmp, check=True,
+                           stdout=subprocess.DEVNULL)
+            downloaded = osp.join(tmp, osp.basename(remote_file.path))
+            os.replace(downloaded, dest_path)
+
+
+class LocalBackend:
+    """
+    Copy files from a local directory containing one subdirectory per job.
+    """
+
+    def __init__(self, source_dir):
+        self.source_dir = source_dir
+
+    def list_files(self, job_id):
+        job_dir = osp.join(self.source_dir, job_id)
+        if not osp.isdir(job_dir):
+            raise Exception("Job directory '{}' not found".format(job_dir))
+        remote_files = []
+        for dirpath, _, filenames in os.walk(job_dir):
+            for filename in filenames:
+                if not is_event_file(filename):
+                    continue
+                full_path = osp.join(dirpath, filename)
+                stat = os.stat(full_path)
+                remote_files.append(RemoteFile(job_id,
+                                               osp.relpath(full_path, job_dir),
+                                               stat.st_size,
+                                               stat.st_mtime))
+        return remote_files
+
+    def source_path(self, remote_file):
+        return osp.join(self.source_dir, remote_file.job_id, remote_file.path)
+
+    def fetch(self, remote_file, dest_path):
+        tmp_path = dest_path + '.partial'
+        shutil.copy2(self.source_path(remote_file), tmp_path)
+        os.replace(tmp_path, dest_path)
+
+    def hash(self, remote_file):
+        return file_hash(self.source_path(remote_file))
 
 
-def list_files(job_id):
-    time.sleep(random.random())
-    print("Listing files...")
-    cmd = "floyd data listfiles {}/output".format(job_id)
-    files = subprocess.check_output(cmd.split()).decode().split('\n')
-    event_files = [f for f in files if 'events.out.tfevents' in f]
-    job_ids_with_files = [(job_id, f) for f in event_files]
-    return job_ids_with_files
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
 
 
-def get_file(job_id, job_path, download_dir):
-    time.sleep(random.random())
-    full_dir = osp.join(download_dir, job_id, osp.dirname(job_path))
-    os.makedirs(full_dir, exist_ok=True)
-    shutil.copyfile('.floydexpt', osp.join(full_dir, '.floydexpt'))
+class Manifest:
+    """
+    Record of files already fetched, persisted to disk after every change so
+    that an interrupted sync can be resumed.
+    """
 
-    print("Downloading {}...".format(job_path))
-    cmd = "floyd data getfile {}/output {}".format(job_id, job_path)
-    # We need to download directly into the target directory in case
-    # there are multiple files with the same name (which would overwrite
-    # each other if downloaded into the same directory).
-    subprocess.call(cmd.split(), cwd=full_dir)
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        if osp.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+        else:
+            self.entries = {}
+
+    @staticmethod
+    def key(remote_file):
+        return remote_file.job_id + '/' + remote_file.path
+
+    def get(self, remote_file):
+        with self.lock:
+            return self.entries.get(self.key(remote_file))
+
+    def update(self, remote_file, sha256):
+        with self.lock:
+            self.entries[self.key(remote_file)] = {'size': remote_file.size,
+                                                   'mtime': remote_file.mtime,
+                                                   'sha256': sha256}
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+def needs_fetch(remote_file, dest_path, manifest, backend, verify_hash):
+    entry = manifest.get(remote_file)
+    if entry is None or not osp.exists(dest_path):
+        return True
+    if remote_file.size is None:
+        # Backend can't tell us whether the file changed
+        return False
+    if (entry['size'] == remote_file.size and
+            entry['mtime'] == remote_file.mtime):
+        return False
+    if verify_hash and hasattr(backend, 'hash'):
+        if backend.hash(remote_file) != entry['sha256']:
+            return True
+        # Only the mtime changed. Record the new one, so that we don't
+        # have to hash the file again next time.
+        manifest.update(remote_file, entry['sha256'])
+        return False
+    return True
+
+
+def retry(fn, n_retries, base_delay_seconds=1.0):
+    for attempt in range(n_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == n_retries:
+                raise
+            # Exponential backoff, with jitter so that parallel retries
+            # don't all hit the server at the same time
+            delay = base_delay_seconds * 2 ** attempt * (1 + random.random())
+            print("{}; retrying in {:.1f} seconds...".format(e, delay))
+            time.sleep(delay)
+
+
+def sync_file(remote_file, backend, manifest, download_dir, n_retries,
+              verify_hash):
+    dest_path = osp.join(download_dir, remote_file.job_id, remote_file.path)
+    if not needs_fetch(remote_file, dest_path, manifest, backend,
+                       verify_hash):
+        return False
+    os.makedirs(osp.dirname(dest_path), exist_ok=True)
+    print("Downloading {}/{}...".format(remote_file.job_id, remote_file.path))
+    retry(lambda: backend.fetch(remote_file, dest_path), n_retries)
+    manifest.update(remote_file, file_hash(dest_path))
+    return True
+
+
+def sync(backend, job_ids, download_dir, n_parallel=8, n_retries=3,
+         verify_hash=False):
+    """
+    Returns (no. of files fetched, no. of files skipped, list of failures).
+    """
+    os.makedirs(download_dir, exist_ok=True)
+    manifest = Manifest(osp.join(download_dir, MANIFEST_FILENAME))
+    failures = []
+
+    with ThreadPoolExecutor(max_workers=n_parallel) as pool:
+        listing_futures = {
+            job_id: pool.submit(retry,
+                                lambda job_id=job_id:
+                                backend.list_files(job_id),
+                                n_retries)
+            for job_id in job_ids
+        }
+        remote_files = []
+        for job_id, future in listing_futures.items():
+            try:
+                remote_files.extend(future.result())
+            except Exception as e:
+                failures.append((job_id, e))
+
+        fetch_futures = [
+            (remote_file,
+             pool.submit(sync_file, remote_file, backend, manifest,
+                         download_dir, n_retries, verify_hash))
+            for remote_file in remote_files
+        ]
+        n_fetched = n_skipped = 0
+        for remote_file, future in fetch_futures:
+            try:
+                if future.result():
+                    n_fetched += 1
+                else:
+                    n_skipped += 1
+            except Exception as e:
+                failures.append((Manifest.key(remote_file), e))
+
+    return n_fetched, n_skipped, failures
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("download_dir")
     parser.add_argument("job_ids", nargs='*')
-    parser.add_argument("--n_parallel", default=8)
+    parser.add_argument("--backend", choices=['floyd', 'local'],
+                        default='floyd')
+    parser.add_argument("--source_dir",
+                        help="Directory containing job directories "
+                             "(for --backend local)")
+    parser.add_argument("--n_parallel", type=int, default=8)
+    parser.add_argument("--n_retries", type=int, default=3)
+    parser.add_argument("--verify_hash", action='store_true',
+                        help="If size or modification time has changed, "
+                             "compare hashes before re-fetching "
+                             "(for --backend local)")
     args = parser.parse_args()
 
-    with Pool(processes=args.n_parallel) as pool:
-        job_ids_with_files = pool.map(list_files, args.job_ids)
-        job_ids_with_files = [
-            item for sublist in job_ids_with_files for item in sublist
-        ]
-        worker_args = [(job_id, job_path, args.download_dir)
-                       for job_id, job_path in job_ids_with_files]
-        pool.starmap(get_file, worker_args)
-        pool.close()
-        pool.join()
+    if args.backend == 'floyd':
+        backend = FloydBackend()
+    elif args.backend == 'local':
+        if args.source_dir is None:
+            parser.error("--backend local requires --source_dir")
+        backend = LocalBackend(args.source_dir)
+
+    n_fetched, n_skipped, failures = sync(backend, args.job_ids,
+                                          args.download_dir,
+                                          n_parallel=args.n_parallel,
+                                          n_retries=args.n_retries,
+                                          verify_hash=args.verify_hash)
+    print("Fetched {} files; skipped {} unchanged files".format(n_fetched,
+                                                                n_skipped))
+    if failures:
+        for name, e in failures:
+            print("Failed: {}: {}".format(name, e))
+        raise SystemExit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import os
+import os.path as osp
+import tempfile
+import unittest
+
+from get_events import LocalBackend, sync, retry
+
+
+def write_file(path, contents):
+    os.makedirs(osp.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(contents)
+
+
+class TestGetEvents(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.source_dir = osp.join(self.tmp_dir.name, 'source')
+        self.download_dir = osp.join(self.tmp_dir.name, 'download')
+        self.event_path = osp.join(self.source_dir, 'job1', 'worker_0',
+                                   'events.out.tfevents.1')
+        write_file(self.event_path, 'foo')
+        write_file(osp.join(self.source_dir, 'job1', 'args.txt'), 'bar')
+        self.backend = LocalBackend(self.source_dir)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_incremental_sync(self):
+        n_fetched, n_skipped, failures = sync(self.backend, ['job1'],
+                                              self.download_dir)
+        self.assertEqual((n_fetched, n_skipped, failures), (1, 0, []))
+        dest_path = osp.join(self.download_dir, 'job1', 'worker_0',
+                             'events.out.tfevents.1')
+        with open(dest_path) as f:
+            self.assertEqual(f.read(), 'foo')
+        # Only event files should be fetched
+        self.assertFalse(osp.exists(osp.join(self.download_dir, 'job1',
+                                             'args.txt')))
+
+        # Nothing changed, so nothing should be fetched
+        n_fetched, n_skipped, _ = sync(self.backend, ['job1'],
+                                       self.download_dir)
+        self.assertEqual((n_fetched, n_skipped), (0, 1))
+
+        # Grow the file; it should be fetched again
+        write_file(self.event_path, 'foobar')
+        n_fetched, n_skipped, _ = sync(self.backend, ['job1'],
+                                       self.download_dir)
+        self.assertEqual((n_fetched, n_skipped), (1, 0))
+        with open(dest_path) as f:
+            self.assertEqual(f.read(), 'foobar')
+
+    def test_verify_hash(self):
+        sync(self.backend, ['job1'], self.download_dir)
+        # Touch the file without changing its contents
+        stat = os.stat(self.event_path)
+        os.utime(self.event_path, (stat.st_atime, stat.st_mtime + 10))
+        n_hashes = []
+        backend_hash = self.backend.hash
+
+        def counting_hash(remote_file):
+            n_hashes.append(1)
+            return backend_hash(remote_file)
+
+        self.backend.hash = counting_hash
+        n_fetched, _, _ = sync(self.backend, ['job1'], self.download_dir,
+                               verify_hash=True)
+        self.assertEqual(n_fetched, 0)
+        self.assertEqual(len(n_hashes), 1)
+        # The new mtime should have been recorded, so there's no need to
+        # hash again
+        n_fetched, _, _ = sync(self.backend, ['job1'], self.download_dir,
+                               verify_hash=True)
+        self.assertEqual(n_fetched, 0)
+        self.assertEqual(len(n_hashes), 1)
+
+        os.utime(self.event_path, (stat.st_atime, stat.st_mtime + 20))
+        n_fetched, _, _ = sync(self.backend, ['job1'], self.download_dir,
+                               verify_hash=False)
+        self.assertEqual(n_fetched, 1)
+
+    def test_missing_job(self):
+        _, _, failures = sync(self.backend, ['job1', 'job2'],
+                              self.download_dir, n_retries=0)
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(failures[0][0], 'job2')
+
+    def test_retry(self):
+        calls = []
+
+        def flaky():
+            calls.append(None)
+            if len(calls) < 3:
+                raise Exception("Flaky")
+            return 'done'
+
+        self.assertEqual(retry(flaky, n_retries=2, base_delay_seconds=0),
+                         'done')
+        calls.clear()
+        with self.assertRaises(Exception):
+            retry(flaky, n_retries=1, base_delay_seconds=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
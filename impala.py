@@ -0,0 +1,264 @@
+import queue
+from threading import Thread, Event
+
+import easy_tf_log
+import numpy as np
+import tensorflow as tf
+
+import utils
+from network import Network, make_inference_network, to_network_layout
+from params import DISCOUNT_FACTOR
+from replay import states_to_uint8, states_from_uint8
+from vtrace import vtrace
+
+"""
+Decoupled actors and learner, following Espeholt et al., 2018,
+'IMPALA: Scalable Distributed Deep-RL with Importance Weighted
+Actor-Learner Architectures'.
+
+Actors only run inference. They push trajectories, together with the
+probabilities their policy gave the actions taken, onto a queue. A single
+learner takes batches of trajectories from the queue and updates the global
+parameters, using V-trace to correct for actors' policies lagging behind
+the learner's.
+
+The learner computes directly on the global parameters (it's the only thing
+updating them), so it never needs to sync. Actors only sync every
+sync_interval trajectories.
+"""
+
+
+class Actor:
+
+    def __init__(self, sess, env, scope, n_actions, weight_inits,
+                 trajectory_queue, stop_event, data_format='channels_last',
+                 sync_interval=1):
+        self.sess = sess
+        self.env = env
+        self.data_format = data_format
+        self.trajectory_queue = trajectory_queue
+        self.stop_event = stop_event
+
+        with tf.variable_scope(scope):
+            self.s, _, self.a_softmax, _, _ = \
+                make_inference_network(n_actions, weight_inits, data_format)
+        self.sync_with_global_ops = utils.make_copy_ops(from_scope='global',
+                                                        to_scope=scope)
+        self.sync_interval = sync_interval
+        self.n_trajectories = 0
+        self.last_state = None
+
+    def run_trajectory(self, n_steps):
+        if self.last_state is None:
+            self.last_state = self.env.reset()
+        if self.n_trajectories % self.sync_interval == 0:
+            self.sess.run(self.sync_with_global_ops)
+        self.n_trajectories += 1
+
+        states = []
+        actions = []
+        rewards = []
+        action_probs_taken = []
+        for _ in range(n_steps):
+            s = to_network_layout(self.last_state, self.data_format)
+            states.append(s)
+            [action_probs] = self.sess.run(self.a_softmax,
+                                           feed_dict={self.s: [s]})
+            a = np.random.choice(self.env.action_space.n, p=action_probs)
+            actions.append(a)
+            action_probs_taken.append(action_probs[a])
+
+            self.last_state, r, done, _ = self.env.step(a)
+            rewards.append(r)
+
+            if done:
+                break
+
+        last_state = to_network_layout(self.last_state, self.data_format)
+        if done:
+            self.last_state = None
+        # Trajectories are queued as uint8 to keep the queue compact
+        trajectory = {'states': states_to_uint8(states),
+                      'last_state': states_to_uint8(last_state),
+                      'actions': np.array(actions),
+                      'rewards': np.array(rewards, dtype=np.float32),
+                      'behaviour_probs': np.array(action_probs_taken),
+                      'done': done}
+        self.put(trajectory)
+
+    def put(self, trajectory):
+        # Don't block forever if the learner has stopped
+        while not self.stop_event.is_set():
+            try:
+                self.trajectory_queue.put(trajectory, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+
+class Learner:
+
+    def __init__(self, sess, network, trajectory_queue, batch_size,
+                 stop_event):
+        self.sess = sess
+        self.network = network
+        self.trajectory_queue = trajectory_queue
+        self.batch_size = batch_size
+        self.stop_event = stop_event
+        self.updates = 0
+
+    def get_trajectories(self):
+        """
+        Returns None if we're stopped while waiting (e.g. because the
+        actors have died).
+        """
+        trajectories = []
+        while len(trajectories) < self.batch_size:
+            if self.stop_event.is_set():
+                return None
+            try:
+                trajectories.append(self.trajectory_queue.get(timeout=1))
+            except queue.Empty:
+                pass
+        return trajectories
+
+    def run_update(self):
+        """
+        Returns the number of steps trained on, or None if we were stopped.
+        """
+        trajectories = self.get_trajectories()
+        if trajectories is None:
+            return None
+
+        # Get the learner's policy and values for every state in the batch,
+        # including the states after the last step of each trajectory,
+        # in a single forward pass
+        all_states = []
+        for t in trajectories:
+            all_states.append(states_from_uint8(t['states']))
+            all_states.append(states_from_uint8(t['last_state'])[None])
+        all_states = np.concatenate(all_states)
+        probs, values = self.sess.run(
+            [self.network.a_softmax, self.network.graph_v],
+            feed_dict={self.network.s: all_states})
+
+        states = []
+        actions = []
+        vs = []
+        pg_advantages = []
+        start = 0
+        for t in trajectories:
+            n = len(t['actions'])
+            t_probs = probs[start:start + n]
+            t_values = values[start:start + n]
+            if t['done']:
+                bootstrap_value = 0.0
+            else:
+                bootstrap_value = values[start + n]
+            target_probs = t_probs[np.arange(n), t['actions']]
+            t_vs, t_pg_advantages = vtrace(t['behaviour_probs'], target_probs,
+                                           t['rewards'], t_values,
+                                           bootstrap_value, DISCOUNT_FACTOR)
+            states.append(all_states[start:start + n])
+            actions.append(t['actions'])
+            vs.append(t_vs)
+            pg_advantages.append(t_pg_advantages)
+            start += n + 1
+
+        states = np.concatenate(states)
+        vs = np.concatenate(vs)
+        feed_dict = {self.network.s: states,
+                     self.network.off_policy_a: np.concatenate(actions),
+                     self.network.vs: vs,
+                     self.network.pg_advantages: np.concatenate(pg_advantages)}
+        self.sess.run(self.network.off_policy_train_op, feed_dict)
+
+        if self.updates % 100 == 0:
+            easy_tf_log.tflog('learner/queue_size',
+                              self.trajectory_queue.qsize())
+            easy_tf_log.tflog('learner/vs_mean', np.mean(vs))
+        self.updates += 1
+
+        return len(states)
+
+
+def make_impala(sess, envs, n_actions, weight_inits, value_loss_coef,
+                entropy_bonus, max_grad_norm, optimizer, batch_size,
+                queue_size, data_format='channels_last',
+                actor_sync_interval=1):
+    # As with make_networks, do all graph construction serially
+    with tf.variable_scope('global'):
+        make_inference_network(n_actions=n_actions, weight_inits=weight_inits,
+                               data_format=data_format)
+
+    trajectory_queue = queue.Queue(maxsize=queue_size)
+    stop_event = Event()
+
+    actors = []
+    for actor_n, env in enumerate(envs):
+        actor = Actor(sess=sess,
+                      env=env,
+                      scope="actor_{}".format(actor_n),
+                      n_actions=n_actions,
+                      weight_inits=weight_inits,
+                      trajectory_queue=trajectory_queue,
+                      stop_event=stop_event,
+                      data_format=data_format,
+                      sync_interval=actor_sync_interval)
+        actors.append(actor)
+
+    network = Network(scope='global',
+                      n_actions=n_actions,
+                      entropy_bonus=entropy_bonus,
+                      value_loss_coef=value_loss_coef,
+                      weight_inits=weight_inits,
+                      max_grad_norm=max_grad_norm,
+                      optimizer=optimizer,
+                      summaries=False,
+                      off_policy=True,
+                      data_format=data_format,
+                      shared_params=True,
+                      on_policy=False)
+    learner = Learner(sess=sess,
+                      network=network,
+                      trajectory_queue=trajectory_queue,
+                      batch_size=batch_size,
+                      stop_event=stop_event)
+
+    return actors, learner, stop_event
+
+
+def run_actor(actor, steps_per_trajectory):
+    try:
+        while not actor.stop_event.is_set():
+            actor.run_trajectory(steps_per_trajectory)
+    except BaseException:
+        # Stop everything rather than leave the learner waiting for
+        # trajectories which might never come
+        actor.stop_event.set()
+        raise
+
+
+def run_learner(learner, n_steps_to_run, step_counter, update_counter,
+                stop_event):
+    while int(step_counter) < n_steps_to_run:
+        steps_ran = learner.run_update()
+        if steps_ran is None:
+            break
+        step_counter.increment(steps_ran)
+        update_counter.increment(1)
+    stop_event.set()
+
+
+def start_impala(actors, learner, stop_event, n_steps, steps_per_trajectory,
+                 step_counter, update_counter):
+    threads = []
+    for actor in actors:
+        thread = Thread(target=run_actor, args=[actor, steps_per_trajectory])
+        thread.start()
+        threads.append(thread)
+    thread = Thread(target=run_learner, args=[learner, n_steps, step_counter,
+                                              update_counter, stop_event])
+    thread.start()
+    threads.append(thread)
+    return threads
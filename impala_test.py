@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import queue
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from impala import make_impala
+
+
+class DummyActionSpace:
+    n = 6
+
+
+class DummyEnv:
+    action_space = DummyActionSpace()
+
+
+class TestImpala(unittest.TestCase):
+
+    def test_learner_update(self):
+        """
+        Check that the learner can consume a batch of trajectories of
+        different lengths, and that doing so updates the global parameters.
+        """
+        tf.reset_default_graph()
+        sess = tf.Session()
+        optimizer = tf.train.RMSPropOptimizer(learning_rate=1e-3)
+        actors, learner, _ = make_impala(sess=sess,
+                                         envs=[DummyEnv(), DummyEnv()],
+                                         n_actions=6,
+                                         weight_inits='glorot',
+                                         value_loss_coef=0.5,
+                                         entropy_bonus=0.01,
+                                         max_grad_norm=0.5,
+                                         optimizer=optimizer,
+                                         batch_size=2,
+                                         queue_size=2)
+        self.assertEqual(len(actors), 2)
+        sess.run(tf.global_variables_initializer())
+
+        for n_steps, done in [(5, False), (3, True)]:
+            states = np.random.randint(0, 256, size=(n_steps, 84, 84, 4),
+                                       dtype=np.uint8)
+            last_state = np.random.randint(0, 256, size=(84, 84, 4),
+                                           dtype=np.uint8)
+            learner.trajectory_queue.put(
+                {'states': states,
+                 'last_state': last_state,
+                 'actions': np.random.randint(6, size=n_steps),
+                 'rewards': np.ones(n_steps, dtype=np.float32),
+                 'behaviour_probs': np.full(n_steps, 1 / 6),
+                 'done': done})
+
+        global_vars = tf.trainable_variables('global')
+        vars_before = sess.run(global_vars)
+        n_steps = learner.run_update()
+        vars_after = sess.run(global_vars)
+
+        self.assertEqual(n_steps, 8)
+        self.assertRaises(queue.Empty, learner.trajectory_queue.get_nowait)
+        for before, after in zip(vars_before, vars_after):
+            self.assertFalse(np.array_equal(before, after))
+
+    def test_learner_stop(self):
+        """
+        The learner shouldn't wait forever for trajectories once stopped.
+        """
+        tf.reset_default_graph()
+        sess = tf.Session()
+        optimizer = tf.train.RMSPropOptimizer(learning_rate=1e-3)
+        _, learner, stop_event = make_impala(sess=sess,
+                                             envs=[DummyEnv()],
+                                             n_actions=6,
+                                             weight_inits='glorot',
+                                             value_loss_coef=0.5,
+                                             entropy_bonus=0.01,
+                                             max_grad_norm=0.5,
+                                             optimizer=optimizer,
+                                             batch_size=2,
+                                             queue_size=2)
+        stop_event.set()
+        self.assertIsNone(learner.run_update())
+
+
+if __name__ == '__main__':
+    unittest.main()
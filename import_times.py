@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+"""
+Measure how long modules take to import (using python -X importtime), and
+which of their imports are the heaviest, e.g. to check that CLI tools start
+quickly.
+
+e.g.:
+  python3 import_times.py params show_debug_data run_checkpoint
+"""
+
+import argparse
+import os.path as osp
+import subprocess
+import sys
+import time
+
+DEFAULT_MODULES = ['params', 'show_debug_data', 'plot_mems', 'run_checkpoint',
+                   'aggregate_events', 'train']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--n_repeats', type=int, default=3,
+                        help="Report the fastest of this many imports")
+    parser.add_argument('--n_heaviest', type=int, default=5,
+                        help="No. of heaviest direct imports to show")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        wall_time, entries = measure(module, args.n_repeats)
+        print("{}: {:.0f} ms".format(module, wall_time * 1e3))
+        imports = direct_imports(entries, module)
+        imports.sort(key=lambda entry: entry[2], reverse=True)
+        for name, _, cumulative_us, _ in imports[:args.n_heaviest]:
+            print("  {:>8.0f} ms  {}".format(cumulative_us / 1e3, name))
+
+
+def measure(module, n_repeats):
+    """
+    Import module in a fresh interpreter n_repeats times. Returns the
+    fastest wall time (including interpreter startup) and the parsed
+    importtime output from that run.
+    """
+    cmd = [sys.executable, '-X', 'importtime', '-c', 'import ' + module]
+    # Run from this directory so that the repo's modules can be found
+    cwd = osp.dirname(osp.abspath(__file__))
+    best_time = best_entries = None
+    for _ in range(n_repeats):
+        start = time.time()
+        result = subprocess.run(cmd, cwd=cwd, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        wall_time = time.time() - start
+        if result.returncode != 0:
+            raise Exception("Importing '{}' failed:\n{}".format(
+                module, result.stderr))
+        if best_time is None or wall_time < best_time:
+            best_time = wall_time
+            best_entries = parse_importtime(result.stderr)
+    return best_time, best_entries
+
+
+def parse_importtime(output):
+    """
+    Parse -X importtime output into a list of
+    (module, self_us, cumulative_us, level) in the order printed. Level 0
+    is a top-level import; each module is printed after its own imports.
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3:
+            continue
+        try:
+            self_us = int(fields[0])
+            cumulative_us = int(fields[1])
+        except ValueError:
+            # The header
+            continue
+        name = fields[2].rstrip()
+        # One space of padding, then two spaces per level
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((name.strip(), self_us, cumulative_us, level))
+    return entries
+
+
+def direct_imports(entries, module):
+    """
+    Find the imports module made itself (rather than its imports made).
+    """
+    for i, (name, _, _, level) in enumerate(entries):
+        if name == module and level == 0:
+            break
+    else:
+        return []
+    imports = []
+    # Its imports are printed just before it, back to the previous
+    # top-level import
+    for entry in reversed(entries[:i]):
+        level = entry[3]
+        if level == 0:
+            break
+        if level == 1:
+            imports.append(entry)
+    return imports[::-1]
+
+
+if __name__ == '__main__':
+    main()
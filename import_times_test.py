@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from import_times import direct_imports, parse_importtime
+
+OUTPUT = """\
+import time: self [us] | cumulative | imported package
+import time:       225 |        225 |   _io
+import time:       527 |        752 | _frozen_importlib_external
+import time:        62 |         62 |     _codecs
+import time:       300 |        362 |   codecs
+import time:      1000 |       1000 |   argparse
+import time:       150 |       1512 | params
+"""
+
+
+class TestImportTimes(unittest.TestCase):
+
+    def test_parse(self):
+        entries = parse_importtime(OUTPUT)
+        self.assertEqual(entries[0], ('_io', 225, 225, 1))
+        self.assertEqual(entries[1], ('_frozen_importlib_external', 527, 752,
+                                      0))
+        self.assertEqual(entries[2], ('_codecs', 62, 62, 2))
+        self.assertEqual(len(entries), 6)
+
+    def test_direct_imports(self):
+        entries = parse_importtime(OUTPUT)
+        imports = direct_imports(entries, 'params')
+        self.assertEqual([name for name, _, _, _ in imports],
+                         ['codecs', 'argparse'])
+        self.assertEqual(direct_imports(entries, 'train'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
-import re
-
 import tensorflow as tf
 
+from param_layout import ParamLayout, strip_var_name
+
 """
 Create a training operator which calculates gradients in one scope (the 
 per-worker copy of parameters) and applies them in another (the shared set of
@@ -9,26 +9,29 @@ parameters).
 """
 
 
-def strip_var_name(name):
-    """
-    e.g. scope/weights:0 -> weights
+def make_grads(compute_scope_loss, compute_scope, max_grad_norm=None):
     """
-    return re.match('\w*/([^:]*):\w*', name).group(1)
+    Calculate gradients of compute_scope_loss with respect to the trainable
+    variables in compute_scope, clipping them if max_grad_norm is given.
 
-
-def make_train_op(compute_scope_loss, optimizer, compute_scope,
-                  apply_scope, max_grad_norm=None):
-    """
-    compute_scope: the scope in which to calculate gradients
-    apply_scope: the scope in which to apply the gradients
+    Returns the (possibly clipped) gradients, the variables they correspond
+    to, and the global norm of the gradients before clipping.
     """
-
-    # Clip gradients
     compute_tvs = tf.trainable_variables(compute_scope)
     compute_grads = tf.gradients(compute_scope_loss, compute_tvs)
     if max_grad_norm is not None:
-        compute_grads, _ = tf.clip_by_global_norm(compute_grads, max_grad_norm)
+        compute_grads, unclipped_norm = tf.clip_by_global_norm(compute_grads,
+                                                               max_grad_norm)
+    else:
+        unclipped_norm = tf.global_norm(compute_grads)
+    return compute_grads, compute_tvs, unclipped_norm
+
 
+def make_apply_op(compute_grads, compute_tvs, optimizer, apply_scope):
+    """
+    Create an operator which applies gradients calculated for variables in
+    one scope to the matching variables in apply_scope.
+    """
     # Create a dictionary mapping from variable name to
     # gradients calculated in compute_scope
     compute_scope_grads_dict = {}
@@ -42,11 +45,7 @@ def make_train_op(compute_scope_loss, optimizer, compute_scope,
 
     # Create a dictionary mapping from variable names to
     # variables in apply_scope
-    apply_tvs = tf.trainable_variables(apply_scope)
-    apply_tvs_dict = {}
-    for var in apply_tvs:
-        var_name = strip_var_name(var.name)
-        apply_tvs_dict[var_name] = var
+    apply_tvs_dict = ParamLayout.from_scope(apply_scope).var_by_name()
 
     # Create an operator which applies gradients to variables in apply_scope
     grads_and_compute_scope_vars = []
@@ -55,3 +54,98 @@ def make_train_op(compute_scope_loss, optimizer, compute_scope,
     train_op = optimizer.apply_gradients(grads_and_compute_scope_vars)
 
     return train_op, grads_norm
+
+
+def make_train_op(compute_scope_loss, optimizer, compute_scope,
+                  apply_scope, max_grad_norm=None):
+    """
+    compute_scope: the scope in which to calculate gradients
+    apply_scope: the scope in which to apply the gradients
+    """
+    compute_grads, compute_tvs, _ = make_grads(compute_scope_loss,
+                                               compute_scope,
+                                               max_grad_norm)
+    return make_apply_op(compute_grads, compute_tvs, optimizer, apply_scope)
+
+
+class GradientAccumulator:
+    """
+    Instead of each worker applying its gradients to apply_scope directly,
+    workers add their gradients to a set of shared accumulators (one per
+    variable in apply_scope), and a single updater applies the mean of every
+    n_to_accumulate gradients in one update.
+
+    Gradients from workers whose parameters were last synced more than
+    max_staleness updates ago are dropped. With max_staleness=None, no
+    gradients are dropped.
+
+    apply_if_ready_op applies an update if every accumulator has enough
+    gradients, and returns whether it did, so that the updater only needs
+    one session call per update.
+    """
+
+    def __init__(self, optimizer, apply_scope, n_to_accumulate,
+                 max_staleness):
+        self.n_to_accumulate = n_to_accumulate
+        self.max_staleness = max_staleness
+
+        self.accumulators = {}
+        self.apply_tvs = ParamLayout.from_scope(apply_scope).var_by_name()
+        for var_name, var in self.apply_tvs.items():
+            self.accumulators[var_name] = tf.ConditionalAccumulator(
+                dtype=var.dtype.base_dtype,
+                shape=var.get_shape())
+
+        with tf.variable_scope('grad_accumulator'):
+            # The number of updates applied so far. Each accumulator also
+            # keeps its own count, incremented on each take_grad; this is
+            # for workers to read when they sync.
+            self.update_n = tf.Variable(0, trainable=False, name='update_n',
+                                        dtype=tf.int32)
+
+        n_accumulated = [acc.num_accumulated()
+                         for acc in self.accumulators.values()]
+        self.ready_op = tf.reduce_min(n_accumulated) >= n_to_accumulate
+
+        def apply():
+            grads_and_vars = []
+            for var_name, acc in self.accumulators.items():
+                grad = acc.take_grad(n_to_accumulate)
+                grads_and_vars.append((grad, self.apply_tvs[var_name]))
+            apply_op = optimizer.apply_gradients(grads_and_vars)
+            with tf.control_dependencies([apply_op]):
+                update_n_op = self.update_n.assign_add(1)
+            with tf.control_dependencies([update_n_op]):
+                return tf.constant(True)
+
+        # Only the updater takes gradients, so if every accumulator is
+        # ready here, none of the take_grads will block. (We don't just let
+        # take_grad block until there are enough gradients: we might then
+        # stop while some accumulators have had their gradients taken and
+        # others haven't, leaving them out of step.)
+        self.apply_if_ready_op = tf.cond(self.ready_op, apply,
+                                         lambda: tf.constant(False))
+
+    def make_accumulate_op(self, compute_grads, compute_tvs):
+        """
+        Create an operator which adds gradients calculated for variables in
+        some other scope to the accumulators for the matching variables.
+
+        Returns the op and a placeholder which should be fed with the value
+        of update_n at the time the compute scope was last synced.
+        """
+        synced_update_n = tf.placeholder(tf.int32, [])
+        # ConditionalAccumulator drops gradients whose local_step is less
+        # than the number of gradients it's taken so far
+        if self.max_staleness is None:
+            local_step = tf.constant(tf.int64.max, tf.int64)
+        else:
+            local_step = tf.cast(synced_update_n + self.max_staleness,
+                                 tf.int64)
+        accumulate_ops = []
+        for grad, var in zip(compute_grads, compute_tvs):
+            if grad is None:
+                continue
+            acc = self.accumulators[strip_var_name(var.name)]
+            accumulate_ops.append(acc.apply_grad(grad, local_step))
+        return tf.group(*accumulate_ops), synced_update_n
@@ -5,7 +5,8 @@ import unittest
 import numpy as np
 import tensorflow as tf
 
-from multi_scope_train_op import make_train_op
+from multi_scope_train_op import make_train_op, make_grads, \
+    GradientAccumulator
 
 
 class TestMultiScopeTrainOp(unittest.TestCase):
@@ -36,6 +37,87 @@ class TestMultiScopeTrainOp(unittest.TestCase):
         # We started at 1.0, and should have taken one step of -1000
         self.assertAlmostEqual(v_apply_val, 1.0 - 1000.0, places=3)
 
+    def test_unclipped_norm(self):
+        """
+        Check that make_grads gives us the norm from before clipping,
+        so that summaries can report it without another backward pass.
+        """
+        with tf.variable_scope('compute_scope'):
+            v_compute = tf.Variable(1.0)
+            loss = tf.constant(1e6) * v_compute
+        grads, _, unclipped_norm = make_grads(loss, 'compute_scope',
+                                              max_grad_norm=1e3)
+
+        self.sess.run(tf.global_variables_initializer())
+        grads, unclipped_norm = self.sess.run([grads, unclipped_norm])
+        self.assertAlmostEqual(grads[0], 1e3, places=3)
+        self.assertAlmostEqual(unclipped_norm, 1e6, places=3)
+
+    def test_gradient_accumulator(self):
+        with tf.variable_scope('apply_scope'):
+            v_apply = tf.Variable(0.0)
+        optimizer = tf.train.GradientDescentOptimizer(learning_rate=1)
+        accumulator = GradientAccumulator(optimizer, 'apply_scope',
+                                          n_to_accumulate=2, max_staleness=0)
+        accumulate_ops = []
+        for scope, coef in [('compute_scope_1', 1.0),
+                            ('compute_scope_2', 3.0)]:
+            with tf.variable_scope(scope):
+                v_compute = tf.Variable(1.0)
+                loss = coef * v_compute
+            grads, tvs, _ = make_grads(loss, scope)
+            accumulate_ops.append(accumulator.make_accumulate_op(grads, tvs))
+        n_accumulated = \
+            accumulator.accumulators['Variable'].num_accumulated()
+        self.sess.run(tf.global_variables_initializer())
+
+        accumulate_op, synced_update_n = accumulate_ops[0]
+        self.sess.run(accumulate_op, feed_dict={synced_update_n: 0})
+        self.assertFalse(self.sess.run(accumulator.ready_op))
+        # Not ready, so nothing should be applied
+        self.assertFalse(self.sess.run(accumulator.apply_if_ready_op))
+        self.assertEqual(self.sess.run(v_apply), 0.0)
+        self.assertEqual(self.sess.run(accumulator.update_n), 0)
+        accumulate_op, synced_update_n = accumulate_ops[1]
+        self.sess.run(accumulate_op, feed_dict={synced_update_n: 0})
+        self.assertTrue(self.sess.run(accumulator.ready_op))
+
+        self.assertTrue(self.sess.run(accumulator.apply_if_ready_op))
+        # One step of the mean gradient, (1 + 3) / 2
+        self.assertEqual(self.sess.run(v_apply), -2.0)
+        self.assertEqual(self.sess.run(accumulator.update_n), 1)
+
+        # Gradients calculated with parameters from before that update
+        # should now be dropped
+        accumulate_op, synced_update_n = accumulate_ops[0]
+        self.sess.run(accumulate_op, feed_dict={synced_update_n: 0})
+        self.assertEqual(self.sess.run(n_accumulated), 0)
+        self.sess.run(accumulate_op, feed_dict={synced_update_n: 1})
+        self.assertEqual(self.sess.run(n_accumulated), 1)
+
+    def test_unbounded_staleness(self):
+        """
+        With max_staleness=None, no gradients should be dropped, however old
+        the parameters they were calculated with.
+        """
+        with tf.variable_scope('apply_scope'):
+            tf.Variable(0.0)
+        optimizer = tf.train.GradientDescentOptimizer(learning_rate=1)
+        accumulator = GradientAccumulator(optimizer, 'apply_scope',
+                                          n_to_accumulate=1,
+                                          max_staleness=None)
+        with tf.variable_scope('compute_scope'):
+            loss = tf.Variable(1.0) * 2.0
+        grads, tvs, _ = make_grads(loss, 'compute_scope')
+        accumulate_op, synced_update_n = \
+            accumulator.make_accumulate_op(grads, tvs)
+        self.sess.run(tf.global_variables_initializer())
+
+        for _ in range(3):
+            self.sess.run(accumulate_op, feed_dict={synced_update_n: 0})
+            self.assertTrue(self.sess.run(accumulator.apply_if_ready_op))
+        self.assertEqual(self.sess.run(accumulator.update_n), 3)
+
     def test_compute_scope(self):
         """
         Test whether gradients are really calculated in the compute scope
@@ -1,15 +1,78 @@
+from contextlib import contextmanager
 from math import sqrt
 
+import numpy as np
 import tensorflow as tf
 
 import utils
-from multi_scope_train_op import make_train_op
+from flat_params import FlatParamsGetter
+from multi_scope_train_op import make_grads, make_apply_op, make_train_op
 from utils import logit_entropy, make_grad_histograms, make_rmsprop_histograms, \
     make_histograms
 
 
-def make_inference_network(n_actions, weight_inits, debug=False):
-    observations = tf.placeholder(tf.float32, [None, 84, 84, 4])
+def choose_data_format(data_format):
+    """
+    Resolve 'auto' to the conv data format likely to be fastest here.
+
+    TensorFlow's standard CPU conv kernels only support channels_last
+    (NHWC). Channels-first (NCHW) is supported (and usually faster) on GPUs
+    and in builds using MKL-DNN (oneDNN).
+    """
+    if data_format != 'auto':
+        return data_format
+    try:
+        from tensorflow.python import pywrap_tensorflow
+        mkl_enabled = pywrap_tensorflow.IsMklEnabled()
+    except (ImportError, AttributeError):
+        mkl_enabled = False
+    if mkl_enabled or tf.test.is_gpu_available(cuda_only=True):
+        return 'channels_first'
+    else:
+        return 'channels_last'
+
+
+def to_network_layout(frame_stack, data_format):
+    """
+    Convert a frame stack from FrameStackWrapper, which is channels-first,
+    to the layout the network takes.
+    """
+    if data_format == 'channels_first':
+        return frame_stack
+    else:
+        return np.moveaxis(frame_stack, source=0, destination=-1)
+
+
+def state_shape(data_format):
+    if data_format == 'channels_first':
+        return 4, 84, 84
+    else:
+        return 84, 84, 4
+
+
+@contextmanager
+def xla_scope(enabled):
+    """
+    If enabled, mark ops created in this scope (and their gradients) to be
+    compiled with XLA, which fuses them into fewer, larger kernels.
+    """
+    if enabled:
+        from tensorflow.contrib.compiler import jit
+        with jit.experimental_jit_scope():
+            yield
+    else:
+        yield
+
+
+def make_inference_network(n_actions, weight_inits,
+                           data_format='channels_last'):
+    """
+    With data_format='channels_first', the network takes frame stacks
+    directly from FrameStackWrapper, shaped [N, 4, 84, 84], and does its
+    convolutions channels-first.
+    """
+    observations = tf.placeholder(tf.float32,
+                                  [None] + list(state_shape(data_format)))
 
     if weight_inits == 'ortho':
         kernel_initializer = tf.orthogonal_initializer(gain=sqrt(2))
@@ -21,17 +84,10 @@ def make_inference_network(n_actions, weight_inits, debug=False):
         filters=32,
         kernel_size=8,
         strides=4,
+        data_format=data_format,
         activation=tf.nn.relu,
         kernel_initializer=kernel_initializer)
 
-    if debug:
-        # Dump observations as fed into the network to stderr,
-        # for viewing with show_observations.py.
-        conv1 = tf.Print(conv1, [observations],
-                         message='\ndebug observations:',
-                         # max no. of values to display; max int32
-                         summarize=2147483647)
-
     if weight_inits == 'ortho':
         kernel_initializer = tf.orthogonal_initializer(gain=sqrt(2))
     elif weight_inits == 'glorot':
@@ -42,6 +98,7 @@ def make_inference_network(n_actions, weight_inits, debug=False):
         filters=64,
         kernel_size=4,
         strides=2,
+        data_format=data_format,
         activation=tf.nn.relu,
         kernel_initializer=kernel_initializer)
 
@@ -55,11 +112,19 @@ def make_inference_network(n_actions, weight_inits, debug=False):
         filters=64,
         kernel_size=3,
         strides=1,
+        data_format=data_format,
         activation=tf.nn.relu,
         kernel_initializer=kernel_initializer)
 
-    w, h, f = conv3.get_shape()[1:]
-    conv3_unwrapped = tf.reshape(conv3, [-1, int(w * h * f)])
+    if data_format == 'channels_first':
+        # Flatten in channels-last order, so that the weights of the dense
+        # layer mean the same thing in both layouts (and checkpoints can be
+        # loaded with either)
+        conv3_nhwc = tf.transpose(conv3, [0, 2, 3, 1])
+    else:
+        conv3_nhwc = conv3
+    w, h, f = conv3_nhwc.get_shape()[1:]
+    conv3_unwrapped = tf.reshape(conv3_nhwc, [-1, int(w * h * f)])
 
     if weight_inits == 'ortho':
         kernel_initializer = tf.orthogonal_initializer(gain=sqrt(2))
@@ -104,7 +169,17 @@ def make_inference_network(n_actions, weight_inits, debug=False):
     return observations, a_logits, a_softmax, graph_v, layers
 
 
-def make_loss_ops(a_logits, graph_v, entropy_bonus, value_loss_coef, debug):
+def flat_params_getter(scope, n_actions, weight_inits,
+                       data_format='channels_last'):
+    """
+    A custom getter for tf.variable_scope(scope) which stores the inference
+    network's parameters in a single flat variable (see flat_params.py).
+    """
+    return FlatParamsGetter(scope, lambda: make_inference_network(
+        n_actions, weight_inits, data_format))
+
+
+def make_loss_ops(a_logits, graph_v, entropy_bonus, value_loss_coef):
     actions = tf.placeholder(tf.int64, [None])
     returns = tf.placeholder(tf.float32, [None])
 
@@ -128,20 +203,10 @@ def make_loss_ops(a_logits, graph_v, entropy_bonus, value_loss_coef, debug):
     with tf.control_dependencies([tf.assert_rank(_neglogprob, 1)]):
         neglogprob = _neglogprob
 
-    if debug:
-        neglogprob = tf.Print(neglogprob, [actions],
-                              message='\ndebug actions:',
-                              summarize=2147483647)
-
     _advantage = returns - graph_v
     with tf.control_dependencies([tf.assert_rank(_advantage, 1)]):
         advantage = _advantage
 
-    if debug:
-        advantage = tf.Print(advantage, [returns],
-                             message='\ndebug returns:',
-                             summarize=2147483647)
-
     policy_entropy = tf.reduce_mean(logit_entropy(a_logits))
 
     # Note that the advantage is treated as a constant for the
@@ -163,32 +228,136 @@ def make_loss_ops(a_logits, graph_v, entropy_bonus, value_loss_coef, debug):
            policy_loss, value_loss, loss
 
 
+def make_off_policy_loss_ops(a_logits, graph_v,
+                             entropy_bonus, value_loss_coef):
+    """
+    Loss for learning from experience generated by a different policy.
+
+    Instead of returns, we're fed V-trace value targets (vs) and policy
+    gradient advantages which have already been corrected for the difference
+    between the behaviour policy and the current policy (see vtrace.py).
+    Otherwise the loss is the same as in make_loss_ops.
+    """
+    actions = tf.placeholder(tf.int64, [None])
+    vs = tf.placeholder(tf.float32, [None])
+    pg_advantages = tf.placeholder(tf.float32, [None])
+
+    neglogprob = tf.nn.sparse_softmax_cross_entropy_with_logits(
+        logits=a_logits, labels=actions)
+    policy_entropy = tf.reduce_mean(logit_entropy(a_logits))
+    policy_loss = tf.reduce_mean(neglogprob * pg_advantages)
+    policy_loss -= entropy_bonus * policy_entropy
+    value_loss = value_loss_coef * tf.reduce_mean(0.5 * (vs - graph_v) ** 2)
+    loss = policy_loss + value_loss
+
+    return actions, vs, pg_advantages, policy_loss, value_loss, loss
+
+
 class Network:
 
     def __init__(self, scope, n_actions,
                  entropy_bonus, value_loss_coef, weight_inits, max_grad_norm,
-                 optimizer, summaries, debug=False):
-        with tf.variable_scope(scope):
+                 optimizer, summaries, off_policy=False, accumulator=None,
+                 data_format='channels_last', shared_params=False, xla=False,
+                 on_policy=True, flat_params=False):
+        """
+        With shared_params=True, rather than creating its own copy of the
+        parameters, the network computes directly on the parameters in
+        'global' (which must already exist), so one network can be shared by
+        all workers; scope should then be 'global'. There's nothing to sync,
+        so sync_with_global_ops is a no-op.
+
+        With xla=True, the inference network and loss (and so their
+        gradients) are compiled with XLA.
+
+        With on_policy=False (e.g. for the IMPALA learner, which only does
+        off-policy updates), no on-policy train op is built, and train_op
+        and the gradient attributes are None.
+
+        With flat_params=True, the parameters are stored in a single flat
+        variable (see flat_params.py), so the train op is a single optimizer
+        update and syncing is a single assign. 'global' must be stored the
+        same way.
+        """
+        if shared_params:
+            reuse = True
+        else:
+            reuse = None
+        if flat_params:
+            custom_getter = flat_params_getter(scope, n_actions, weight_inits,
+                                               data_format)
+        else:
+            custom_getter = None
+        with tf.variable_scope(scope, reuse=reuse,
+                               custom_getter=custom_getter), xla_scope(xla):
             observations, \
             a_logits, a_softmax, graph_v, \
-            layers = make_inference_network(n_actions, weight_inits, debug)
+            layers = make_inference_network(n_actions, weight_inits,
+                                            data_format)
 
             actions, returns, advantage, policy_entropy, \
             policy_loss, value_loss, loss = make_loss_ops(
                 a_logits, graph_v,
-                entropy_bonus, value_loss_coef, debug)
+                entropy_bonus, value_loss_coef)
 
-        sync_with_global_ops = utils.make_copy_ops(from_scope='global',
-                                                   to_scope=scope)
+            if off_policy:
+                off_policy_actions, vs, pg_advantages, \
+                _, _, off_policy_loss = make_off_policy_loss_ops(
+                    a_logits, graph_v,
+                    entropy_bonus, value_loss_coef)
 
-        train_op, grads_norm = make_train_op(
-            loss,
-            optimizer,
-            compute_scope=scope,
-            apply_scope='global',
-            max_grad_norm=max_grad_norm)
+        if shared_params:
+            sync_with_global_ops = tf.no_op()
+        else:
+            sync_with_global_ops = utils.make_copy_ops(from_scope='global',
+                                                       to_scope=scope)
+
+        # We keep hold of the gradients so that the summary ops can reuse
+        # them rather than running their own backward passes.
+        if on_policy:
+            grads, grads_vars, grads_norm_unclipped = make_grads(
+                loss,
+                compute_scope=scope,
+                max_grad_norm=max_grad_norm)
+        else:
+            grads = grads_vars = grads_norm_unclipped = None
+        if not on_policy:
+            train_op = grads_norm = None
+            self.synced_update_n = self.update_n = None
+        elif accumulator is not None:
+            # Workers only contribute gradients; the accumulator's updater
+            # applies them
+            train_op, synced_update_n = accumulator.make_accumulate_op(
+                grads, grads_vars)
+            grads_norm = tf.global_norm(grads)
+            self.synced_update_n = synced_update_n
+            self.update_n = accumulator.update_n
+        else:
+            train_op, grads_norm = make_apply_op(
+                grads, grads_vars,
+                optimizer,
+                apply_scope='global')
+            self.synced_update_n = self.update_n = None
+
+        if off_policy:
+            # Note that this builds a second set of gradient ops, but
+            # they're only run when we do off-policy updates
+            off_policy_train_op, _ = make_train_op(
+                off_policy_loss,
+                optimizer,
+                compute_scope=scope,
+                apply_scope='global',
+                max_grad_norm=max_grad_norm)
+            self.off_policy_a = off_policy_actions
+            self.vs = vs
+            self.pg_advantages = pg_advantages
+            self.off_policy_loss = off_policy_loss
+            self.off_policy_train_op = off_policy_train_op
+        else:
+            self.off_policy_train_op = None
 
         self.s = observations
+        self.data_format = data_format
         self.a_softmax = a_softmax
         self.graph_v = graph_v
         self.layers = layers
@@ -204,41 +373,56 @@ class Network:
         self.sync_with_global_ops = sync_with_global_ops
         self.optimizer = optimizer
         self.train_op = train_op
+        self.grads = grads
+        self.grads_vars = grads_vars
         self.grads_norm = grads_norm
+        self.grads_norm_unclipped = grads_norm_unclipped
 
         if summaries:
-            self.summaries_op = self.make_summary_ops(scope)
+            (self.summaries_op, self.histograms_op,
+             self.histogram_inputs) = self.make_summary_ops(scope)
         else:
-            self.summaries_op = None
+            self.summaries_op = self.histograms_op = None
+            self.histogram_inputs = None
 
     def make_summary_ops(self, scope):
-        variables = tf.trainable_variables(scope)
-        grads_policy = tf.gradients(self.policy_loss, variables)
-        grads_value = tf.gradients(self.value_loss, variables)
-        grads_combined = tf.gradients(self.loss, variables)
-        grads_norm_policy = tf.global_norm(grads_policy)
-        grads_norm_value = tf.global_norm(grads_value)
-        grads_norm_combined = tf.global_norm(grads_combined)
-
+        """
+        Returns two ops, plus the tensors the histograms are computed from:
+        - A cheap op for scalar summaries. Everything it depends on is
+          already computed by train_op, so it can be run in the same
+          session call as train_op at no extra cost.
+        - A more expensive op for histograms, meant to be run only
+          occasionally, ideally away from the worker's critical path. It
+          reuses the gradients computed for train_op rather than doing any
+          backward passes of its own.
+
+          The histogram inputs can be fetched in the same session call as
+          train_op, then fed back in later to compute the histograms from
+          that snapshot.
+        """
         scalar_summaries = [
             ('rl/policy_entropy', self.policy_entropy),
             ('rl/advantage_mean', tf.reduce_mean(self.advantage)),
             ('grads/loss_policy', self.policy_loss),
             ('grads/loss_value', self.value_loss),
             ('grads/loss_combined', self.loss),
-            ('grads/norm_policy', grads_norm_policy),
-            ('grads/norm_value', grads_norm_value),
-            ('grads/norm_combined', grads_norm_combined),
+            ('grads/norm_combined', self.grads_norm_unclipped),
             ('grads/norm_combined_clipped', self.grads_norm),
         ]
         summaries = []
         for name, val in scalar_summaries:
             summary = tf.summary.scalar(name, val)
             summaries.append(summary)
+        summaries_op = tf.summary.merge(summaries)
 
-        summaries.extend(make_grad_histograms(variables, grads_combined))
-        summaries.extend(make_rmsprop_histograms(self.optimizer))
-        summaries.extend(make_histograms(self.layers, 'activations'))
-        summaries.extend(make_histograms(variables, 'weights'))
-
-        return tf.summary.merge(summaries)
+        variables = tf.trainable_variables(scope)
+        # Note that these are the gradients after clipping
+        histograms = make_grad_histograms(self.grads_vars, self.grads)
+        histograms.extend(make_rmsprop_histograms(self.optimizer))
+        histograms.extend(make_histograms(self.layers, 'activations'))
+        histograms.extend(make_histograms(variables, 'weights'))
+        histograms_op = tf.summary.merge(histograms)
+        # The second input of each HistogramSummary op is its values
+        histogram_inputs = [h.op.inputs[1] for h in histograms]
+
+        return summaries_op, histograms_op, histogram_inputs
@@ -5,6 +5,7 @@ import unittest
 import numpy as np
 import tensorflow as tf
 
+import utils
 from network import Network, make_inference_network
 
 
@@ -49,6 +50,143 @@ class TestNetwork(unittest.TestCase):
         expected_loss /= 3
         self.assertAlmostEqual(expected_loss, actual_loss, places=5)
 
+    def test_off_policy_loss(self):
+        """
+        If we feed the off-policy loss the on-policy value targets and
+        advantages, it should give the same result as the on-policy loss.
+        """
+        tf.reset_default_graph()
+        optimizer = tf.train.RMSPropOptimizer(learning_rate=1e-3)
+        with tf.variable_scope('global'):
+            make_inference_network(n_actions=6,
+                                   weight_inits='glorot')
+        network = Network('foo_scope',
+                          n_actions=6,
+                          value_loss_coef=0.5,
+                          max_grad_norm=0.5,
+                          entropy_bonus=0.01,
+                          weight_inits='glorot',
+                          optimizer=optimizer,
+                          summaries=False,
+                          off_policy=True)
+        sess = tf.Session()
+        sess.run(tf.global_variables_initializer())
+
+        obs = np.random.rand(3, 84, 84, 4)
+        returns = [4, 5, 6]
+        actions = [1, 3, 2]
+        advantage, on_policy_loss = sess.run(
+            [network.advantage, network.loss],
+            feed_dict={network.s: obs,
+                       network.a: actions,
+                       network.r: returns})
+        off_policy_loss = sess.run(
+            network.off_policy_loss,
+            feed_dict={network.s: obs,
+                       network.off_policy_a: actions,
+                       network.vs: returns,
+                       network.pg_advantages: advantage})
+        self.assertAlmostEqual(on_policy_loss, off_policy_loss, places=5)
+
+    def test_channels_first(self):
+        """
+        With the same weights, networks using either data format should give
+        the same outputs for the same frame stacks.
+        """
+        tf.reset_default_graph()
+        with tf.variable_scope('channels_last'):
+            s_last, _, probs_last, v_last, _ = make_inference_network(
+                n_actions=6, weight_inits='glorot',
+                data_format='channels_last')
+        with tf.variable_scope('channels_first'):
+            s_first, _, probs_first, v_first, _ = make_inference_network(
+                n_actions=6, weight_inits='glorot',
+                data_format='channels_first')
+        copy_ops = utils.make_copy_ops(from_scope='channels_last',
+                                       to_scope='channels_first')
+        sess = tf.Session()
+        sess.run(tf.global_variables_initializer())
+        sess.run(copy_ops)
+
+        frame_stacks = np.random.rand(3, 4, 84, 84)
+        try:
+            outputs_first = sess.run(
+                [probs_first, v_first],
+                feed_dict={s_first: frame_stacks})
+        except tf.errors.OpError:
+            self.skipTest("Channels-first convolutions not supported here")
+        outputs_last = sess.run(
+            [probs_last, v_last],
+            feed_dict={s_last: np.moveaxis(frame_stacks, 1, -1)})
+        for first, last in zip(outputs_first, outputs_last):
+            np.testing.assert_allclose(first, last, rtol=1e-4, atol=1e-6)
+
+    def test_shared_params(self):
+        """
+        A network with shared_params=True shouldn't create any variables of
+        its own, and its train op should update the global parameters.
+        """
+        tf.reset_default_graph()
+        with tf.variable_scope('global'):
+            make_inference_network(n_actions=6, weight_inits='glorot')
+        n_vars = len(tf.global_variables())
+        optimizer = tf.train.GradientDescentOptimizer(learning_rate=1e-2)
+        network = Network(scope='global', n_actions=6, entropy_bonus=0.01,
+                          value_loss_coef=0.5, weight_inits='glorot',
+                          max_grad_norm=0.5, optimizer=optimizer,
+                          summaries=False, shared_params=True)
+        self.assertEqual(len(tf.global_variables()), n_vars)
+
+        sess = tf.Session()
+        sess.run(tf.global_variables_initializer())
+        global_vars = tf.trainable_variables('global')
+        vars_before = sess.run(global_vars)
+        sess.run(network.sync_with_global_ops)
+        sess.run(network.train_op,
+                 feed_dict={network.s: np.random.rand(3, 84, 84, 4),
+                            network.a: [0, 1, 2],
+                            network.r: [1.0, 0.0, -1.0]})
+        vars_after = sess.run(global_vars)
+        for before, after in zip(vars_before, vars_after):
+            self.assertFalse(np.array_equal(before, after))
+
+    def test_xla(self):
+        """
+        A network compiled with XLA should give the same outputs and loss as
+        one without.
+        """
+        tf.reset_default_graph()
+        with tf.variable_scope('global'):
+            make_inference_network(n_actions=6, weight_inits='glorot')
+        optimizer = tf.train.RMSPropOptimizer(learning_rate=1e-3)
+        networks = []
+        for scope, xla in [('worker_0', False), ('worker_1', True)]:
+            try:
+                network = Network(scope=scope, n_actions=6,
+                                  entropy_bonus=0.01, value_loss_coef=0.5,
+                                  weight_inits='glorot', max_grad_norm=0.5,
+                                  optimizer=optimizer, summaries=False,
+                                  xla=xla)
+            except ImportError:
+                self.skipTest("XLA not available")
+            networks.append(network)
+        sess = tf.Session()
+        sess.run(tf.global_variables_initializer())
+
+        states = np.random.rand(5, 84, 84, 4)
+        actions = np.random.randint(6, size=5)
+        returns = np.random.rand(5)
+        outputs = []
+        for network in networks:
+            sess.run(network.sync_with_global_ops)
+            outputs.append(sess.run(
+                [network.a_softmax, network.graph_v, network.loss],
+                feed_dict={network.s: states,
+                           network.a: actions,
+                           network.r: returns}))
+        for no_xla, xla in zip(*outputs):
+            np.testing.assert_allclose(no_xla, xla, rtol=1e-4, atol=1e-6)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+"""
+Run the inference network (see network.make_inference_network) in NumPy,
+so that a trained agent can be run without TensorFlow.
+
+Export the global parameters from a checkpoint with e.g.:
+  python3 numpy_network.py runs/pong/checkpoints pong.npz
+then run the agent with:
+  python3 run_checkpoint.py PongNoFrameskip-v4 pong.npz
+
+Exporting needs TensorFlow; loading and running the network don't.
+"""
+
+import argparse
+
+import numpy as np
+
+from param_layout import ParamLayout
+
+# (name, stride) of each conv layer in make_inference_network
+CONV_LAYERS = [('conv1', 4), ('conv2', 2), ('conv3', 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('ckpt_dir')
+    parser.add_argument('out_path')
+    args = parser.parse_args()
+    export_checkpoint(args.ckpt_dir, args.out_path)
+    print("Parameters saved to '{}'".format(args.out_path))
+
+
+def export_checkpoint(ckpt_dir, out_path):
+    """
+    Save the global parameters from the latest checkpoint in ckpt_dir as a
+    flat vector (see ParamLayout.save).
+    """
+    import tensorflow as tf
+
+    ckpt_file = tf.train.latest_checkpoint(ckpt_dir)
+    if not ckpt_file:
+        raise Exception("Couldn't find checkpoint in '{}'".format(ckpt_dir))
+    # We read the values straight from the checkpoint, so there's no need
+    # to build the graph (or to know how many actions there are)
+    reader = tf.train.load_checkpoint(ckpt_file)
+    arrays = {}
+    for var_name in reader.get_variable_to_shape_map():
+        scope, name = var_name.split('/', 1)
+        if scope == 'global':
+            arrays[name] = reader.get_tensor(var_name)
+    names = sorted(arrays)
+    layout = ParamLayout(names, [arrays[name].shape for name in names])
+    layout.save(out_path, layout.flatten(arrays))
+
+
+def conv2d(x, kernel, bias, stride):
+    """
+    Channels-last 'valid' convolution, as done by tf.layers.conv2d, using
+    im2col: we gather every patch into one row of a matrix, then do the
+    whole convolution as a single matrix multiplication.
+
+    x: [N, H, W, C]; kernel: [KH, KW, C, out channels]
+    """
+    n, h, w, c = x.shape
+    kh, kw, _, out_c = kernel.shape
+    out_h = (h - kh) // stride + 1
+    out_w = (w - kw) // stride + 1
+    sn, sh, sw, sc = x.strides
+    # A view of shape [N, out H, out W, KH, KW, C]; no data is copied
+    patches = np.lib.stride_tricks.as_strided(
+        x,
+        shape=(n, out_h, out_w, kh, kw, c),
+        strides=(sn, sh * stride, sw * stride, sh, sw, sc),
+        writeable=False)
+    # This is where the copy happens
+    cols = patches.reshape(n * out_h * out_w, kh * kw * c)
+    out = cols @ kernel.reshape(kh * kw * c, out_c) + bias
+    return out.reshape(n, out_h, out_w, out_c)
+
+
+def relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def softmax(logits):
+    exps = np.exp(logits - np.max(logits, axis=-1, keepdims=True))
+    return exps / np.sum(exps, axis=-1, keepdims=True)
+
+
+class NumpyNetwork:
+
+    def __init__(self, params):
+        """
+        params: a dictionary from parameter name (relative to the network's
+        scope, e.g. conv1/kernel) to value.
+        """
+        self.params = {name: np.asarray(value, dtype=np.float32)
+                       for name, value in params.items()}
+        self.n_actions = self.params['action_logits/bias'].shape[0]
+
+    @classmethod
+    def load(cls, path):
+        layout, flat = ParamLayout.load(path)
+        return cls(layout.views(flat))
+
+    def forward(self, observations):
+        """
+        observations: channels-last frame stacks, shaped [N, 84, 84, 4].
+        Returns action probabilities and value estimates, like a_softmax and
+        graph_v from make_inference_network.
+        """
+        p = self.params
+        x = np.asarray(observations, dtype=np.float32)
+        for name, stride in CONV_LAYERS:
+            x = relu(conv2d(x, p[name + '/kernel'], p[name + '/bias'],
+                            stride))
+        # Flattened in the same (channels-last) order as the TensorFlow
+        # network
+        x = x.reshape(x.shape[0], -1)
+        features = relu(x @ p['features/kernel'] + p['features/bias'])
+        logits = (features @ p['action_logits/kernel'] +
+                  p['action_logits/bias'])
+        values = features @ p['value/kernel'] + p['value/bias']
+        return softmax(logits), values[:, 0]
+
+
+if __name__ == '__main__':
+    main()
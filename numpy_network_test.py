@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import os.path as osp
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from network import make_inference_network
+from numpy_network import NumpyNetwork, conv2d, export_checkpoint
+
+
+class TestNumpyNetwork(unittest.TestCase):
+
+    def test_conv2d(self):
+        x = np.random.rand(2, 9, 11, 3).astype(np.float32)
+        kernel = np.random.rand(3, 2, 3, 5).astype(np.float32)
+        bias = np.random.rand(5).astype(np.float32)
+        stride = 2
+        out = conv2d(x, kernel, bias, stride)
+
+        self.assertEqual(out.shape, (2, 4, 5, 5))
+        for i in range(out.shape[1]):
+            for j in range(out.shape[2]):
+                patch = x[:, i * stride:i * stride + 3,
+                          j * stride:j * stride + 2, :]
+                expected = np.tensordot(patch, kernel, axes=3) + bias
+                np.testing.assert_allclose(out[:, i, j], expected, rtol=1e-5)
+
+    def test_matches_tensorflow(self):
+        """
+        A network exported from a checkpoint should give the same outputs
+        as the TensorFlow network.
+        """
+        tf.reset_default_graph()
+        with tf.variable_scope('global'):
+            obs, _, probs, values, _ = make_inference_network(
+                n_actions=6, weight_inits='ortho')
+        sess = tf.Session()
+        sess.run(tf.global_variables_initializer())
+        # Make the biases non-zero
+        for var in tf.trainable_variables('global'):
+            if 'bias' in var.name:
+                var.load(np.random.normal(scale=0.1,
+                                          size=var.get_shape().as_list()),
+                         sess)
+        observations = np.random.rand(3, 84, 84, 4)
+        tf_probs, tf_values = sess.run([probs, values],
+                                       feed_dict={obs: observations})
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            saver = tf.train.Saver(tf.trainable_variables('global'))
+            saver.save(sess, osp.join(temp_dir, 'network.ckpt'))
+            npz_path = osp.join(temp_dir, 'network.npz')
+            export_checkpoint(temp_dir, npz_path)
+            network = NumpyNetwork.load(npz_path)
+
+        np_probs, np_values = network.forward(observations)
+        np.testing.assert_allclose(np_probs, tf_probs, rtol=1e-4, atol=1e-6)
+        np.testing.assert_allclose(np_values, tf_values, rtol=1e-4,
+                                   atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import json
+import re
+
+import numpy as np
+
+"""
+A fixed layout for packing a set of parameters into a single flat vector.
+
+Each scope with a copy of the network (global, worker_0, etc.) has the same
+variables with the same names relative to the scope, so layouts from
+different scopes can be used interchangeably: a flat vector read from one
+scope can be assigned directly to another.
+
+TensorFlow is only imported by the methods which need it, so that saved
+parameters can be loaded (e.g. by numpy_network) without TensorFlow.
+"""
+
+
+def strip_var_name(name):
+    """
+    e.g. scope/weights:0 -> weights
+    """
+    return re.match('\w*/([^:]*):\w*', name).group(1)
+
+
+class ParamLayout:
+
+    def __init__(self, names, shapes):
+        self.names = list(names)
+        self.shapes = [tuple(shape) for shape in shapes]
+        self.sizes = [int(np.prod(shape)) for shape in self.shapes]
+        self.offsets = [int(sum(self.sizes[:i]))
+                        for i in range(len(self.sizes))]
+        self.size = sum(self.sizes)
+        # Only set for layouts created from variables
+        self.variables = None
+
+    @classmethod
+    def from_variables(cls, variables):
+        """
+        Variables are ordered by name (relative to their scope), so that
+        the layout doesn't depend on the order variables were created in.
+        """
+        variables = sorted(variables, key=lambda v: strip_var_name(v.name))
+        layout = cls(names=[strip_var_name(v.name) for v in variables],
+                     shapes=[v.get_shape().as_list() for v in variables])
+        layout.variables = variables
+        return layout
+
+    @classmethod
+    def from_scope(cls, scope):
+        import tensorflow as tf
+        # Match on scope + '/' so that e.g. worker_1 doesn't also match
+        # worker_10
+        return cls.from_variables(tf.trainable_variables(scope + '/'))
+
+    def __eq__(self, other):
+        return self.names == other.names and self.shapes == other.shapes
+
+    def var_by_name(self):
+        return dict(zip(self.names, self.variables))
+
+    # NumPy
+
+    def views(self, flat):
+        """
+        Return a dictionary from parameter name to a view of that parameter
+        in the flat vector. No data is copied.
+        """
+        return {name: flat[offset:offset + size].reshape(shape)
+                for name, shape, size, offset
+                in zip(self.names, self.shapes, self.sizes, self.offsets)}
+
+    def flatten(self, arrays_by_name, out=None):
+        if out is None:
+            out = np.empty(self.size, dtype=np.float32)
+        views = self.views(out)
+        for name in self.names:
+            views[name][...] = arrays_by_name[name]
+        return out
+
+    def save(self, path, flat):
+        """
+        Save a flat vector together with the layout, so that it can be
+        loaded without the graph. The vector is written as-is.
+        """
+        layout = json.dumps({'names': self.names, 'shapes': self.shapes})
+        np.savez(path, flat=flat, layout=np.array(layout))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Returns the layout and the flat vector.
+        """
+        f = np.load(path)
+        layout = json.loads(str(f['layout']))
+        return cls(layout['names'], layout['shapes']), f['flat']
+
+    # TensorFlow
+
+    def flatten_tensors(self, tensors_by_name):
+        import tensorflow as tf
+        return tf.concat([tf.reshape(tensors_by_name[name], [-1])
+                          for name in self.names], axis=0)
+
+    def unflatten_tensor(self, flat):
+        """
+        Split a flat tensor into a dictionary of per-parameter tensors.
+        """
+        import tensorflow as tf
+        pieces = tf.split(flat, self.sizes)
+        return {name: tf.reshape(piece, shape)
+                for name, piece, shape in zip(self.names, pieces, self.shapes)}
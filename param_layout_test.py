@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import os.path as osp
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from param_layout import ParamLayout
+
+
+class TestParamLayout(unittest.TestCase):
+
+    def setUp(self):
+        tf.reset_default_graph()
+
+    def test_views(self):
+        layout = ParamLayout(names=['b', 'w'], shapes=[(3,), (2, 3)])
+        self.assertEqual(layout.size, 9)
+        self.assertEqual(layout.offsets, [0, 3])
+
+        flat = np.arange(9, dtype=np.float32)
+        views = layout.views(flat)
+        np.testing.assert_array_equal(views['b'], [0, 1, 2])
+        np.testing.assert_array_equal(views['w'], [[3, 4, 5], [6, 7, 8]])
+        # Views should share memory with the flat vector
+        views['w'][0, 0] = -1
+        self.assertEqual(flat[3], -1)
+
+        arrays = {'b': np.zeros(3), 'w': np.ones((2, 3))}
+        np.testing.assert_array_equal(layout.flatten(arrays),
+                                      [0, 0, 0, 1, 1, 1, 1, 1, 1])
+
+    def test_save_load(self):
+        layout = ParamLayout(names=['b', 'w'], shapes=[(3,), (2, 3)])
+        flat = np.random.rand(9).astype(np.float32)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = osp.join(temp_dir, 'params.npz')
+            layout.save(path, flat)
+            loaded_layout, loaded_flat = ParamLayout.load(path)
+        self.assertEqual(loaded_layout, layout)
+        np.testing.assert_array_equal(loaded_flat, flat)
+
+    def test_scopes(self):
+        for scope in ['scope_1', 'scope_10']:
+            with tf.variable_scope(scope):
+                # Create in different orders in each scope
+                if scope == 'scope_1':
+                    tf.Variable(np.ones((2, 2)), dtype=tf.float32, name='w')
+                    tf.Variable(np.ones(2), dtype=tf.float32, name='b')
+                else:
+                    tf.Variable(np.zeros(2), dtype=tf.float32, name='b')
+                    tf.Variable(np.zeros((2, 2)), dtype=tf.float32, name='w')
+        layout_1 = ParamLayout.from_scope('scope_1')
+        layout_10 = ParamLayout.from_scope('scope_10')
+        # scope_1 shouldn't pick up scope_10's variables
+        self.assertEqual(layout_1.names, ['b', 'w'])
+        self.assertEqual(layout_1, layout_10)
+
+    def test_flatten_tensors(self):
+        layout = ParamLayout(names=['b', 'w'], shapes=[(3,), (2, 3)])
+        flat = tf.constant(np.arange(9, dtype=np.float32))
+        tensors = layout.unflatten_tensor(flat)
+        sess = tf.Session()
+        np.testing.assert_array_equal(sess.run(tensors['w']),
+                                      [[3, 4, 5], [6, 7, 8]])
+        np.testing.assert_array_equal(
+            sess.run(layout.flatten_tensors(tensors)), np.arange(9))
+
+
+if __name__ == '__main__':
+    unittest.main()
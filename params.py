@@ -4,15 +4,16 @@ import sys
 import time
 from os import path as osp
 
-import preprocessing
-from utils import get_git_rev, Timer
-
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("env_id")
     parser.add_argument("--n_steps", type=float, default=10e6)
     parser.add_argument("--n_workers", type=int, default=1)
+    parser.add_argument("--n_envs", type=int,
+                        help="No. of envs. If more than --n_workers, envs "
+                             "are shared, with each worker taking whichever "
+                             "env is ready (default: one env per worker)")
     parser.add_argument("--ckpt_interval_seconds", type=int, default=300)
     parser.add_argument("--load_ckpt")
     parser.add_argument("--seed", type=int, default=0)
@@ -32,9 +33,140 @@ def parse_args():
                         default='constant')
     parser.add_argument("--lr_decay_to_zero_by_n_steps", type=float)
     parser.add_argument("--preprocessing",
-                        choices=['generic', 'pong'],
+                        choices=['generic', 'grayscale', 'pong'],
                         default='generic')
     parser.add_argument("--wake_interval_seconds", type=int, default=60)
+    parser.add_argument("--summary_interval", type=int, default=100,
+                        help="Log scalar summaries every N updates")
+    parser.add_argument("--histogram_interval", type=int, default=1000,
+                        help="Log histogram summaries every N updates "
+                             "(0 to disable)")
+    parser.add_argument("--sync_histograms", action='store_true',
+                        help="Compute histograms in the worker thread "
+                             "rather than in a background thread")
+    parser.add_argument("--record_rollouts", action='store_true',
+                        help="Record every worker's rollouts to "
+                             "<log_dir>/rollouts")
+    parser.add_argument("--rollout_shard_size", type=int, default=20000,
+                        help="No. of steps per rollout recording shard")
+    parser.add_argument("--replay_ratio", type=float, default=0,
+                        help="Average no. of off-policy updates from replayed "
+                             "rollouts per on-policy update (0 to disable)")
+    parser.add_argument("--replay_capacity", type=int, default=2000,
+                        help="No. of rollouts to keep in the replay buffer")
+    parser.add_argument("--prefetch_rollouts", action='store_true',
+                        help="Collect each worker's next rollout in a "
+                             "separate thread while training on the "
+                             "current one")
+    parser.add_argument("--prefetch_depth", type=int, default=1,
+                        help="Max. no. of rollouts collected ahead "
+                             "(for --prefetch_rollouts)")
+    parser.add_argument("--env_driver", choices=['threads', 'asyncio'],
+                        default='threads',
+                        help="threads: step envs from worker threads; "
+                             "asyncio: step all envs from a single thread "
+                             "with one worker network, batching inference "
+                             "across envs (uses --n_envs envs)")
+    parser.add_argument("--inference_batch_size", type=int,
+                        help="Evaluate observations once this many are "
+                             "waiting (for --env_driver asyncio; "
+                             "default: no. of envs)")
+    parser.add_argument("--inference_batch_timeout_seconds", type=float,
+                        default=0.002,
+                        help="Evaluate however many observations are "
+                             "waiting after this long "
+                             "(for --env_driver asyncio)")
+    parser.add_argument("--env_start_stagger_seconds", type=float, default=0,
+                        help="Delay between starting each env process")
+    parser.add_argument("--mp_start_method",
+                        choices=['fork', 'forkserver', 'spawn'],
+                        help="How to start env processes (default: "
+                             "multiprocessing's default). forkserver imports "
+                             "gym etc. once in a server process and forks "
+                             "envs from that")
+    parser.add_argument("--env_auto_reset", action='store_true',
+                        help="Have env processes start resetting as soon "
+                             "as an episode ends, in parallel with training")
+    parser.add_argument("--start_state_pool_size", type=int, default=0,
+                        help="Save the emulator state after this many "
+                             "resets, then reset by restoring one of them "
+                             "(0 to disable)")
+    parser.add_argument("--start_state_refresh_prob", type=float,
+                        default=0.1,
+                        help="Probability of a real reset replacing a saved "
+                             "start state (for --start_state_pool_size)")
+    parser.add_argument("--intra_op_threads", type=int, default=0,
+                        help="TensorFlow intra-op thread pool size "
+                             "(0 for default)")
+    parser.add_argument("--inter_op_threads", type=int, default=0,
+                        help="TensorFlow inter-op thread pool size "
+                             "(0 for default)")
+    parser.add_argument("--pin_cpus", action='store_true',
+                        help="Pin env processes and the main process to "
+                             "separate sets of cores")
+    parser.add_argument("--conv_data_format",
+                        choices=['auto', 'channels_last', 'channels_first'],
+                        default='channels_last',
+                        help="Data layout for the network's convolutions. "
+                             "channels_first takes frame stacks as they come "
+                             "from the env, without transposing. auto picks "
+                             "channels_first with a GPU or MKL-DNN")
+    parser.add_argument("--xla", action='store_true',
+                        help="Compile the workers' networks and losses with "
+                             "XLA")
+    parser.add_argument("--optimizer",
+                        choices=['rmsprop', 'flat_rmsprop'],
+                        default='rmsprop',
+                        help="flat_rmsprop: store each copy of the "
+                             "parameters in one flat buffer, so that RMSProp "
+                             "updates all parameters and statistics with a "
+                             "single op, and syncs are a single copy")
+    parser.add_argument("--update_mode",
+                        choices=['hogwild', 'locking', 'serialized'],
+                        help="hogwild: workers apply updates concurrently "
+                             "without locking (default); "
+                             "locking: lock each variable while updating it; "
+                             "serialized: apply all updates from a single "
+                             "updater thread")
+    parser.add_argument("--accumulate_n", type=int, default=0,
+                        help="Apply the mean of every N gradients from "
+                             "workers in a single update "
+                             "(implies --update_mode serialized)")
+    parser.add_argument("--max_staleness", type=int,
+                        help="Drop gradients calculated with parameters more "
+                             "than this many updates old "
+                             "(for --accumulate_n; default 8)")
+    parser.add_argument("--shared_worker_graph", action='store_true',
+                        help="Have all workers share one network computing "
+                             "directly on the global parameters, rather than "
+                             "each having its own copy, so that the graph "
+                             "doesn't grow with the number of workers")
+    parser.add_argument("--calibrate_workers", action='store_true',
+                        help="Before training, measure throughput with "
+                             "increasing numbers of workers and train with "
+                             "the number at the throughput knee "
+                             "(overrides --n_workers)")
+    parser.add_argument("--calibrate_max_workers", type=int,
+                        help="Largest no. of workers to try "
+                             "(default: no. of available cores)")
+    parser.add_argument("--calibrate_warmup_seconds", type=float,
+                        default=10)
+    parser.add_argument("--calibrate_phase_seconds", type=float, default=30)
+    parser.add_argument("--calibrate_tolerance", type=float, default=0.1,
+                        help="Choose the smallest no. of workers within this "
+                             "fraction of the best throughput")
+    parser.add_argument("--impala", action='store_true',
+                        help="Use n_workers inference-only actors and a "
+                             "single learner with V-trace correction")
+    parser.add_argument("--learner_batch_size", type=int, default=16,
+                        help="No. of trajectories per learner update "
+                             "(for --impala)")
+    parser.add_argument("--trajectory_queue_size", type=int, default=64,
+                        help="Max. no. of trajectories waiting for the "
+                             "learner (for --impala)")
+    parser.add_argument("--actor_sync_interval", type=int, default=4,
+                        help="Sync actors' parameters every N trajectories "
+                             "(for --impala)")
 
     group = parser.add_mutually_exclusive_group()
     group.add_argument('--log_dir')
@@ -45,11 +177,56 @@ def parse_args():
     args = parser.parse_args()
 
     lr_args = check_lr_args(args, parser)
+    if args.impala and args.replay_ratio > 0:
+        parser.error("--replay_ratio isn't supported with --impala")
+    if args.impala and (args.debug or args.record_rollouts):
+        parser.error("--debug and --record_rollouts aren't supported "
+                     "with --impala")
+    if args.preprocessing == 'grayscale' and args.debug:
+        # NumberFrames draws on RGB frames, which we never see
+        parser.error("--preprocessing grayscale isn't supported with --debug")
+    if args.n_envs is not None:
+        if args.n_envs < args.n_workers:
+            parser.error("--n_envs should be at least --n_workers")
+        if args.impala and args.n_envs != args.n_workers:
+            parser.error("--impala uses one env per actor; "
+                         "--n_envs isn't supported")
+    if args.env_driver == 'asyncio' and \
+            (args.impala or args.replay_ratio > 0 or args.prefetch_rollouts or
+             args.record_rollouts or args.calibrate_workers):
+        parser.error("--env_driver asyncio isn't supported with --impala, "
+                     "--replay_ratio, --prefetch_rollouts, --record_rollouts "
+                     "or --calibrate_workers")
+    check_update_mode_args(args, parser)
+    if args.xla and args.impala:
+        parser.error("--xla isn't supported with --impala")
+    if args.shared_worker_graph and args.impala:
+        parser.error("--shared_worker_graph isn't supported with --impala")
+    if args.optimizer == 'flat_rmsprop' and args.impala:
+        parser.error("--optimizer flat_rmsprop isn't supported with --impala")
+    if args.calibrate_workers and args.impala:
+        parser.error("--calibrate_workers isn't supported with --impala")
+    # Calibration phases train with a plain set of workers, one env each, so
+    # they wouldn't measure the configuration these options ask for
+    if args.calibrate_workers and \
+            (args.update_mode == 'serialized' or args.pin_cpus or
+             args.n_envs is not None or args.replay_ratio > 0):
+        parser.error("--calibrate_workers isn't supported with "
+                     "--update_mode serialized, --accumulate_n, --pin_cpus, "
+                     "--n_envs or --replay_ratio")
     log_dir = get_log_dir(args)
     save_args(args, log_dir)
 
+    # preprocessing (which imports gym and cv2) and utils (which imports
+    # TensorFlow) are imported here rather than at the top so that --help is
+    # quick, and so that importing DISCOUNT_FACTOR doesn't pull them in
+    import preprocessing
+    from utils import Timer
+
     if args.preprocessing == 'generic':
         preprocess_wrapper = preprocessing.generic_preprocess
+    elif args.preprocessing == 'grayscale':
+        preprocess_wrapper = preprocessing.grayscale_preprocess
     elif args.preprocessing == 'pong':
         preprocess_wrapper = preprocessing.pong_preprocess
 
@@ -63,6 +240,29 @@ def parse_args():
     return args, lr_args, log_dir, preprocess_wrapper, ckpt_timer
 
 
+def check_update_mode_args(args, parser):
+    if args.accumulate_n:
+        if args.update_mode in ['hogwild', 'locking']:
+            parser.error("--accumulate_n requires --update_mode serialized")
+        args.update_mode = 'serialized'
+        if args.max_staleness is None:
+            args.max_staleness = 8
+    else:
+        if args.max_staleness is not None:
+            parser.error("--max_staleness requires --accumulate_n")
+        if args.update_mode is None:
+            args.update_mode = 'hogwild'
+        elif args.update_mode == 'serialized':
+            # The serialized updater is just an accumulator which applies
+            # every gradient it gets, however stale; hogwild and locking
+            # don't drop gradients either
+            args.accumulate_n = 1
+    if args.update_mode == 'serialized' and \
+            (args.impala or args.replay_ratio > 0):
+        parser.error("--update_mode serialized isn't supported with --impala "
+                     "or --replay_ratio")
+
+
 def check_lr_args(args, parser):
     if (args.lr_schedule == 'linear' and
             args.lr_decay_to_zero_by_n_steps is None):
@@ -85,6 +285,7 @@ def get_log_dir(args):
     if args.log_dir:
         log_dir = args.log_dir
     else:
+        from utils import get_git_rev
         git_rev = get_git_rev()
         run_name = args.run_name + '_' + git_rev
         log_dir = osp.join('runs', run_name)
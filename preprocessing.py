@@ -1,3 +1,4 @@
+import copy
 from collections import deque
 
 import cv2
@@ -149,12 +150,58 @@ class ExtractLuminanceAndScaleWrapper(ObservationWrapper):
                                             dtype=np.uint8)
 
     def observation(self, obs):
-        obs = cv2.cvtColor(obs, cv2.COLOR_RGB2GRAY)
+        if obs.ndim == 3:
+            obs = cv2.cvtColor(obs, cv2.COLOR_RGB2GRAY)
+        # (Otherwise we've got grayscale frames from ALEGrayscaleWrapper)
         # Bilinear interpolation
         obs = cv2.resize(obs, (84, 84), interpolation=cv2.INTER_LINEAR)
         return obs
 
 
+class ALEGrayscaleWrapper(Wrapper):
+    """
+    Get grayscale screens straight from the emulator, rather than having gym
+    fetch RGB screens for us to convert, so we deal with a third of the data.
+
+    Note that ALE's grayscale palette isn't quite the same as OpenCV's
+    RGB-to-grayscale conversion, and that with MaxWrapper we end up taking
+    the max. over grayscale frames rather than RGB frames, so frames aren't
+    identical to generic_preprocess's (see preprocessing_test.py).
+
+    Should wrap the raw Atari env.
+    """
+
+    def __init__(self, env):
+        Wrapper.__init__(self, env)
+        self.ale = env.unwrapped.ale
+        # Stop gym fetching RGB screens. (Fetching RAM instead is cheap.)
+        env.unwrapped._obs_type = 'ram'
+        width, height = self.ale.getScreenDims()
+        self.observation_space = spaces.Box(low=0, high=255,
+                                            shape=(height, width),
+                                            dtype=np.uint8)
+        # Screens are written into preallocated buffers. We alternate
+        # between two so that the previous screen is still intact for
+        # MaxWrapper.
+        self.buffers = [np.empty((height, width), dtype=np.uint8)
+                        for _ in range(2)]
+        self.buffer_n = 0
+
+    def get_screen(self):
+        screen = self.buffers[self.buffer_n]
+        self.buffer_n = 1 - self.buffer_n
+        self.ale.getScreenGrayscale(screen)
+        return screen
+
+    def reset(self):
+        self.env.reset()
+        return self.get_screen()
+
+    def step(self, action):
+        _, reward, done, info = self.env.step(action)
+        return self.get_screen(), reward, done, info
+
+
 class FrameStackWrapper(Wrapper):
     """
     Stack the most recent 4 frames together.
@@ -242,6 +289,80 @@ class NormalizeWrapper(ObservationWrapper):
         return obs / 255.0
 
 
+class StartStatePoolWrapper(Wrapper):
+    """
+    Speed up resets by restoring a saved start state rather than running
+    no-ops (and the initial frame maxing and stacking) on every reset.
+
+    The first pool_size resets are real resets; after each one we save the
+    emulator state (with ALE's cloneState) together with the state of the
+    wrappers below us. Later resets restore one of those states at random.
+    Since each saved state comes from a real reset with a random number of
+    no-ops, the distribution of starts is preserved, though there are only
+    pool_size distinct starts at any one time; with probability
+    refresh_prob, we do a real reset and replace a random pool entry.
+
+    Should wrap the whole preprocessing stack.
+    """
+
+    # Wrapper attributes which need restoring along with the emulator state
+    STATE_ATTRS = ['frame_pairs',  # MaxWrapper
+                   'frame_stack',  # FrameStackWrapper
+                   'frames_since_reset',  # NumberFrames
+                   '_elapsed_steps']  # gym's TimeLimit
+
+    def __init__(self, env, pool_size, refresh_prob=0.0):
+        Wrapper.__init__(self, env)
+        self.pool_size = pool_size
+        self.refresh_prob = refresh_prob
+        self.pool = []
+
+    def wrappers(self):
+        env = self.env
+        while True:
+            yield env
+            if not hasattr(env, 'env'):
+                break
+            env = env.env
+
+    def save_state(self, obs):
+        wrapper_states = []
+        for wrapper in self.wrappers():
+            for attr in self.STATE_ATTRS:
+                if attr in vars(wrapper):
+                    # Deep copy, in case frames are buffers which get
+                    # reused (see ALEGrayscaleWrapper)
+                    value = copy.deepcopy(getattr(wrapper, attr))
+                    wrapper_states.append((wrapper, attr, value))
+        ale_state = self.env.unwrapped.ale.cloneState()
+        return ale_state, wrapper_states, obs
+
+    def restore_state(self, state):
+        ale_state, wrapper_states, obs = state
+        self.env.unwrapped.ale.restoreState(ale_state)
+        for wrapper, attr, value in wrapper_states:
+            # Copy again so that the saved state isn't modified
+            setattr(wrapper, attr, copy.copy(value))
+        return obs.copy()
+
+    def reset(self):
+        pool_full = (len(self.pool) == self.pool_size)
+        if pool_full and np.random.rand() >= self.refresh_prob:
+            state = self.pool[np.random.randint(len(self.pool))]
+            return self.restore_state(state)
+
+        obs = self.env.reset()
+        state = self.save_state(obs)
+        if pool_full:
+            self.pool[np.random.randint(len(self.pool))] = state
+        else:
+            self.pool.append(state)
+        return obs
+
+    def step(self, action):
+        return self.env.step(action)
+
+
 def generic_preprocess(env, max_n_noops):
     """
     Apply the full sequence of preprocessing steps as specified in the paper.
@@ -255,6 +376,14 @@ def generic_preprocess(env, max_n_noops):
     return env
 
 
+def grayscale_preprocess(env, max_n_noops):
+    """
+    As generic_preprocess, but with grayscale screens from the emulator.
+    """
+    env = ALEGrayscaleWrapper(env)
+    return generic_preprocess(env, max_n_noops)
+
+
 """
 We also have a wrapper to extract hand-crafted features from Pong for early 
 debug testing.
@@ -8,7 +8,8 @@ from numpy.testing import assert_array_equal
 
 from debug_wrappers import NumberFrames, ConcatFrameStack
 from preprocessing import MaxWrapper, FrameStackWrapper, FrameSkipWrapper, \
-    ExtractLuminanceAndScaleWrapper, generic_preprocess, pong_preprocess
+    ExtractLuminanceAndScaleWrapper, generic_preprocess, pong_preprocess, \
+    StartStatePoolWrapper, grayscale_preprocess
 
 """
 Tests for preprocessing and environment tweak wrappers.
@@ -79,6 +80,33 @@ class DummyEnv(gym.Env):
         return obs, reward, done, info
 
 
+class DummyALE:
+    """
+    Stand-in for ALE's state cloning; DummyEnv's only state is step_n.
+    """
+
+    def __init__(self, env):
+        self.env = env
+
+    def cloneState(self):
+        return self.env.step_n
+
+    def restoreState(self, state):
+        self.env.step_n = state
+
+
+class DummyALEEnv(DummyEnv):
+
+    def __init__(self):
+        DummyEnv.__init__(self)
+        self.ale = DummyALE(self)
+        self.n_resets = 0
+
+    def reset(self):
+        self.n_resets += 1
+        return DummyEnv.reset(self)
+
+
 class TestPreprocessing(unittest.TestCase):
 
     def test_max_wrapper(self):
@@ -206,6 +234,65 @@ class TestPreprocessing(unittest.TestCase):
         # Then 23 + 24 + 25 + 27.
         self.assertEqual(r3, 98)
 
+    def test_start_state_pool(self):
+        np.random.seed(0)
+        env = DummyALEEnv()
+        env_wrapped = StartStatePoolWrapper(
+            generic_preprocess(env, max_n_noops=5), pool_size=3)
+
+        for _ in range(3):
+            env_wrapped.reset()
+        self.assertEqual(env.n_resets, 3)
+
+        for _ in range(10):
+            obs = env_wrapped.reset()
+            # Once the pool is full, resets shouldn't touch the real env
+            self.assertEqual(env.n_resets, 3)
+            # If the emulator state was restored properly, we should get
+            # the rewards for the 4 raw steps from the restored step
+            step_n = env.step_n
+            obs2, reward, _, _ = env_wrapped.step(0)
+            self.assertEqual(reward, sum(range(step_n + 1, step_n + 5)))
+            # If the frame stack was restored properly, frames should have
+            # shifted along by one
+            assert_array_equal(obs2[:-1], obs[1:])
+
+        # With refresh_prob=1, every reset should be a real reset
+        env_wrapped.refresh_prob = 1
+        env_wrapped.reset()
+        self.assertEqual(env.n_resets, 4)
+        self.assertEqual(len(env_wrapped.pool), 3)
+
+    def test_grayscale_preprocessing(self):
+        """
+        Quantify how different frames from grayscale_preprocess are from
+        generic_preprocess's, playing the same actions in the same game.
+        """
+        envs = []
+        for preprocess in [generic_preprocess, grayscale_preprocess]:
+            env = gym.make('PongNoFrameskip-v4')
+            env.seed(0)
+            envs.append(preprocess(env, max_n_noops=0))
+        obs_generic = envs[0].reset()
+        obs_grayscale = envs[1].reset()
+        diffs = [np.abs(obs_generic - obs_grayscale)]
+        np.random.seed(0)
+        for _ in range(200):
+            action = np.random.randint(envs[0].action_space.n)
+            obs_generic, r_generic, done, _ = envs[0].step(action)
+            obs_grayscale, r_grayscale, _, _ = envs[1].step(action)
+            # Same game, so we should get the same rewards
+            self.assertEqual(r_generic, r_grayscale)
+            diffs.append(np.abs(obs_generic - obs_grayscale))
+            if done:
+                break
+        diffs = np.array(diffs)
+        # Observations are in [0, 1]. Palettes differ slightly, but frames
+        # should look basically the same: small differences on average, and
+        # very few pixels which differ noticeably.
+        self.assertLess(np.mean(diffs), 0.02)
+        self.assertLess(np.mean(diffs > 0.1), 0.01)
+
     @staticmethod
     def check_full_preprocessing():
         """
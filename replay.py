@@ -0,0 +1,86 @@
+import random
+from threading import Lock
+
+import numpy as np
+
+"""
+Experience replay for learning off-policy from old rollouts, in the style of
+Wang et al., 2016, 'Sample Efficient Actor-Critic with Experience Replay'.
+"""
+
+
+def states_to_uint8(states):
+    # Observations are in [0, 1], either from NormalizeWrapper dividing
+    # uint8 frames by 255 or from PongFeaturesWrapper's 0s and 1s, so
+    # this is lossless
+    return np.rint(np.asarray(states) * 255).astype(np.uint8)
+
+
+def states_from_uint8(states):
+    return states.astype(np.float32) / 255.0
+
+
+class ReplayBuffer:
+    """
+    A fixed-capacity ring buffer of rollouts, shared between worker threads.
+
+    Storage is preallocated, with states stored as uint8.
+    """
+
+    def __init__(self, capacity, max_rollout_len, state_shape):
+        self.capacity = capacity
+        self.lock = Lock()
+        self.states = np.zeros((capacity, max_rollout_len) + state_shape,
+                               dtype=np.uint8)
+        # State after the last step of each rollout, for bootstrapping
+        self.last_states = np.zeros((capacity,) + state_shape,
+                                    dtype=np.uint8)
+        self.actions = np.zeros((capacity, max_rollout_len), dtype=np.int64)
+        self.rewards = np.zeros((capacity, max_rollout_len), dtype=np.float32)
+        # Probability of each action taken under the behaviour policy
+        self.behaviour_probs = np.zeros((capacity, max_rollout_len),
+                                        dtype=np.float32)
+        self.lengths = np.zeros(capacity, dtype=np.int32)
+        self.dones = np.zeros(capacity, dtype=np.bool_)
+        self.next_idx = 0
+        self.n_stored = 0
+
+    def __len__(self):
+        return self.n_stored
+
+    def add(self, states, actions, rewards, behaviour_probs, last_state,
+            done):
+        n = len(actions)
+        states = states_to_uint8(states)
+        last_state = states_to_uint8(last_state)
+        with self.lock:
+            i = self.next_idx
+            self.states[i, :n] = states
+            self.last_states[i] = last_state
+            self.actions[i, :n] = actions
+            self.rewards[i, :n] = rewards
+            self.behaviour_probs[i, :n] = behaviour_probs
+            self.lengths[i] = n
+            self.dones[i] = done
+            self.next_idx = (self.next_idx + 1) % self.capacity
+            self.n_stored = min(self.n_stored + 1, self.capacity)
+
+    def sample(self):
+        """
+        Sample one rollout uniformly at random.
+        Returns None if the buffer is empty.
+        """
+        with self.lock:
+            if self.n_stored == 0:
+                return None
+            i = random.randrange(self.n_stored)
+            n = self.lengths[i]
+            # Copy while we hold the lock, so that the slot can't be
+            # overwritten while the caller is using it
+            rollout = {'states': states_from_uint8(self.states[i, :n]),
+                       'last_state': states_from_uint8(self.last_states[i]),
+                       'actions': self.actions[i, :n].copy(),
+                       'rewards': self.rewards[i, :n].copy(),
+                       'behaviour_probs': self.behaviour_probs[i, :n].copy(),
+                       'done': bool(self.dones[i])}
+        return rollout
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+import unittest
+
+import numpy as np
+
+from replay import ReplayBuffer
+
+
+class TestReplayBuffer(unittest.TestCase):
+
+    def test_add_sample(self):
+        buffer = ReplayBuffer(capacity=2, max_rollout_len=5,
+                              state_shape=(84, 84, 4))
+        self.assertIsNone(buffer.sample())
+
+        states = [np.full((84, 84, 4), i / 255.0) for i in range(3)]
+        last_state = np.full((84, 84, 4), 1.0)
+        buffer.add(states, actions=[0, 1, 2], rewards=[1., 2., 3.],
+                   behaviour_probs=[0.1, 0.2, 0.3],
+                   last_state=last_state, done=True)
+        self.assertEqual(len(buffer), 1)
+
+        rollout = buffer.sample()
+        # States should survive the trip through uint8
+        np.testing.assert_allclose(rollout['states'], states, atol=1e-6)
+        np.testing.assert_allclose(rollout['last_state'], last_state)
+        np.testing.assert_array_equal(rollout['actions'], [0, 1, 2])
+        np.testing.assert_allclose(rollout['rewards'], [1., 2., 3.])
+        np.testing.assert_allclose(rollout['behaviour_probs'],
+                                   [0.1, 0.2, 0.3])
+        self.assertTrue(rollout['done'])
+
+    def test_capacity(self):
+        buffer = ReplayBuffer(capacity=2, max_rollout_len=1,
+                              state_shape=(1,))
+        for i in range(5):
+            buffer.add([[0.0]], actions=[i], rewards=[0.], behaviour_probs=[1.],
+                       last_state=[0.0], done=False)
+        self.assertEqual(len(buffer), 2)
+        # Only the two most recent rollouts should be left
+        sampled_actions = {buffer.sample()['actions'][0] for _ in range(100)}
+        self.assertEqual(sampled_actions, {3, 4})
+
+
+if __name__ == '__main__':
+    unittest.main()
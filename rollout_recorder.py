@@ -0,0 +1,210 @@
+import json
+import os
+import os.path as osp
+import queue
+import re
+import time
+from threading import Thread
+
+import numpy as np
+
+"""
+Record what workers see and do to disk, for offline analysis and replay.
+
+Each worker records to its own directory, split into shards of a fixed number
+of steps:
+
+  <record_dir>/shard_<n>/states.npy    uint8, states scaled to [0, 255]
+                         actions.npy   int32
+                         rewards.npy   float32
+                         returns.npy   float32
+                         values.npy    float32, value estimates
+                         dones.npy     bool, True on the last step of an episode
+                         meta.json     how many steps have been written so far
+
+Shard arrays are preallocated .npy files, written through memory maps. Writing
+happens on a background thread, and if the thread falls behind, rollouts are
+dropped (and counted) rather than slowing down the worker.
+"""
+
+FIELDS = [('states', np.uint8),
+          ('actions', np.int32),
+          ('rewards', np.float32),
+          ('returns', np.float32),
+          ('values', np.float32),
+          ('dones', np.bool_)]
+SHARD_DIRNAME_RE = re.compile(r'shard_(\d+)$')
+
+
+def write_meta(shard_dir, n_steps):
+    tmp_path = osp.join(shard_dir, 'meta.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({'n_steps': n_steps}, f)
+    os.replace(tmp_path, osp.join(shard_dir, 'meta.json'))
+
+
+class RolloutRecorder:
+    STOP_CMD = None
+
+    def __init__(self, record_dir, shard_size=20000, max_pending=64,
+                 meta_interval_seconds=1.0):
+        self.record_dir = record_dir
+        self.shard_size = shard_size
+        self.meta_interval_seconds = meta_interval_seconds
+        os.makedirs(record_dir, exist_ok=True)
+
+        self.shard_n = -1
+        self.shard_dir = None
+        self.shard = None
+        self.shard_pos = None
+        self.last_meta_time = None
+        # Scratch buffer for converting states to uint8, allocated once we
+        # know the shape of states
+        self.scratch = None
+
+        self.n_recorded = 0
+        self.n_dropped = 0
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.t = Thread(target=self.write_loop, daemon=True)
+        self.t.start()
+
+    def record(self, states, actions, rewards, returns, values, done):
+        """
+        Record one rollout. states, actions, etc. should be per-step lists
+        which the caller won't modify afterwards.
+        """
+        try:
+            self.pending.put_nowait((states, actions, rewards, returns,
+                                     values, done))
+        except queue.Full:
+            self.n_dropped += 1
+
+    def write_loop(self):
+        while True:
+            item = self.pending.get()
+            if item is self.STOP_CMD:
+                break
+            self.write(*item)
+
+    def new_shard(self, state_shape):
+        if self.shard is not None:
+            self.finish_shard()
+        self.shard_n += 1
+        self.shard_dir = osp.join(self.record_dir,
+                                  'shard_{:05d}'.format(self.shard_n))
+        os.makedirs(self.shard_dir)
+        self.shard = {}
+        for name, dtype in FIELDS:
+            if name == 'states':
+                shape = (self.shard_size,) + state_shape
+            else:
+                shape = (self.shard_size,)
+            path = osp.join(self.shard_dir, name + '.npy')
+            self.shard[name] = np.lib.format.open_memmap(path, mode='w+',
+                                                         dtype=dtype,
+                                                         shape=shape)
+        self.shard_pos = 0
+        write_meta(self.shard_dir, 0)
+        self.last_meta_time = time.time()
+
+    def finish_shard(self):
+        for array in self.shard.values():
+            array.flush()
+        write_meta(self.shard_dir, self.shard_pos)
+
+    def write(self, states, actions, rewards, returns, values, done):
+        n_steps = len(actions)
+        state_shape = np.shape(states[0])
+        if self.scratch is None or self.scratch.shape[0] < n_steps:
+            self.scratch = np.zeros((n_steps,) + state_shape,
+                                    dtype=np.float32)
+        scratch = self.scratch[:n_steps]
+        np.stack(states, out=scratch)
+        np.multiply(scratch, 255, out=scratch)
+        np.rint(scratch, out=scratch)
+
+        dones = np.zeros(n_steps, dtype=np.bool_)
+        dones[-1] = done
+        columns = {'states': scratch,
+                   'actions': actions,
+                   'rewards': rewards,
+                   'returns': returns,
+                   'values': values,
+                   'dones': dones}
+
+        # A rollout may straddle two shards
+        written = 0
+        while written < n_steps:
+            if self.shard is None or self.shard_pos == self.shard_size:
+                self.new_shard(state_shape)
+            n = min(n_steps - written, self.shard_size - self.shard_pos)
+            for name, array in self.shard.items():
+                array[self.shard_pos:self.shard_pos + n] = \
+                    columns[name][written:written + n]
+            self.shard_pos += n
+            written += n
+        self.n_recorded += n_steps
+
+        if time.time() - self.last_meta_time > self.meta_interval_seconds:
+            write_meta(self.shard_dir, self.shard_pos)
+            self.last_meta_time = time.time()
+
+    def close(self):
+        self.pending.put(self.STOP_CMD)
+        self.t.join()
+        if self.shard is not None:
+            self.finish_shard()
+
+
+class RolloutReader:
+    """
+    Read rollouts recorded by one worker's RolloutRecorder. Arrays are
+    memory-mapped, so only the parts actually accessed are read from disk.
+    """
+
+    def __init__(self, record_dir):
+        self.record_dir = record_dir
+
+    def shard_dirs(self):
+        dirnames = [d for d in os.listdir(self.record_dir)
+                    if SHARD_DIRNAME_RE.match(d)]
+        return [osp.join(self.record_dir, d) for d in sorted(dirnames)]
+
+    @staticmethod
+    def load_shard(shard_dir):
+        with open(osp.join(shard_dir, 'meta.json')) as f:
+            n_steps = json.load(f)['n_steps']
+        shard = {}
+        for name, _ in FIELDS:
+            path = osp.join(shard_dir, name + '.npy')
+            shard[name] = np.load(path, mmap_mode='r')[:n_steps]
+        return shard
+
+    def shards(self):
+        for shard_dir in self.shard_dirs():
+            yield self.load_shard(shard_dir)
+
+    def __len__(self):
+        return sum(len(shard['actions']) for shard in self.shards())
+
+    def iter_episodes(self):
+        """
+        Yield one dict of arrays per complete episode. Episodes spanning
+        shards are stitched together (which means copying them).
+        """
+        partial = []
+        for shard in self.shards():
+            episode_ends = np.nonzero(shard['dones'])[0]
+            start = 0
+            for end in episode_ends:
+                piece = {k: v[start:end + 1] for k, v in shard.items()}
+                if partial:
+                    partial.append(piece)
+                    yield {k: np.concatenate([p[k] for p in partial])
+                           for k in piece}
+                    partial = []
+                else:
+                    yield piece
+                start = end + 1
+            if start < len(shard['dones']):
+                partial.append({k: v[start:] for k, v in shard.items()})
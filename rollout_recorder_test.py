@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import tempfile
+import unittest
+
+import numpy as np
+
+from rollout_recorder import RolloutRecorder, RolloutReader
+
+
+def make_rollout(n_steps, first_step, done):
+    # Make states identifiable by step number
+    states = [np.full((84, 84, 4), (first_step + i) / 255.0)
+              for i in range(n_steps)]
+    actions = [(first_step + i) % 6 for i in range(n_steps)]
+    rewards = [float(first_step + i) for i in range(n_steps)]
+    returns = [2.0 * (first_step + i) for i in range(n_steps)]
+    values = [3.0 * (first_step + i) for i in range(n_steps)]
+    return states, actions, rewards, returns, values, done
+
+
+class TestRolloutRecorder(unittest.TestCase):
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Use a shard size which isn't a multiple of the rollout length
+            # so that some rollouts straddle shards
+            recorder = RolloutRecorder(temp_dir, shard_size=7)
+            recorder.record(*make_rollout(5, first_step=0, done=False))
+            recorder.record(*make_rollout(3, first_step=5, done=True))
+            recorder.record(*make_rollout(5, first_step=8, done=False))
+            recorder.record(*make_rollout(2, first_step=13, done=True))
+            recorder.close()
+            self.assertEqual(recorder.n_dropped, 0)
+
+            reader = RolloutReader(temp_dir)
+            self.assertEqual(len(reader.shard_dirs()), 3)
+            self.assertEqual(len(reader), 15)
+
+            episodes = list(reader.iter_episodes())
+            self.assertEqual(len(episodes), 2)
+            self.assertEqual(len(episodes[0]['actions']), 8)
+            self.assertEqual(len(episodes[1]['actions']), 7)
+
+            steps = np.concatenate([np.arange(0, 8), np.arange(8, 15)])
+            all_episodes = {k: np.concatenate([e[k] for e in episodes])
+                            for k in episodes[0]}
+            np.testing.assert_array_equal(all_episodes['states'][:, 0, 0, 0],
+                                          steps)
+            self.assertEqual(all_episodes['states'].dtype, np.uint8)
+            np.testing.assert_array_equal(all_episodes['actions'], steps % 6)
+            np.testing.assert_array_equal(all_episodes['rewards'], steps)
+            np.testing.assert_array_equal(all_episodes['returns'], 2 * steps)
+            np.testing.assert_array_equal(all_episodes['values'], 3 * steps)
+            np.testing.assert_array_equal(np.nonzero(all_episodes['dones'])[0],
+                                          [7, 14])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,43 +1,50 @@
 #!/usr/bin/env python3
 
 """
-Run a trained agent from a checkpoint.
+Run a trained agent from a checkpoint, or from parameters exported with
+numpy_network.py (in which case TensorFlow isn't needed).
 """
 
 import argparse
 import time
 
-import gym
 import numpy as np
-import tensorflow as tf
-
-from network import make_inference_network
-from preprocessing import generic_preprocess
 
 
 def main():
     args = parse_args()
+    # Imported after parsing arguments so that --help is quick
+    import gym
+    from preprocessing import generic_preprocess
+
     env = gym.make(args.env_id)
     env = generic_preprocess(env, max_n_noops=0)
-    sess, obs_placeholder, action_probs_op = \
-        get_network(args.ckpt_dir, env.action_space.n)
-    run_agent(env, sess, obs_placeholder, action_probs_op)
+    if args.ckpt_dir.endswith('.npz'):
+        get_action_probs = get_numpy_network(args.ckpt_dir)
+    else:
+        get_action_probs = get_network(args.ckpt_dir, env.action_space.n)
+    run_agent(env, get_action_probs)
 
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("env_id")
-    parser.add_argument("ckpt_dir")
+    parser.add_argument("ckpt_dir",
+                        help="Checkpoint directory, or .npz file from "
+                             "numpy_network.py")
     args = parser.parse_args()
     return args
 
 
 def get_network(ckpt_dir, n_actions):
+    import tensorflow as tf
+    from network import make_inference_network
+
     sess = tf.Session()
 
     with tf.variable_scope('global'):
         obs_placeholder, _, action_probs_op, _, _ = \
-            make_inference_network(n_actions, weight_inits='glorot', debug=False)
+            make_inference_network(n_actions, weight_inits='glorot')
 
     ckpt_file = tf.train.latest_checkpoint(ckpt_dir)
     if not ckpt_file:
@@ -46,18 +53,33 @@ def get_network(ckpt_dir, n_actions):
     saver = tf.train.Saver()
     saver.restore(sess, ckpt_file)
 
-    return sess, obs_placeholder, action_probs_op
+    def get_action_probs(s):
+        return sess.run(action_probs_op, feed_dict={obs_placeholder: [s]})[0]
+
+    return get_action_probs
+
+
+def get_numpy_network(npz_path):
+    from numpy_network import NumpyNetwork
+
+    print("Loading parameters from '{}'".format(npz_path))
+    network = NumpyNetwork.load(npz_path)
+
+    def get_action_probs(s):
+        action_probs, _ = network.forward([s])
+        return action_probs[0]
+
+    return get_action_probs
 
 
-def run_agent(env, sess, obs_placeholder, action_probs_op):
+def run_agent(env, get_action_probs):
     while True:
         obs = env.reset()
         episode_reward = 0
         done = False
         while not done:
             s = np.moveaxis(obs, 0, -1)
-            feed_dict = {obs_placeholder: [s]}
-            action_probs = sess.run(action_probs_op, feed_dict)[0]
+            action_probs = get_action_probs(s)
             action = np.random.choice(env.action_space.n, p=action_probs)
             obs, reward, done, _ = env.step(action)
             episode_reward += reward
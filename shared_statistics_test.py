@@ -6,7 +6,7 @@ import gym
 import tensorflow as tf
 
 import utils
-from network import make_inference_network, Network
+from network import make_inference_network, Network, flat_params_getter
 from preprocessing import generic_preprocess
 from worker import Worker
 
@@ -40,8 +40,7 @@ class TestSharedStatistics(unittest.TestCase):
                            weight_inits='glorot',
                            max_grad_norm=0.5,
                            optimizer=optimizer,
-                           summaries=False,
-                           debug=False)
+                           summaries=False)
         Worker(sess=sess, env=env, network=network1, log_dir='/tmp')
 
         vars1 = optimizer.variables()
@@ -53,8 +52,7 @@ class TestSharedStatistics(unittest.TestCase):
                            weight_inits='glorot',
                            max_grad_norm=0.5,
                            optimizer=optimizer,
-                           summaries=False,
-                           debug=False)
+                           summaries=False)
         Worker(sess=sess, env=env, network=network2, log_dir='/tmp')
 
         vars2 = optimizer.variables()
@@ -74,14 +72,24 @@ class TestSharedStatistics(unittest.TestCase):
         Test 2: to be sure, let's do an end-to-end test to make sure updates
         on one worker are actually affecting updates on another worker.
         """
+        self.check_shared_statistics(flat_params=False)
 
+    def test_shared_statistics_flat(self):
+        """
+        Test 3: the same with flat parameters, where the statistics for all
+        parameters are in a single slot.
+        """
+        self.check_shared_statistics(flat_params=True)
+
+    def check_shared_statistics(self, flat_params):
         # First, we'll do two a run where we deliberately reset RMSprop
         # statistics between worker 1's update and worker 2's update.
         # We'll record what the variables look like at the start, after the
         # worker 1's update, and after worker 2's update.
         vars_sum_init_1, \
         vars_sum_post_w1_update_1, \
-        vars_sum_post_w2_update_1 = run_weight_test(reset_rmsprop=True)
+        vars_sum_post_w2_update_1 = run_weight_test(
+            reset_rmsprop=True, flat_params=flat_params)
 
         # We'll want to do a another run where we don't reset RMSprop
         # statistics, and check that worker 2's update is different. But
@@ -91,7 +99,8 @@ class TestSharedStatistics(unittest.TestCase):
         # of random seeding or something.
         vars_sum_init_2, \
         vars_sum_post_w1_update_2, \
-        vars_sum_post_w2_update_2 = run_weight_test(reset_rmsprop=True)
+        vars_sum_post_w2_update_2 = run_weight_test(
+            reset_rmsprop=True, flat_params=flat_params)
         self.assertEqual(vars_sum_init_1, vars_sum_init_2)
         self.assertEqual(vars_sum_post_w1_update_1, vars_sum_post_w1_update_2)
         self.assertEqual(vars_sum_post_w2_update_1, vars_sum_post_w2_update_2)
@@ -99,7 +108,8 @@ class TestSharedStatistics(unittest.TestCase):
         # OK, now we run without RMSprop statistics reset.
         vars_sum_init_3, \
         vars_sum_post_w1_update_3, \
-        vars_sum_post_w2_update_3 = run_weight_test(reset_rmsprop=False)
+        vars_sum_post_w2_update_3 = run_weight_test(
+            reset_rmsprop=False, flat_params=flat_params)
         # The weights before any updates should be the same as before.
         self.assertEqual(vars_sum_init_2, vars_sum_init_3)
         # The weights after worker 1's update should also be the same.
@@ -114,14 +124,19 @@ def get_var_sum(vars):
     return tf.reduce_sum([tf.reduce_sum(v) for v in vars])
 
 
-def run_weight_test(reset_rmsprop):
+def run_weight_test(reset_rmsprop, flat_params=False):
     tf.reset_default_graph()
     utils.set_random_seeds(0)
     sess = tf.Session()
     env = generic_preprocess(gym.make('Pong-v0'), max_n_noops=0)
     env.seed(0)
 
-    with tf.variable_scope('global'):
+    if flat_params:
+        custom_getter = flat_params_getter('global', env.action_space.n,
+                                           weight_inits='glorot')
+    else:
+        custom_getter = None
+    with tf.variable_scope('global', custom_getter=custom_getter):
         make_inference_network(n_actions=env.action_space.n,
                                weight_inits='glorot')
     shared_variables = tf.global_variables()
@@ -137,7 +152,7 @@ def run_weight_test(reset_rmsprop):
                        max_grad_norm=0.5,
                        optimizer=optimizer,
                        summaries=False,
-                       debug=False)
+                       flat_params=flat_params)
     w1 = Worker(sess=sess, env=env, network=network1, log_dir='/tmp')
 
     network2 = Network(scope="worker_2",
@@ -148,7 +163,7 @@ def run_weight_test(reset_rmsprop):
                        max_grad_norm=0.5,
                        optimizer=optimizer,
                        summaries=False,
-                       debug=False)
+                       flat_params=flat_params)
     w2 = Worker(sess=sess, env=env, network=network2, log_dir='/tmp')
 
     rmsprop_init_ops = [v.initializer for v in optimizer.variables()]
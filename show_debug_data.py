@@ -3,62 +3,70 @@
 """
 Show data (e.g. observations) dumped from the network in debug mode.
 
-To get that data, run with --debug and pipe stderr to a log file, e.g.:
-  python3 train.py PongNoFrameskip-v4 --debug 2> log
+To get that data, run with --debug, e.g.:
+  python3 train.py PongNoFrameskip-v4 --debug --log_dir runs/debug
+then:
+  python3 show_debug_data.py runs/debug/debug --worker 0 --updates 10:20
 """
 
 import argparse
-import hashlib
-import re
+import sys
 
-from pylab import *
+import numpy as np
+
+from debug_dump import DebugDumps
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('log_file', type=argparse.FileType('r'))
+    parser.add_argument('debug_dir')
+    parser.add_argument('--worker', type=int,
+                        help="Only show data from this worker")
+    parser.add_argument('--updates',
+                        help="Only show data from this range of updates, "
+                             "e.g. 10:20")
+    parser.add_argument('--data_type', nargs='+',
+                        choices=['observations', 'actions', 'returns'],
+                        default=['observations', 'actions', 'returns'])
     args = parser.parse_args()
 
-    for line in args.log_file:
-        # We're looking for something like
-        #   debug observations:[data]
-
-        if not line.startswith('debug'):
-            continue
-
-        tag, data_str = line.split(':')
-        data = parse_array(data_str)
-        data_type = tag.split(' ')[1]
-
-        if data_type == 'observations':
-            show_observations(data)
-        elif data_type == 'returns':
-            plot_data(data, 'Returns')
-        elif data_type == 'actions':
-            plot_data(data, 'Actions')
-
-
-def parse_array(line):
-    # Massage tf.Print output into a form that we can eval()
-    line = re.sub('([0-9]) ', '\\1, ', line)
-    line = re.sub('\]', '], ', line)
-
-    array = np.array(eval(line)[0])
-    sha = hashlib.sha256(str.encode(line)).hexdigest()[:8]
-    print("Found array with shape {}; sha256 {}".format(array.shape, sha))
-
-    return array
+    dumps = DebugDumps(args.debug_dir)
+    if args.worker is not None:
+        workers = [args.worker]
+    else:
+        workers = dumps.workers()
+    update_range = parse_range(args.updates)
+
+    for worker_n in workers:
+        for update_n in dumps.updates(worker_n):
+            if update_n not in update_range:
+                continue
+            print("Worker {}, update {}".format(worker_n, update_n))
+            # Arrays are only decompressed when we access them
+            data = dumps.load(worker_n, update_n)
+            if 'observations' in args.data_type:
+                show_observations(data['observations'])
+            if 'returns' in args.data_type:
+                plot_data(data['returns'], 'Returns')
+            if 'actions' in args.data_type:
+                plot_data(data['actions'], 'Actions')
+
+
+def parse_range(range_str):
+    if range_str is None:
+        return range(0, sys.maxsize)
+    start, end = range_str.split(':')
+    start = int(start) if start else 0
+    end = int(end) if end else sys.maxsize
+    return range(start, end)
 
 
 def show_observations(array):
     obs = array
-    if obs.shape == (1, 80, 80, 4) or obs.shape == (1, 84, 84, 4):
-        # A single frame (passed through the network when selecting an action)
-        # Stack frames in stack (axis 3) horizontally
-        obs = obs[0]
-        obs = np.moveaxis(obs, 2, 0)
-        obs = np.hstack(obs)
-    elif obs.shape[1:] == (80, 80, 4) or obs.shape[1:] == (84, 84, 4):
+    if obs.shape[1:] == (4, 84, 84):
+        # Fed to a network using channels-first layout
+        obs = np.moveaxis(obs, 1, -1)
+    if obs.shape[1:] == (80, 80, 4) or obs.shape[1:] == (84, 84, 4):
         # A batch of frames (passed through the network during training)
         # Stack batch items (axis 0) vertically
         obs = np.vstack(obs)
@@ -66,18 +74,22 @@ def show_observations(array):
         obs = np.moveaxis(obs, 2, 0)
         obs = np.hstack(obs)
     else:
-        print("Unsure how to deal with shape; skipping")
+        print("Unsure how to deal with shape {}; skipping".format(obs.shape))
         return
-    imshow(obs, cmap='gray')
-    show()
+    # matplotlib is imported here rather than at the top so that --help
+    # (and listing dumps) doesn't have to wait for it
+    import matplotlib.pyplot as plt
+    plt.imshow(obs, cmap='gray')
+    plt.show()
 
 
 def plot_data(data, data_type):
-    plot(data)
-    ylabel(data_type)
-    xlabel("Step")
-    tight_layout()
-    show()
+    import matplotlib.pyplot as plt
+    plt.plot(data)
+    plt.ylabel(data_type)
+    plt.xlabel("Step")
+    plt.tight_layout()
+    plt.show()
 
 
 if __name__ == '__main__':
@@ -1,18 +1,31 @@
 #!/usr/bin/env python3
 
+import multiprocessing
 import os
 import os.path as osp
 import time
-from threading import Thread
+from functools import partial
+from threading import Thread, Event
 
 import easy_tf_log
 import gym
 import tensorflow as tf
 
 import utils
+from async_env import AsyncEnvDriver
+from calibrate import (calibration_worker_counts, choose_n_workers,
+                       save_calibration)
+from cpu_affinity import available_cpus, make_cpu_layout, pin_to_cpus
+from env_pool import EnvPool
 from debug_wrappers import NumberFrames, MonitorEnv
-from network import Network, make_inference_network
+from flat_params import checkpoint_variables
+from impala import make_impala, start_impala
+from multi_scope_train_op import GradientAccumulator
+from network import Network, make_inference_network, choose_data_format, \
+    state_shape, flat_params_getter
 from params import parse_args
+from preprocessing import StartStatePoolWrapper
+from replay import ReplayBuffer
 from utils import SubProcessEnv
 from worker import Worker
 
@@ -21,14 +34,58 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '1'  # filter out INFO messages
 
 def make_networks(n_workers, n_actions,
                   weight_inits, value_loss_coef, entropy_bonus,
-                  max_grad_norm, optimizer, debug):
+                  max_grad_norm, optimizer, off_policy=False,
+                  accumulate_n=0, max_staleness=None,
+                  data_format='channels_last', shared=False, xla=False,
+                  flat_params=False):
+    """
+    With shared=True, all workers share a single network which computes
+    directly on the global parameters, so graph size and construction time
+    don't grow with the number of workers.
+
+    With flat_params=True, the global and per-worker parameters are each
+    stored in a single flat variable (see flat_params.py).
+    """
     # https://www.tensorflow.org/api_docs/python/tf/Graph notes that graph
     # construction isn't thread-safe. So we all do all graph construction
     # serially before starting the worker threads.
 
     # Create shared parameters
-    with tf.variable_scope('global'):
-        make_inference_network(n_actions=n_actions, weight_inits=weight_inits)
+    if flat_params:
+        custom_getter = flat_params_getter('global', n_actions, weight_inits,
+                                           data_format)
+    else:
+        custom_getter = None
+    with tf.variable_scope('global', custom_getter=custom_getter):
+        make_inference_network(n_actions=n_actions, weight_inits=weight_inits,
+                               data_format=data_format)
+
+    if accumulate_n:
+        # Note that this needs to be created before the worker networks so
+        # that the optimizer's slots exist when creating summaries
+        accumulator = GradientAccumulator(optimizer,
+                                          apply_scope='global',
+                                          n_to_accumulate=accumulate_n,
+                                          max_staleness=max_staleness)
+    else:
+        accumulator = None
+
+    if shared:
+        network = Network(scope='global',
+                          n_actions=n_actions,
+                          entropy_bonus=entropy_bonus,
+                          value_loss_coef=value_loss_coef,
+                          weight_inits=weight_inits,
+                          max_grad_norm=max_grad_norm,
+                          optimizer=optimizer,
+                          summaries=True,
+                          off_policy=off_policy,
+                          accumulator=accumulator,
+                          data_format=data_format,
+                          shared_params=True,
+                          xla=xla,
+                          flat_params=flat_params)
+        return [network] * n_workers, accumulator
 
     # Create per-worker copies of shared parameters
     worker_networks = []
@@ -43,19 +100,61 @@ def make_networks(n_workers, n_actions,
                           max_grad_norm=max_grad_norm,
                           optimizer=optimizer,
                           summaries=create_summary_ops,
-                          debug=debug)
+                          off_policy=off_policy,
+                          accumulator=accumulator,
+                          data_format=data_format,
+                          xla=xla,
+                          flat_params=flat_params)
         worker_networks.append(network)
-    return worker_networks
-
-
-def make_workers(sess, envs, networks, n_workers, log_dir):
+    return worker_networks, accumulator
+
+
+def make_workers(sess, envs, networks, n_workers, log_dir,
+                 summary_interval=100, histogram_interval=1000,
+                 async_histograms=True, debug=False, record_rollouts=False,
+                 rollout_shard_size=20000, replay_buffer=None, replay_ratio=0,
+                 prefetch=False, prefetch_depth=1, contention_monitor=None,
+                 env_pool=None, shared_network=False):
+    """
+    If env_pool is given, workers share the envs in the pool rather than
+    each using one env from envs. If envs is None, workers are left without
+    envs, for a driver which collects rollouts itself.
+
+    shared_network should be True if all workers share one network (see
+    make_networks), in which case only the first worker logs summaries.
+    """
     print("Starting {} workers".format(n_workers))
     workers = []
     for worker_n in range(n_workers):
         worker_name = "worker_{}".format(worker_n)
         worker_log_dir = osp.join(log_dir, worker_name)
-        w = Worker(sess=sess, env=envs[worker_n], network=networks[worker_n],
-                   log_dir=worker_log_dir)
+        if debug:
+            debug_dir = osp.join(log_dir, 'debug', worker_name)
+        else:
+            debug_dir = None
+        if record_rollouts:
+            record_dir = osp.join(log_dir, 'rollouts', worker_name)
+        else:
+            record_dir = None
+        if envs is None or env_pool is not None:
+            env = None
+        else:
+            env = envs[worker_n]
+        w = Worker(sess=sess, env=env, network=networks[worker_n],
+                   log_dir=worker_log_dir,
+                   summary_interval=summary_interval,
+                   histogram_interval=histogram_interval,
+                   async_histograms=async_histograms,
+                   debug_dir=debug_dir,
+                   record_dir=record_dir,
+                   record_shard_size=rollout_shard_size,
+                   replay_buffer=replay_buffer,
+                   replay_ratio=replay_ratio,
+                   prefetch=prefetch,
+                   prefetch_depth=prefetch_depth,
+                   contention_monitor=contention_monitor,
+                   env_pool=env_pool,
+                   log_summaries=(worker_n == 0 or not shared_network))
         workers.append(w)
 
     return workers
@@ -75,7 +174,7 @@ def make_lr(lr_args, step_counter):
     return lr
 
 
-def make_optimizer(learning_rate):
+def make_optimizer(learning_rate, use_locking=False):
     # From the paper, Section 4, Asynchronous RL Framework,
     # subsection Optimization:
     # "We investigated three different optimization algorithms in our
@@ -118,56 +217,141 @@ def make_optimizer(learning_rate):
     # close to zero. So my speculation about why baselines uses a much
     # larger epsilon is: sometimes in RL the gradients can end up being
     # very small, and we want to limit the size of the update.
+    #
+    # By default, updates are Hogwild-style: workers' updates to the shared
+    # parameters and statistics can interleave. With use_locking=True, each
+    # variable is locked while it's being updated (though updates to
+    # different variables can still interleave).
+    #
+    # With --optimizer flat_rmsprop, the optimizer is the same, but the
+    # parameters are stored flat (see make_networks), so each update is a
+    # single ApplyRMSProp over all the parameters and their statistics (and
+    # with use_locking=True, the whole update is done under one lock).
 
     optimizer = tf.train.RMSPropOptimizer(learning_rate=learning_rate,
-                                          decay=0.99, epsilon=1e-5)
+                                          decay=0.99, epsilon=1e-5,
+                                          use_locking=use_locking)
     return optimizer
 
 
+def make_env(env_id, env_n, n_envs, seed, debug, preprocess_wrapper,
+             max_n_noops, start_state_pool_size, start_state_refresh_prob,
+             log_dir):
+    # This runs in the env's subprocess. It's a module-level function (bound
+    # to its arguments with functools.partial) rather than a closure so that
+    # it can be pickled for the forkserver and spawn start methods.
+    env = gym.make(env_id)
+    # We calculate the env seed like this so that changing the
+    # global seed completely changes the whole set of env seeds.
+    env_seed = seed * n_envs + env_n
+    env.seed(env_seed)
+    if debug:
+        env = NumberFrames(env)
+    env = preprocess_wrapper(env, max_n_noops)
+    if start_state_pool_size:
+        env = StartStatePoolWrapper(env, start_state_pool_size,
+                                    start_state_refresh_prob)
+
+    if env_n == 0:
+        env_log_dir = osp.join(log_dir, "env_{}".format(env_n))
+    else:
+        env_log_dir = None
+    env = MonitorEnv(env, "Env {}".format(env_n), log_dir=env_log_dir)
+
+    return env
+
+
 def make_envs(env_id, preprocess_wrapper, max_n_noops, n_envs, seed, debug,
-              log_dir):
-    def make_make_env_fn(env_n):
-        def thunk():
-            env = gym.make(env_id)
-            # We calculate the env seed like this so that changing the
-            # global seed completely changes the whole set of env seeds.
-            env_seed = seed * n_envs + env_n
-            env.seed(env_seed)
-            if debug:
-                env = NumberFrames(env)
-            env = preprocess_wrapper(env, max_n_noops)
-
-            if env_n == 0:
-                env_log_dir = osp.join(log_dir, "env_{}".format(env_n))
-            else:
-                env_log_dir = None
-            env = MonitorEnv(env, "Env {}".format(env_n), log_dir=env_log_dir)
-
-            return env
-
-        return thunk
+              log_dir, env_cpu_sets=None, auto_reset=False,
+              start_state_pool_size=0, start_state_refresh_prob=0.0,
+              start_stagger_seconds=0.0, start_method=None):
+    if start_method is None:
+        mp_context = None
+    else:
+        mp_context = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver':
+            # Import everything the envs need (gym, cv2, the wrappers) once
+            # in the fork server rather than in every env process
+            mp_context.set_forkserver_preload(['__main__'])
 
     # ALE /seems/ to be basically thread-safe, as long as environments aren't
     # created at the same time (see
     # https://github.com/mgbellemare/Arcade-Learning-Environment/issues/86).
-    # So we create them serially.
+    # But each env lives in its own process, so we can create them all at
+    # once: we start every process, then collect their handshakes.
+    start_time = time.time()
     envs = []
     for env_n in range(n_envs):
-        env = SubProcessEnv(make_make_env_fn(env_n))
+        if env_cpu_sets is not None:
+            cpus = env_cpu_sets[env_n]
+        else:
+            cpus = None
+        make_env_fn = partial(make_env, env_id, env_n, n_envs, seed, debug,
+                              preprocess_wrapper, max_n_noops,
+                              start_state_pool_size, start_state_refresh_prob,
+                              log_dir)
+        env = SubProcessEnv(make_env_fn, cpus=cpus, auto_reset=auto_reset,
+                            wait=False, mp_context=mp_context)
         envs.append(env)
+        if start_stagger_seconds and env_n != n_envs - 1:
+            time.sleep(start_stagger_seconds)
+    for env in envs:
+        env.wait_ready()
+    print("Started {} envs in {:.1f} seconds".format(
+        n_envs, time.time() - start_time))
     return envs
 
 
+def make_session_config(intra_op_threads, inter_op_threads, main_cpus=None):
+    # If we've been pinned to a set of cores, make TensorFlow's thread pools
+    # fit those cores. (By default TensorFlow sizes its pools based on the
+    # number of cores in the machine, regardless of affinity.)
+    if main_cpus is not None:
+        if intra_op_threads == 0:
+            intra_op_threads = len(main_cpus)
+        if inter_op_threads == 0:
+            inter_op_threads = len(main_cpus)
+    # 0 means let TensorFlow choose
+    config = tf.ConfigProto(intra_op_parallelism_threads=intra_op_threads,
+                            inter_op_parallelism_threads=inter_op_threads)
+    return config
+
+
 def run_worker(worker, n_steps_to_run, steps_per_update, step_counter,
-               update_counter):
+               update_counter, stop_event=None):
     while int(step_counter) < n_steps_to_run:
+        if stop_event is not None and stop_event.is_set():
+            break
         steps_ran = worker.run_update(steps_per_update)
         step_counter.increment(steps_ran)
         update_counter.increment(1)
 
 
+def run_updater(sess, accumulator, stop_event, contention_monitor=None,
+                poll_interval_seconds=1e-3):
+    # Checking whether the accumulators are ready and applying the update
+    # happen in the same session call; we only sleep when there wasn't
+    # anything to apply
+    while not stop_event.is_set():
+        if contention_monitor:
+            with contention_monitor.measure():
+                applied = sess.run(accumulator.apply_if_ready_op)
+        else:
+            applied = sess.run(accumulator.apply_if_ready_op)
+        if not applied:
+            time.sleep(poll_interval_seconds)
+
+
+def start_updater(sess, accumulator, contention_monitor=None):
+    stop_event = Event()
+    thread = Thread(target=run_updater,
+                    args=[sess, accumulator, stop_event, contention_monitor])
+    thread.start()
+    return thread, stop_event
+
+
 def start_workers(n_steps, steps_per_update, step_counter, update_counter,
-                  workers):
+                  workers, stop_event=None):
     worker_threads = []
     for worker in workers:
         thread = Thread(target=lambda:
@@ -175,42 +359,218 @@ def start_workers(n_steps, steps_per_update, step_counter, update_counter,
                    n_steps_to_run=n_steps,
                    steps_per_update=steps_per_update,
                    step_counter=step_counter,
-                   update_counter=update_counter)
+                   update_counter=update_counter,
+                   stop_event=stop_event)
                         )
         thread.start()
         worker_threads.append(thread)
     return worker_threads
 
 
+def start_async_driver(driver, n_steps, steps_per_update, step_counter,
+                       update_counter, stop_event=None):
+    thread = Thread(target=driver.run,
+                    args=[n_steps, steps_per_update, step_counter,
+                          update_counter, stop_event])
+    thread.start()
+    return thread
+
+
+def run_calibration_phase(args, preprocess_wrapper, lr_args, data_format,
+                          n_workers, phase_log_dir):
+    """
+    Train with n_workers for a short while and measure steps per second.
+    Each phase gets a fresh graph, session, envs and workers.
+    """
+    with tf.Graph().as_default():
+        refresh_prob = args.start_state_refresh_prob
+        sess = tf.Session(config=make_session_config(args.intra_op_threads,
+                                                     args.inter_op_threads))
+        envs = make_envs(args.env_id, preprocess_wrapper, args.max_n_noops,
+                         n_workers, args.seed, debug=False,
+                         log_dir=phase_log_dir,
+                         auto_reset=args.env_auto_reset,
+                         start_state_pool_size=args.start_state_pool_size,
+                         start_state_refresh_prob=refresh_prob,
+                         start_stagger_seconds=args.env_start_stagger_seconds,
+                         start_method=args.mp_start_method)
+        step_counter = utils.GraphCounter(sess)
+        update_counter = utils.GraphCounter(sess)
+        optimizer = make_optimizer(lr_args['initial'],
+                                   use_locking=(args.update_mode == 'locking'))
+        flat_params = (args.optimizer == 'flat_rmsprop')
+        networks, _ = make_networks(n_workers=n_workers,
+                                    n_actions=envs[0].action_space.n,
+                                    weight_inits=args.weight_inits,
+                                    value_loss_coef=args.value_loss_coef,
+                                    entropy_bonus=args.entropy_bonus,
+                                    max_grad_norm=args.max_grad_norm,
+                                    optimizer=optimizer,
+                                    data_format=data_format,
+                                    shared=args.shared_worker_graph,
+                                    xla=args.xla,
+                                    flat_params=flat_params)
+        sess.run(tf.global_variables_initializer())
+        workers = make_workers(sess=sess,
+                               envs=envs,
+                               networks=networks,
+                               n_workers=n_workers,
+                               log_dir=phase_log_dir,
+                               summary_interval=args.summary_interval,
+                               histogram_interval=0,
+                               prefetch=args.prefetch_rollouts,
+                               prefetch_depth=args.prefetch_depth,
+                               shared_network=args.shared_worker_graph)
+        stop_event = Event()
+        worker_threads = start_workers(n_steps=float('inf'),
+                                       steps_per_update=args.steps_per_update,
+                                       step_counter=step_counter,
+                                       update_counter=update_counter,
+                                       workers=workers,
+                                       stop_event=stop_event)
+
+        # Let threads get going and envs fill their frame stacks
+        time.sleep(args.calibrate_warmup_seconds)
+        step_rate = utils.RateMeasure()
+        step_rate.reset(int(step_counter))
+        time.sleep(args.calibrate_phase_seconds)
+        steps_per_second = step_rate.measure(int(step_counter))
+
+        stop_event.set()
+        for t in worker_threads:
+            t.join()
+        for worker in workers:
+            worker.close()
+        for env in envs:
+            env.close()
+        sess.close()
+
+    return steps_per_second
+
+
+def calibrate_n_workers(args, preprocess_wrapper, lr_args, data_format,
+                        log_dir):
+    max_workers = args.calibrate_max_workers
+    if max_workers is None:
+        max_workers = len(available_cpus())
+    results = []
+    for n_workers in calibration_worker_counts(max_workers):
+        phase_log_dir = osp.join(log_dir, 'calibration',
+                                 'n_workers_{}'.format(n_workers))
+        steps_per_second = run_calibration_phase(args, preprocess_wrapper,
+                                                 lr_args, data_format,
+                                                 n_workers, phase_log_dir)
+        print("Calibration: {} workers: {:.1f} steps/second".format(
+            n_workers, steps_per_second))
+        results.append((n_workers, steps_per_second))
+
+    n_workers = choose_n_workers(results, args.calibrate_tolerance)
+    path = save_calibration(log_dir, results, n_workers)
+    print("Chose {} workers; results saved to '{}'".format(n_workers, path))
+    return n_workers
+
+
+def print_startup_report(startup_times, graph):
+    times = ', '.join("{} {:.1f} s".format(stage, seconds)
+                      for stage, seconds in startup_times)
+    print("Startup times: {}; graph has {} ops".format(
+        times, len(graph.get_operations())))
+
+
 def main():
     args, lr_args, log_dir, preprocess_wrapper, ckpt_timer = parse_args()
     easy_tf_log.set_dir(log_dir)
 
     utils.set_random_seeds(args.seed)
-    sess = tf.Session()
 
-    envs = make_envs(args.env_id, preprocess_wrapper, args.max_n_noops,
-                     args.n_workers, args.seed, args.debug, log_dir)
+    data_format = choose_data_format(args.conv_data_format)
+    print("Using {} conv data format".format(data_format))
 
+    if args.calibrate_workers:
+        args.n_workers = calibrate_n_workers(args, preprocess_wrapper,
+                                             lr_args, data_format, log_dir)
+    if args.n_envs is None or args.n_envs < args.n_workers:
+        n_envs = args.n_workers
+    else:
+        n_envs = args.n_envs
+
+    if args.pin_cpus:
+        env_cpu_sets, main_cpus = make_cpu_layout(available_cpus(),
+                                                  n_envs=n_envs)
+        print("Pinning envs to CPUs {} and main process to CPUs {}".format(
+            env_cpu_sets, sorted(main_cpus)))
+        # Worker threads and TensorFlow's thread pools are created after
+        # this, so they all inherit the main process's affinity
+        pin_to_cpus(main_cpus)
+    else:
+        env_cpu_sets = main_cpus = None
+    sess = tf.Session(config=make_session_config(args.intra_op_threads,
+                                                 args.inter_op_threads,
+                                                 main_cpus))
+
+    # (name, seconds) for each stage of startup
+    startup_times = []
+    stage_start = time.time()
+    envs = make_envs(args.env_id, preprocess_wrapper, args.max_n_noops,
+                     n_envs, args.seed, args.debug, log_dir,
+                     env_cpu_sets, args.env_auto_reset,
+                     args.start_state_pool_size,
+                     args.start_state_refresh_prob,
+                     args.env_start_stagger_seconds,
+                     args.mp_start_method)
+    startup_times.append(('envs', time.time() - stage_start))
+
+    stage_start = time.time()
     step_counter = utils.GraphCounter(sess)
     update_counter = utils.GraphCounter(sess)
     lr = make_lr(lr_args, step_counter.value)
-    optimizer = make_optimizer(lr)
-
-    networks = make_networks(n_workers=args.n_workers,
-                             n_actions=envs[0].action_space.n,
-                             weight_inits=args.weight_inits,
-                             value_loss_coef=args.value_loss_coef,
-                             entropy_bonus=args.entropy_bonus,
-                             max_grad_norm=args.max_grad_norm,
-                             optimizer=optimizer,
-                             debug=args.debug)
+    optimizer = make_optimizer(lr,
+                               use_locking=(args.update_mode == 'locking'))
+
+    if args.impala:
+        actors, learner, stop_event = make_impala(
+            sess=sess,
+            envs=envs,
+            n_actions=envs[0].action_space.n,
+            weight_inits=args.weight_inits,
+            value_loss_coef=args.value_loss_coef,
+            entropy_bonus=args.entropy_bonus,
+            max_grad_norm=args.max_grad_norm,
+            optimizer=optimizer,
+            batch_size=args.learner_batch_size,
+            queue_size=args.trajectory_queue_size,
+            data_format=data_format,
+            actor_sync_interval=args.actor_sync_interval)
+    else:
+        if args.env_driver == 'asyncio':
+            # All envs share a single worker network
+            n_networks = 1
+        else:
+            n_networks = args.n_workers
+        networks, accumulator = make_networks(
+            n_workers=n_networks,
+            n_actions=envs[0].action_space.n,
+            weight_inits=args.weight_inits,
+            value_loss_coef=args.value_loss_coef,
+            entropy_bonus=args.entropy_bonus,
+            max_grad_norm=args.max_grad_norm,
+            optimizer=optimizer,
+            off_policy=(args.replay_ratio > 0),
+            accumulate_n=args.accumulate_n,
+            max_staleness=args.max_staleness,
+            data_format=data_format,
+            shared=args.shared_worker_graph,
+            xla=args.xla,
+            flat_params=(args.optimizer == 'flat_rmsprop'))
+    startup_times.append(('graph', time.time() - stage_start))
 
     # Why save_relative_paths=True?
     # So that the plain-text 'checkpoint' file written uses relative paths,
     # which seems to be needed in order to avoid confusing saver.restore()
     # when restoring from FloydHub runs.
-    global_vars = tf.trainable_variables('global')
+    # With flat parameters, checkpoints are still saved per parameter, so
+    # that they can be loaded either way (e.g. by run_checkpoint.py)
+    global_vars = checkpoint_variables('global')
     saver = tf.train.Saver(global_vars, max_to_keep=1, save_relative_paths=True)
     checkpoint_dir = osp.join(log_dir, 'checkpoints')
     os.makedirs(checkpoint_dir)
@@ -222,19 +582,94 @@ def main():
         saver.restore(sess, args.load_ckpt)
         print("done!")
     else:
+        stage_start = time.time()
         sess.run(tf.global_variables_initializer())
-
-    workers = make_workers(sess=sess,
-                           envs=envs,
-                           networks=networks,
-                           n_workers=args.n_workers,
-                           log_dir=log_dir)
-
-    worker_threads = start_workers(n_steps=args.n_steps,
-                                   steps_per_update=args.steps_per_update,
-                                   step_counter=step_counter,
-                                   update_counter=update_counter,
-                                   workers=workers)
+        startup_times.append(('init', time.time() - stage_start))
+    print_startup_report(startup_times, sess.graph)
+
+    updater_thread = None
+    contention_monitor = None
+    if args.impala:
+        workers = []
+        worker_threads = start_impala(
+            actors=actors,
+            learner=learner,
+            stop_event=stop_event,
+            n_steps=args.n_steps,
+            steps_per_trajectory=args.steps_per_update,
+            step_counter=step_counter,
+            update_counter=update_counter)
+    else:
+        if args.replay_ratio > 0:
+            # Shared between all workers
+            replay_buffer = ReplayBuffer(
+                capacity=args.replay_capacity,
+                max_rollout_len=args.steps_per_update,
+                state_shape=state_shape(data_format))
+        else:
+            replay_buffer = None
+
+        # Measure whichever session calls actually apply updates to the
+        # global parameters
+        contention_monitor = utils.ContentionMonitor()
+        if accumulator is not None:
+            worker_contention_monitor = None
+        else:
+            worker_contention_monitor = contention_monitor
+
+        if n_envs > args.n_workers and args.env_driver == 'threads':
+            print("Sharing {} envs between {} workers".format(
+                n_envs, args.n_workers))
+            env_pool = EnvPool(envs)
+        else:
+            env_pool = None
+
+        if args.env_driver == 'asyncio':
+            worker_envs = None
+        else:
+            worker_envs = envs
+        workers = make_workers(sess=sess,
+                               envs=worker_envs,
+                               networks=networks,
+                               n_workers=n_networks,
+                               log_dir=log_dir,
+                               summary_interval=args.summary_interval,
+                               histogram_interval=args.histogram_interval,
+                               async_histograms=not args.sync_histograms,
+                               debug=args.debug,
+                               record_rollouts=args.record_rollouts,
+                               rollout_shard_size=args.rollout_shard_size,
+                               replay_buffer=replay_buffer,
+                               replay_ratio=args.replay_ratio,
+                               prefetch=args.prefetch_rollouts,
+                               prefetch_depth=args.prefetch_depth,
+                               contention_monitor=worker_contention_monitor,
+                               env_pool=env_pool,
+                               shared_network=args.shared_worker_graph)
+
+        if accumulator is not None:
+            updater_thread, stop_updater = start_updater(sess, accumulator,
+                                                         contention_monitor)
+        if args.env_driver == 'asyncio':
+            print("Driving {} envs from a single thread".format(n_envs))
+            driver = AsyncEnvDriver(
+                worker=workers[0],
+                envs=envs,
+                batch_size=args.inference_batch_size,
+                batch_timeout_seconds=args.inference_batch_timeout_seconds)
+            worker_threads = [start_async_driver(
+                driver=driver,
+                n_steps=args.n_steps,
+                steps_per_update=args.steps_per_update,
+                step_counter=step_counter,
+                update_counter=update_counter)]
+        else:
+            worker_threads = start_workers(
+                n_steps=args.n_steps,
+                steps_per_update=args.steps_per_update,
+                step_counter=step_counter,
+                update_counter=update_counter,
+                workers=workers)
     ckpt_timer.reset()
     step_rate = utils.RateMeasure()
     step_rate.reset(int(step_counter))
@@ -246,6 +681,11 @@ def main():
         easy_tf_log.tflog('misc/steps', int(step_counter))
         easy_tf_log.tflog('misc/updates', int(update_counter))
         easy_tf_log.tflog('misc/lr', sess.run(lr))
+        if contention_monitor:
+            stats = contention_monitor.get_stats()
+            if stats:
+                for k, v in stats.items():
+                    easy_tf_log.tflog('contention/' + k, v)
 
         alive = [t.is_alive() for t in worker_threads]
 
@@ -257,6 +697,11 @@ def main():
         if not any(alive):
             break
 
+    if updater_thread is not None:
+        stop_updater.set()
+        updater_thread.join()
+    for worker in workers:
+        worker.close()
     for env in envs:
         env.close()
 
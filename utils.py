@@ -4,11 +4,15 @@ import random
 import subprocess
 import time
 from multiprocessing import Queue, Pipe, Process
-from threading import Thread
+from contextlib import contextmanager
+from threading import Thread, Lock
 
 import numpy as np
 import tensorflow as tf
 
+from cpu_affinity import pin_to_cpus
+from param_layout import ParamLayout
+
 
 def rewards_to_discounted_returns(rewards, discount_factor):
     returns = np.zeros_like(rewards, dtype=np.float32)
@@ -69,18 +73,16 @@ def make_copy_ops(from_scope, to_scope):
     Create operations to mirror the values from all trainable variables
     in from_scope to to_scope.
     """
-    from_tvs = tf.get_collection(
-        tf.GraphKeys.TRAINABLE_VARIABLES, scope=from_scope)
-    to_tvs = tf.get_collection(
-        tf.GraphKeys.TRAINABLE_VARIABLES, scope=to_scope)
+    from_layout = ParamLayout.from_scope(from_scope)
+    to_layout = ParamLayout.from_scope(to_scope)
+    if from_layout != to_layout:
+        raise Exception("Variables in '{}' and '{}' don't match".format(
+            from_scope, to_scope))
 
-    from_dict = {var.name: var for var in from_tvs}
-    to_dict = {var.name: var for var in to_tvs}
+    from_dict = from_layout.var_by_name()
     copy_ops = []
-    for to_name, to_var in to_dict.items():
-        from_name = to_name.replace(to_scope, from_scope)
-        from_var = from_dict[from_name]
-        op = to_var.assign(from_var.value())
+    for var_name, to_var in to_layout.var_by_name().items():
+        op = to_var.assign(from_dict[var_name].value())
         copy_ops.append(op)
 
     return copy_ops
@@ -123,13 +125,44 @@ class MemoryProfiler:
 
 def get_git_rev():
     if not osp.exists('.git'):
-        git_rev = "unkrev"
-    else:
+        return "unkrev"
+    # Running git takes a noticeable fraction of a second, so we try to read
+    # the revision from .git ourselves first
+    git_rev = read_git_rev('.git')
+    if git_rev is None:
         git_rev = subprocess.check_output(
             ['git', 'rev-parse', '--short', 'HEAD']).decode().rstrip()
     return git_rev
 
 
+def read_git_rev(git_dir):
+    """
+    Read the (short) hash of HEAD from a .git directory, or return None if
+    it's not somewhere simple (e.g. .git is a worktree link).
+    """
+    head_path = osp.join(git_dir, 'HEAD')
+    if not osp.isfile(head_path):
+        return None
+    with open(head_path) as f:
+        head = f.read().strip()
+    if not head.startswith('ref: '):
+        # Detached HEAD
+        return head[:7]
+    ref = head[len('ref: '):]
+    ref_path = osp.join(git_dir, ref)
+    if osp.isfile(ref_path):
+        with open(ref_path) as f:
+            return f.read().strip()[:7]
+    packed_refs_path = osp.join(git_dir, 'packed-refs')
+    if osp.isfile(packed_refs_path):
+        with open(packed_refs_path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 2 and fields[1] == ref:
+                    return fields[0][:7]
+    return None
+
+
 def set_random_seeds(seed):
     tf.set_random_seed(seed)
     np.random.seed(seed)
@@ -183,31 +216,80 @@ class SubProcessEnv:
     """
     Run a gym environment in a subprocess so that we can avoid GIL and
     run multiple environments asynchronously from a single thread
+
+    With auto_reset=True, the subprocess starts resetting the environment
+    as soon as it's sent back the last step of an episode, so that the reset
+    (which can take dozens of frames, with no-op starts) overlaps with
+    whatever we do next. The following reset() then just returns the first
+    observation of the new episode.
+
+    With wait=False, the constructor returns as soon as the subprocess has
+    started, so that several envs can be created in parallel; call
+    wait_ready() before using the env. mp_context is a multiprocessing
+    context, for using a start method other than the default.
     """
 
     @staticmethod
-    def env_process(pipe, make_env_fn):
+    def env_process(pipe, make_env_fn, cpus, auto_reset):
+        if cpus is not None:
+            pin_to_cpus(cpus)
         env = make_env_fn()
         pipe.send((env.observation_space, env.action_space))
+        reset_obs = None
         while True:
             cmd, data = pipe.recv()
             if cmd == 'step':
                 action = data
                 obs, reward, done, info = env.step(action)
                 pipe.send((obs, reward, done, info))
+                if done and auto_reset:
+                    reset_obs = env.reset()
             elif cmd == 'reset':
-                obs = env.reset()
-                pipe.send(obs)
-
-    def __init__(self, make_env_fn):
+                if reset_obs is None:
+                    reset_obs = env.reset()
+                pipe.send(reset_obs)
+                reset_obs = None
+
+    def __init__(self, make_env_fn, cpus=None, auto_reset=False, wait=True,
+                 mp_context=None):
+        if mp_context is None:
+            process_class = Process
+        else:
+            process_class = mp_context.Process
         p1, p2 = Pipe()
         self.pipe = p1
-        self.proc = Process(target=self.env_process, args=[p2, make_env_fn])
+        self.proc = process_class(target=self.env_process,
+                                  args=[p2, make_env_fn, cpus, auto_reset])
         self.proc.start()
+        # Close our copy of the child's end, so that if the child dies
+        # before the handshake, wait_ready() gets an EOFError rather than
+        # hanging
+        p2.close()
+        self.observation_space = self.action_space = None
+        if wait:
+            self.wait_ready()
+
+    def wait_ready(self):
+        """
+        Wait for the subprocess to finish creating the env.
+        """
         self.observation_space, self.action_space = self.pipe.recv()
 
     def reset(self):
+        self.reset_async()
+        return self.reset_result()
+
+    def reset_async(self):
+        """
+        Start resetting without waiting for the result.
+        Follow up with reset_result().
+        """
         self.pipe.send(('reset', None))
+
+    def reset_ready(self):
+        return self.pipe.poll()
+
+    def reset_result(self):
         return self.pipe.recv()
 
     def step(self, action):
@@ -276,3 +358,110 @@ class RateMeasure:
         self.prev_value = val
 
         return rate
+
+
+class AsyncSummaryRunner:
+    """
+    Run a summary op in a background thread and write the results to a
+    summary writer, so that expensive summaries (e.g. histograms) stay out of
+    a worker's critical path.
+
+    At most one request is kept pending. If the background thread is still
+    busy with the previous request, new requests are dropped rather than
+    queued up.
+
+    Requests should feed every tensor the summary op depends on (e.g. a
+    snapshot of Network.histogram_inputs), so that the summaries don't
+    depend on when the background thread gets to them.
+    """
+
+    def __init__(self, sess, summary_op, summary_writer):
+        self.sess = sess
+        self.summary_op = summary_op
+        self.summary_writer = summary_writer
+        self.requests = queue.Queue(maxsize=1)
+        self.n_dropped = 0
+        self.t = Thread(target=self.run, daemon=True)
+        self.t.start()
+
+    def submit(self, feed_dict, step):
+        try:
+            self.requests.put_nowait((feed_dict, step))
+        except queue.Full:
+            self.n_dropped += 1
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            feed_dict, step = request
+            summaries = self.sess.run(self.summary_op, feed_dict)
+            self.summary_writer.add_summary(summaries, step)
+
+    def close(self):
+        """
+        Finish any pending request, then stop the background thread.
+        """
+        self.requests.put(None)
+        self.t.join()
+        self.summary_writer.flush()
+
+
+class ContentionMonitor:
+    """
+    Measure how long parameter updates take and how often they overlap with
+    updates from other threads.
+
+    Wrap each session call which applies gradients with measure(), then
+    periodically call get_stats(), which returns stats since the last call.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        # Maps ID of each update in progress to whether it's overlapped
+        # with another update so far
+        self.in_flight = {}
+        self.next_id = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.n_updates = 0
+        self.n_overlapped = 0
+        self.latency_sum = 0.0
+        self.max_in_flight = len(self.in_flight)
+
+    @contextmanager
+    def measure(self):
+        with self.lock:
+            update_id = self.next_id
+            self.next_id += 1
+            overlapped = bool(self.in_flight)
+            for other_id in self.in_flight:
+                self.in_flight[other_id] = True
+            self.in_flight[update_id] = overlapped
+            self.max_in_flight = max(self.max_in_flight, len(self.in_flight))
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            latency = time.time() - start_time
+            with self.lock:
+                overlapped = self.in_flight.pop(update_id)
+                self.n_updates += 1
+                self.n_overlapped += int(overlapped)
+                self.latency_sum += latency
+
+    def get_stats(self):
+        with self.lock:
+            if self.n_updates == 0:
+                stats = None
+            else:
+                stats = {
+                    'update_latency_mean': self.latency_sum / self.n_updates,
+                    'update_overlap_fraction':
+                        self.n_overlapped / self.n_updates,
+                    'max_concurrent_updates': self.max_in_flight,
+                }
+            self.reset_stats()
+        return stats
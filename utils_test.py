@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
 
+import glob
+import multiprocessing
+import os
 import random
+import tempfile
 import time
 import unittest
+from threading import Event, Thread
 
 import numpy as np
 import tensorflow as tf
 
 from utils import make_copy_ops, logit_entropy, rewards_to_discounted_returns, \
-    set_random_seeds, Timer
+    set_random_seeds, Timer, ContentionMonitor, SubProcessEnv, \
+    read_git_rev, AsyncSummaryRunner
 
 
 class TestMiscUtils(unittest.TestCase):
@@ -51,6 +57,28 @@ class TestMiscUtils(unittest.TestCase):
         time.sleep(0.2)
         self.assertEqual(timer.done(), True)
 
+    def test_read_git_rev(self):
+        rev = 'e3b0c44298fc1c149afbf4c8996fb92427ae41e4'
+        with tempfile.TemporaryDirectory() as git_dir:
+            def write(path, text):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w') as f:
+                    f.write(text)
+
+            head_path = os.path.join(git_dir, 'HEAD')
+            write(head_path, rev + '\n')
+            self.assertEqual(read_git_rev(git_dir), 'e3b0c44')
+
+            write(head_path, 'ref: refs/heads/master\n')
+            self.assertIsNone(read_git_rev(git_dir))
+            write(os.path.join(git_dir, 'packed-refs'),
+                  '# pack-refs with: peeled\n'
+                  '{} refs/heads/master\n'.format(rev))
+            self.assertEqual(read_git_rev(git_dir), 'e3b0c44')
+            write(os.path.join(git_dir, 'refs', 'heads', 'master'),
+                  rev[::-1] + '\n')
+            self.assertEqual(read_git_rev(git_dir), rev[::-1][:7])
+
     def test_random_seed(self):
         # Note: TensorFlow random seeding doesn't work completely as expected.
         # tf.set_random_seed sets a the graph-level seed in the current graph.
@@ -237,5 +265,158 @@ class TestCopyNetwork(unittest.TestCase):
             np.testing.assert_equal(actual, expected)
 
 
+class SlowResetEnv:
+    """
+    Episodes last 2 steps; observations are the episode number.
+    """
+    observation_space = None
+    action_space = None
+    reset_seconds = 0.5
+
+    def __init__(self):
+        self.episode_n = -1
+        self.step_n = None
+
+    def reset(self):
+        time.sleep(self.reset_seconds)
+        self.episode_n += 1
+        self.step_n = 0
+        return self.episode_n
+
+    def step(self, action):
+        self.step_n += 1
+        return self.episode_n, 0, self.step_n == 2, {}
+
+
+class SlowStartEnv(SlowResetEnv):
+    start_seconds = 0.5
+
+    def __init__(self):
+        time.sleep(self.start_seconds)
+        super().__init__()
+
+
+class TestSubProcessEnv(unittest.TestCase):
+
+    def run_episodes(self, auto_reset):
+        env = SubProcessEnv(SlowResetEnv, auto_reset=auto_reset)
+        self.assertEqual(env.reset(), 0)
+        env.step(0)
+        _, _, done, _ = env.step(0)
+        self.assertTrue(done)
+        # Pretend to train while the env resets
+        time.sleep(SlowResetEnv.reset_seconds)
+        start = time.time()
+        self.assertEqual(env.reset(), 1)
+        reset_time = time.time() - start
+        env.close()
+        return reset_time
+
+    def test_auto_reset(self):
+        reset_time = self.run_episodes(auto_reset=False)
+        self.assertGreater(reset_time, SlowResetEnv.reset_seconds / 2)
+        reset_time = self.run_episodes(auto_reset=True)
+        self.assertLess(reset_time, SlowResetEnv.reset_seconds / 2)
+
+    def test_parallel_start(self):
+        for mp_context in [None, multiprocessing.get_context('forkserver')]:
+            start = time.time()
+            envs = [SubProcessEnv(SlowStartEnv, wait=False,
+                                  mp_context=mp_context)
+                    for _ in range(4)]
+            for env in envs:
+                env.wait_ready()
+            self.assertLess(time.time() - start,
+                            2 * SlowStartEnv.start_seconds)
+            for env in envs:
+                env.close()
+
+
+class TestContentionMonitor(unittest.TestCase):
+
+    def test_no_overlap(self):
+        monitor = ContentionMonitor()
+        self.assertIsNone(monitor.get_stats())
+        for _ in range(3):
+            with monitor.measure():
+                time.sleep(0.01)
+        stats = monitor.get_stats()
+        self.assertGreaterEqual(stats['update_latency_mean'], 0.01)
+        self.assertEqual(stats['update_overlap_fraction'], 0)
+        self.assertEqual(stats['max_concurrent_updates'], 1)
+        # Stats should be reset after each call
+        self.assertIsNone(monitor.get_stats())
+
+    def test_overlap(self):
+        monitor = ContentionMonitor()
+        started = Event()
+        finish = Event()
+
+        def slow_update():
+            with monitor.measure():
+                started.set()
+                finish.wait()
+
+        t = Thread(target=slow_update)
+        t.start()
+        started.wait()
+        # Overlaps with the slow update
+        with monitor.measure():
+            pass
+        finish.set()
+        t.join()
+        # Doesn't overlap with anything
+        with monitor.measure():
+            pass
+
+        stats = monitor.get_stats()
+        # Both the slow update and the one which started during it should
+        # count as overlapped
+        self.assertAlmostEqual(stats['update_overlap_fraction'], 2 / 3)
+        self.assertEqual(stats['max_concurrent_updates'], 2)
+
+
+class TestAsyncSummaryRunner(unittest.TestCase):
+
+    def test_snapshot(self):
+        """
+        Summaries should be computed from the snapshot submitted, not from
+        the current values of the variables, and should all be written by
+        the time the runner is closed.
+        """
+        tf.reset_default_graph()
+        v = tf.Variable([1.0, 2.0, 3.0])
+        histogram = tf.summary.histogram('v', v)
+        inputs = [histogram.op.inputs[1]]
+        sess = tf.Session()
+        sess.run(tf.global_variables_initializer())
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            writer = tf.summary.FileWriter(temp_dir)
+            runner = AsyncSummaryRunner(sess, histogram, writer)
+            for step in range(3):
+                snapshot = dict(zip(inputs, sess.run(inputs)))
+                sess.run(v.assign_add([10.0, 10.0, 10.0]))
+                runner.submit(snapshot, step)
+                # Wait for the request to be picked up so that it isn't
+                # dropped
+                while not runner.requests.empty():
+                    time.sleep(0.01)
+            runner.close()
+            self.assertFalse(runner.t.is_alive())
+            writer.close()
+
+            event_files = glob.glob(os.path.join(temp_dir, 'events.*'))
+            histos = {}
+            for event in tf.train.summary_iterator(event_files[0]):
+                for value in event.summary.value:
+                    histos[event.step] = value.histo
+
+        self.assertEqual(sorted(histos), [0, 1, 2])
+        for step, histo in histos.items():
+            self.assertEqual(histo.min, 1.0 + 10 * step)
+            self.assertEqual(histo.max, 3.0 + 10 * step)
+
+
 if __name__ == '__main__':
     unittest.main()
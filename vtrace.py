@@ -0,0 +1,57 @@
+import numpy as np
+
+"""
+V-trace off-policy correction, from Espeholt et al., 2018,
+'IMPALA: Scalable Distributed Deep-RL with Importance Weighted
+Actor-Learner Architectures', Section 4.
+
+We use this whenever we learn from experience collected by a (slightly)
+different policy than the one we're updating: when replaying old rollouts,
+or when the learner has moved on since an actor generated a trajectory.
+"""
+
+
+def vtrace(behaviour_probs, target_probs, rewards, values, bootstrap_value,
+           discount_factor, clip_rho=1.0, clip_pg_rho=1.0, clip_c=1.0):
+    """
+    Calculate V-trace value targets and policy gradient advantages for a
+    single trajectory.
+
+    behaviour_probs: probability of each action taken under the policy which
+                     generated the trajectory
+    target_probs:    probability of each action taken under the policy being
+                     learned
+    values:          value estimates of each state under the current network
+    bootstrap_value: value estimate of the state after the last step
+                     (0 if the episode ended)
+
+    Returns (vs, pg_advantages):
+    - vs: targets for the value function
+    - pg_advantages: advantages to use in the policy gradient, already
+                     weighted by the (truncated) importance sampling ratio
+    """
+    behaviour_probs = np.asarray(behaviour_probs, dtype=np.float32)
+    target_probs = np.asarray(target_probs, dtype=np.float32)
+    rewards = np.asarray(rewards, dtype=np.float32)
+    values = np.asarray(values, dtype=np.float32)
+
+    rhos = target_probs / behaviour_probs
+    clipped_rhos = np.minimum(clip_rho, rhos)
+    cs = np.minimum(clip_c, rhos)
+
+    values_tp1 = np.append(values[1:], bootstrap_value)
+    deltas = clipped_rhos * (rewards + discount_factor * values_tp1 - values)
+
+    # vs_s - V(x_s) = delta_s + discount * c_s * (vs_{s+1} - V(x_{s+1}))
+    vs_minus_v = np.zeros_like(values)
+    acc = 0.0
+    for t in range(len(values) - 1, -1, -1):
+        acc = deltas[t] + discount_factor * cs[t] * acc
+        vs_minus_v[t] = acc
+    vs = vs_minus_v + values
+
+    vs_tp1 = np.append(vs[1:], bootstrap_value)
+    pg_rhos = np.minimum(clip_pg_rho, rhos)
+    pg_advantages = pg_rhos * (rewards + discount_factor * vs_tp1 - values)
+
+    return vs, pg_advantages
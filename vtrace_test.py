@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import unittest
+
+import numpy as np
+
+from vtrace import vtrace
+
+
+class TestVTrace(unittest.TestCase):
+
+    def test_on_policy(self):
+        """
+        If the behaviour policy is the same as the target policy, V-trace
+        targets should reduce to n-step bootstrapped returns.
+        """
+        rewards = np.array([1., 2., 3.])
+        values = np.array([0.5, 0.2, 0.7])
+        probs = np.array([0.3, 0.6, 0.9])
+        bootstrap_value = 4.0
+        g = 0.9
+        vs, pg_advantages = vtrace(probs, probs, rewards, values,
+                                   bootstrap_value, discount_factor=g)
+        expected_vs = [1 + g * 2 + g ** 2 * 3 + g ** 3 * 4,
+                       2 + g * 3 + g ** 2 * 4,
+                       3 + g * 4]
+        np.testing.assert_allclose(vs, expected_vs, rtol=1e-5)
+        # The policy gradient advantage should be the one-step lookahead
+        # using the V-trace target of the next state
+        expected_advantages = [1 + g * expected_vs[1] - 0.5,
+                               2 + g * expected_vs[2] - 0.2,
+                               3 + g * 4 - 0.7]
+        np.testing.assert_allclose(pg_advantages, expected_advantages,
+                                   rtol=1e-5)
+
+    def test_truncation(self):
+        """
+        If the target policy is much more likely to take the actions than the
+        behaviour policy, importance weights should be clipped to 1, giving
+        the same result as on-policy.
+        """
+        rewards = np.array([1., 2.])
+        values = np.array([0.5, 0.2])
+        vs_on, adv_on = vtrace([0.5, 0.5], [0.5, 0.5], rewards, values,
+                               0.0, discount_factor=0.9)
+        vs_off, adv_off = vtrace([0.1, 0.1], [0.9, 0.9], rewards, values,
+                                 0.0, discount_factor=0.9)
+        np.testing.assert_allclose(vs_on, vs_off, rtol=1e-5)
+        np.testing.assert_allclose(adv_on, adv_off, rtol=1e-5)
+
+    def test_unlikely_actions(self):
+        """
+        If the target policy would never take the actions, the targets
+        should just be the current value estimates.
+        """
+        values = np.array([0.5, 0.2])
+        vs, pg_advantages = vtrace([0.5, 0.5], [0.0, 0.0], [1., 2.], values,
+                                   3.0, discount_factor=0.9)
+        np.testing.assert_allclose(vs, values)
+        np.testing.assert_allclose(pg_advantages, [0., 0.])
+
+
+if __name__ == '__main__':
+    unittest.main()
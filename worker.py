@@ -1,57 +1,274 @@
+import queue
+from threading import Event, Lock, Thread
+
 import easy_tf_log
 import numpy as np
 
 import utils
+from debug_dump import DebugDumper
 from multi_scope_train_op import *
+from network import to_network_layout
 from params import DISCOUNT_FACTOR
+from rollout_recorder import RolloutRecorder
+from vtrace import vtrace
 
 
 class Worker:
 
-    def __init__(self, sess, env, network, log_dir):
+    def __init__(self, sess, env, network, log_dir,
+                 summary_interval=100, histogram_interval=1000,
+                 async_histograms=True, debug_dir=None, record_dir=None,
+                 record_shard_size=20000, replay_buffer=None,
+                 replay_ratio=0, prefetch=False, prefetch_depth=1,
+                 contention_monitor=None, env_pool=None, log_summaries=True):
+        """
+        Give either env, for a worker with its own env, or env_pool, for a
+        worker which takes whichever env in the pool is ready for each
+        rollout. (Or neither, if something else collects rollouts and only
+        calls train_on_rollout; see AsyncEnvDriver.)
+
+        If several workers share a network, only one should log summaries.
+        """
         self.sess = sess
         self.env = env
+        self.env_pool = env_pool
         self.network = network
+        self.summary_interval = summary_interval
+        self.histogram_interval = histogram_interval
 
-        if network.summaries_op is not None:
+        self.histogram_runner = None
+        if network.summaries_op is not None and log_summaries:
             self.summary_writer = tf.summary.FileWriter(log_dir, flush_secs=1)
             self.logger = easy_tf_log.Logger()
             self.logger.set_writer(self.summary_writer.event_writer)
+            if histogram_interval and async_histograms:
+                self.histogram_runner = utils.AsyncSummaryRunner(
+                    sess, network.histograms_op, self.summary_writer)
         else:
             self.summary_writer = None
             self.logger = None
 
+        if debug_dir is not None:
+            self.debug_dumper = DebugDumper(debug_dir)
+        else:
+            self.debug_dumper = None
+
+        if record_dir is not None:
+            self.recorder = RolloutRecorder(record_dir,
+                                            shard_size=record_shard_size)
+        else:
+            self.recorder = None
+
+        if replay_buffer is not None and network.off_policy_train_op is None:
+            raise Exception("Replay requires a network with off_policy=True")
+        self.replay_buffer = replay_buffer
+        self.replay_ratio = replay_ratio
+
+        self.prefetch = prefetch
+        self.prefetch_queue = queue.Queue(maxsize=prefetch_depth)
+        self.prefetch_thread = None
+        self.stop_prefetch = Event()
+        # In prefetch mode, the collector thread syncs the parameters while
+        # the training thread trains with them; this stops the two from
+        # overlapping
+        self.params_lock = Lock()
+
+        self.contention_monitor = contention_monitor
+
         self.updates = 0
-        self.last_state = self.env.reset()
+        self.synced_update_n = None
+        self.last_state = None
         self.episode_values = []
+        if env is not None:
+            self.last_state = self.env.reset()
 
     def run_update(self, n_steps):
-        self.sess.run(self.network.sync_with_global_ops)
+        if self.prefetch:
+            if self.prefetch_thread is None:
+                self.start_prefetch(n_steps)
+            rollout = self.prefetch_queue.get()
+            if isinstance(rollout, Exception):
+                # The collector thread died; see prefetch_loop
+                raise rollout
+            with self.params_lock:
+                self.train_on_rollout(rollout)
+        else:
+            self.sync()
+            rollout = self.collect_rollout(n_steps)
+            self.train_on_rollout(rollout)
+
+        return len(rollout['states'])
+
+    def sync(self):
+        if self.network.update_n is not None:
+            # Remember how many updates the global parameters had had, so
+            # that the accumulator can tell how stale our gradients are
+            _, self.synced_update_n = self.sess.run(
+                [self.network.sync_with_global_ops, self.network.update_n])
+        else:
+            self.sess.run(self.network.sync_with_global_ops)
+
+    def start_prefetch(self, n_steps):
+        self.prefetch_thread = Thread(target=self.prefetch_loop,
+                                      args=[n_steps],
+                                      daemon=True)
+        self.prefetch_thread.start()
 
-        actions, done, rewards, states = self.run_steps(n_steps)
+    def prefetch_loop(self, n_steps):
+        while not self.stop_prefetch.is_set():
+            try:
+                # Only this thread syncs, between rollouts, so that the
+                # parameters never change in the middle of a rollout. The
+                # lock keeps them from changing under a train op that's
+                # computing gradients.
+                with self.params_lock:
+                    self.sync()
+                rollout = self.collect_rollout(n_steps)
+            except Exception as e:
+                # Pass the exception on to the training thread, so that it
+                # doesn't wait forever for a rollout that won't come
+                self.put_prefetched(e)
+                return
+            self.put_prefetched(rollout)
+
+    def put_prefetched(self, item):
+        while not self.stop_prefetch.is_set():
+            try:
+                self.prefetch_queue.put(item, timeout=1)
+                break
+            except queue.Full:
+                pass
+
+    def collect_rollout(self, n_steps):
+        """
+        Run the environment for n_steps (or until the end of the episode)
+        and prepare everything needed for the train op.
+        """
+        if self.env_pool is not None:
+            env_slot = self.env_pool.acquire()
+            self.env = env_slot.env
+            self.last_state = env_slot.last_state
+            self.episode_values = env_slot.episode_values
+
+        actions, done, rewards, states, values, action_probs = \
+            self.run_steps(n_steps)
         returns = self.calculate_returns(done, rewards)
+        if self.recorder:
+            self.recorder.record(states, actions, rewards, returns, values,
+                                 done)
+        if self.replay_buffer is not None:
+            last_state = to_network_layout(self.last_state,
+                                           self.network.data_format)
+            self.replay_buffer.add(states, actions, rewards, action_probs,
+                                   last_state, done)
 
         if done:
-            self.last_state = self.env.reset()
+            # We reset at the start of the next rollout rather than here,
+            # so that if the env resets itself in the background (see
+            # SubProcessEnv's auto_reset), the reset overlaps with training
+            # on this rollout
+            self.last_state = None
             episode_value_sum = sum(self.episode_values)
             episode_value_mean = episode_value_sum / len(self.episode_values)
             if self.logger:
                 self.logger.logkv('rl/episode_value_mean', episode_value_mean)
             self.episode_values = []
 
-        feed_dict = {self.network.s: states,
-                     self.network.a: actions,
-                     self.network.r: returns}
-        self.sess.run(self.network.train_op, feed_dict)
+        if self.env_pool is not None:
+            env_slot.last_state = self.last_state
+            env_slot.episode_values = self.episode_values
+            self.env_pool.release(env_slot)
+
+        # Convert to arrays here rather than leaving it to sess.run so that
+        # in prefetch mode the conversion happens off the training thread
+        return {'states': np.array(states, dtype=np.float32),
+                'actions': np.array(actions),
+                'returns': np.array(returns, dtype=np.float32)}
+
+    def train_on_rollout(self, rollout):
+        feed_dict = {self.network.s: rollout['states'],
+                     self.network.a: rollout['actions'],
+                     self.network.r: rollout['returns']}
+        if self.network.synced_update_n is not None:
+            feed_dict[self.network.synced_update_n] = self.synced_update_n
+        if self.debug_dumper:
+            # Dump exactly what gets fed into the network, for viewing
+            # with show_debug_data.py
+            self.debug_dumper.dump(self.updates,
+                                   observations=rollout['states'],
+                                   actions=rollout['actions'],
+                                   returns=rollout['returns'])
+        # Scalar summaries only depend on things train_op computes anyway,
+        # so we fetch them in the same call
+        fetches = {'train': self.network.train_op}
+        if self.summary_due(self.summary_interval):
+            fetches['summaries'] = self.network.summaries_op
+        if self.summary_due(self.histogram_interval):
+            # Take a snapshot of what the histograms are computed from
+            # in the same call, so that they reflect this update even if
+            # the parameters are synced again before the background runner
+            # gets to them
+            if self.histogram_runner:
+                fetches['histogram_inputs'] = self.network.histogram_inputs
+            else:
+                fetches['histograms'] = self.network.histograms_op
+        if self.contention_monitor:
+            with self.contention_monitor.measure():
+                results = self.sess.run(fetches, feed_dict)
+        else:
+            results = self.sess.run(fetches, feed_dict)
+        if 'summaries' in results:
+            self.summary_writer.add_summary(results['summaries'],
+                                            self.updates)
+        if 'histogram_inputs' in results:
+            snapshot = dict(zip(self.network.histogram_inputs,
+                                results['histogram_inputs']))
+            self.histogram_runner.submit(snapshot, self.updates)
+        if 'histograms' in results:
+            self.summary_writer.add_summary(results['histograms'],
+                                            self.updates)
 
-        if self.summary_writer and \
-                self.updates != 0 and self.updates % 100 == 0:
-            summaries = self.sess.run(self.network.summaries_op, feed_dict)
-            self.summary_writer.add_summary(summaries, self.updates)
+        if self.replay_buffer is not None:
+            self.run_replay_updates()
 
         self.updates += 1
 
-        return len(states)
+    def run_replay_updates(self):
+        # As in ACER, the number of replay updates per on-policy update is
+        # drawn from a Poisson distribution, so that non-integer ratios work
+        n_replays = np.random.poisson(self.replay_ratio)
+        for _ in range(n_replays):
+            rollout = self.replay_buffer.sample()
+            if rollout is None:
+                return
+            self.run_replay_update(rollout)
+
+    def run_replay_update(self, rollout):
+        actions = rollout['actions']
+        all_states = np.concatenate([rollout['states'],
+                                     [rollout['last_state']]])
+        probs, values = self.sess.run(
+            [self.network.a_softmax, self.network.graph_v],
+            feed_dict={self.network.s: all_states})
+        target_probs = probs[np.arange(len(actions)), actions]
+        if rollout['done']:
+            bootstrap_value = 0.0
+        else:
+            bootstrap_value = values[-1]
+        vs, pg_advantages = vtrace(rollout['behaviour_probs'], target_probs,
+                                   rollout['rewards'], values[:-1],
+                                   bootstrap_value, DISCOUNT_FACTOR)
+        feed_dict = {self.network.s: rollout['states'],
+                     self.network.off_policy_a: actions,
+                     self.network.vs: vs,
+                     self.network.pg_advantages: pg_advantages}
+        self.sess.run(self.network.off_policy_train_op, feed_dict)
+
+    def summary_due(self, interval):
+        return (self.summary_writer is not None and
+                interval and
+                self.updates != 0 and
+                self.updates % interval == 0)
 
     def calculate_returns(self, done, rewards):
         if done:
@@ -61,24 +278,31 @@ class Worker:
             # If we're ending in a non-terminal state, in order to calculate
             # returns, we need to know the return of the final state.
             # We estimate this using the value network.
-            s = np.moveaxis(self.last_state, source=0, destination=-1)
+            s = to_network_layout(self.last_state, self.network.data_format)
             feed_dict = {self.network.s: [s]}
             last_value = self.sess.run(self.network.graph_v,
                                        feed_dict=feed_dict)[0]
-            rewards += [last_value]
+            # (Not +=, so that we don't modify the caller's list of rewards)
+            rewards = rewards + [last_value]
             returns = utils.rewards_to_discounted_returns(rewards,
                                                           DISCOUNT_FACTOR)
             returns = returns[:-1]  # Chop off last_value
         return returns
 
     def run_steps(self, n_steps):
-        # States, action taken in each state, and reward from that action
+        # States, action taken in each state, reward from that action,
+        # value estimate of each state, and probability of the action taken
         states = []
         actions = []
         rewards = []
+        values = []
+        action_probs_taken = []
+
+        if self.last_state is None:
+            self.last_state = self.env.reset()
 
         for _ in range(n_steps):
-            s = np.moveaxis(self.last_state, source=0, destination=-1)
+            s = to_network_layout(self.last_state, self.network.data_format)
             states.append(s)
             feed_dict = {self.network.s: [s]}
             [action_probs], [value_estimate] = \
@@ -87,6 +311,8 @@ class Worker:
 
             a = np.random.choice(self.env.action_space.n, p=action_probs)
             actions.append(a)
+            action_probs_taken.append(action_probs[a])
+            values.append(value_estimate)
             self.episode_values.append(value_estimate)
 
             self.last_state, r, done, _ = self.env.step(a)
@@ -95,4 +321,15 @@ class Worker:
             if done:
                 break
 
-        return actions, done, rewards, states
+        return actions, done, rewards, states, values, action_probs_taken
+
+    def close(self):
+        self.stop_prefetch.set()
+        if self.prefetch_thread:
+            self.prefetch_thread.join()
+        if self.debug_dumper:
+            self.debug_dumper.close()
+        if self.recorder:
+            self.recorder.close()
+        if self.histogram_runner:
+            self.histogram_runner.close()
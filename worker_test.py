@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import threading
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from network import Network, make_inference_network
+from worker import Worker
+
+
+class DummyActionSpace:
+    n = 6
+
+
+class DummyEnv:
+    """
+    Returns random frame stacks, ending episodes after 7 steps.
+    """
+    observation_space = None
+    action_space = DummyActionSpace()
+
+    def __init__(self):
+        self.n_steps = None
+
+    def reset(self):
+        self.n_steps = 0
+        return np.random.rand(4, 84, 84)
+
+    def step(self, action):
+        self.n_steps += 1
+        done = (self.n_steps == 7)
+        return np.random.rand(4, 84, 84), 1.0, done, None
+
+
+class BrokenEnv(DummyEnv):
+    """
+    Fails on the third step, e.g. as if its subprocess had died.
+    """
+
+    def step(self, action):
+        if self.n_steps == 2:
+            raise EOFError
+        return super().step(action)
+
+
+def make_worker(env=None, **worker_kwargs):
+    tf.reset_default_graph()
+    sess = tf.Session()
+    optimizer = tf.train.RMSPropOptimizer(learning_rate=1e-3)
+    with tf.variable_scope('global'):
+        make_inference_network(n_actions=6, weight_inits='glorot')
+    network = Network(scope='worker_0',
+                      n_actions=6,
+                      entropy_bonus=0.01,
+                      value_loss_coef=0.5,
+                      weight_inits='glorot',
+                      max_grad_norm=0.5,
+                      optimizer=optimizer,
+                      summaries=False)
+    if env is None:
+        env = DummyEnv()
+    worker = Worker(sess=sess, env=env, network=network,
+                    log_dir='/tmp', **worker_kwargs)
+    sess.run(tf.global_variables_initializer())
+    return sess, worker
+
+
+class TestWorker(unittest.TestCase):
+
+    def check_updates(self, sess, worker):
+        global_vars = tf.trainable_variables('global')
+        vars_before = sess.run(global_vars)
+        # Rollouts should be cut short at the end of each 7-step episode
+        steps = [worker.run_update(n_steps=5) for _ in range(4)]
+        self.assertEqual(steps, [5, 2, 5, 2])
+        self.assertEqual(worker.updates, 4)
+        vars_after = sess.run(global_vars)
+        for before, after in zip(vars_before, vars_after):
+            self.assertFalse(np.array_equal(before, after))
+
+    def test_run_update(self):
+        sess, worker = make_worker()
+        self.check_updates(sess, worker)
+        worker.close()
+
+    def test_prefetch(self):
+        sess, worker = make_worker(prefetch=True, prefetch_depth=2)
+        self.check_updates(sess, worker)
+        worker.close()
+
+    def test_prefetch_sync_thread(self):
+        """
+        In prefetch mode, parameters should only be synced by the collector
+        thread, so that they never change in the middle of a rollout.
+        """
+        sess, worker = make_worker(prefetch=True)
+        sync_threads = []
+        sync = worker.sync
+
+        def record_sync():
+            sync_threads.append(threading.current_thread())
+            sync()
+
+        worker.sync = record_sync
+        for _ in range(3):
+            worker.run_update(n_steps=5)
+        worker.close()
+        self.assertGreaterEqual(len(sync_threads), 3)
+        for thread in sync_threads:
+            self.assertIs(thread, worker.prefetch_thread)
+
+    def test_prefetch_error(self):
+        """
+        If collecting a rollout fails, the error should be raised on the
+        training thread rather than leaving it waiting for rollouts.
+        """
+        sess, worker = make_worker(env=BrokenEnv(), prefetch=True)
+        with self.assertRaises(EOFError):
+            worker.run_update(n_steps=5)
+        worker.close()
+        self.assertFalse(worker.prefetch_thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()